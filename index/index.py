@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 import base64
+import bisect
+import collections
 import concurrent.futures
 import fcntl
 import fnmatch
 import gc
 import hashlib
+import http.client
 import io
+import itertools
 import json
 import math
 import os
@@ -14,11 +18,13 @@ import pprint
 import random
 import re
 import shutil
+import signal
 import socket
 import sqlite3
 import statistics
 import struct
 import subprocess
+import sys
 import tempfile
 import threading
 import time
@@ -208,6 +214,22 @@ def log_vram(label: str) -> None:
     )
 
 
+# The allocator's (allocated, reserved) peaks from before the last
+# reset_batch_vram_peak, so per-batch measurement keeps the run's high-water mark.
+_EARLIER_VRAM_PEAK_BYTES = (0, 0)
+
+
+def reset_batch_vram_peak() -> None:
+    """Restart the allocator's peaks so one batch's working memory can be read."""
+    global _EARLIER_VRAM_PEAK_BYTES
+    allocated, reserved = _EARLIER_VRAM_PEAK_BYTES
+    _EARLIER_VRAM_PEAK_BYTES = (
+        max(allocated, torch.cuda.max_memory_allocated()),
+        max(reserved, torch.cuda.max_memory_reserved()),
+    )
+    torch.cuda.reset_peak_memory_stats()
+
+
 def log_vram_peak() -> None:
     """Report the high-water mark of this run's GPU allocation across all phases.
 
@@ -215,9 +237,11 @@ def log_vram_peak() -> None:
     activations can briefly dwarf the resident model weights."""
     if not torch.cuda.is_available():
         return
+    allocated = max(torch.cuda.max_memory_allocated(), _EARLIER_VRAM_PEAK_BYTES[0])
+    reserved = max(torch.cuda.max_memory_reserved(), _EARLIER_VRAM_PEAK_BYTES[1])
     log(
-        f"Peak VRAM this run: {torch.cuda.max_memory_allocated() / 1e9:.2f} GB tensors / "
-        f"{torch.cuda.max_memory_reserved() / 1e9:.2f} GB reserved"
+        f"Peak VRAM this run: {allocated / 1e9:.2f} GB tensors / "
+        f"{reserved / 1e9:.2f} GB reserved"
     )
 
 
@@ -286,6 +310,62 @@ def predict_caption_batch_resilient(
         return left_results + right_results, left_metrics + right_metrics
 
 
+class AdaptiveCaptionBatchSize:
+    """Chooses each caption batch's size from the VRAM the last one left.
+
+    A fixed size is either conservative on a quiet card or one OOM bisection
+    away on a busy one. Each batch's working memory is measured as its peak
+    allocation above the resident model, and the largest per-image cost seen is
+    kept. The next size is the largest whose working memory still leaves
+    ``target_free_gb`` of ``effective_free_vram_gb`` free. Growth is one image
+    at a time, so the cost estimate is re-measured at every new size. Shrinking
+    is immediate, before the card is tight enough to OOM. An OOM anyway halves
+    the size and caps it below the size that failed. Without CUDA there is no
+    signal, and the size holds."""
+
+    def __init__(
+        self,
+        maximum: int | None = None,
+        initial: int = 1,
+        target_free_gb: float | None = None,
+    ):
+        self.maximum = max(1, maximum or CAPTION_ADAPTIVE_MAX_BATCH_SIZE)
+        self.size = min(max(1, initial), self.maximum)
+        self.target_free_gb = (
+            CAPTION_ADAPTIVE_TARGET_FREE_VRAM_GB
+            if target_free_gb is None
+            else target_free_gb
+        )
+        self.per_image_gb: float | None = None
+        self._resident_bytes: int | None = None
+
+    def start_batch(self) -> None:
+        if not torch.cuda.is_available():
+            self._resident_bytes = None
+            return
+        reset_batch_vram_peak()
+        self._resident_bytes = torch.cuda.memory_allocated()
+
+    def finish_batch(self, batch_size: int, free_gb: float, oom: bool) -> int:
+        """Record how the batch went and return the size for the next one."""
+        if self._resident_bytes is not None and not oom and batch_size:
+            working = torch.cuda.max_memory_allocated() - self._resident_bytes
+            self.per_image_gb = max(
+                self.per_image_gb or 0.0, working / 1e9 / batch_size
+            )
+        self.observe(batch_size, free_gb, oom)
+        return self.size
+
+    def observe(self, batch_size: int, free_gb: float, oom: bool) -> None:
+        if oom:
+            self.maximum = max(1, batch_size - 1)
+            self.size = max(1, min(self.maximum, batch_size // 2))
+        elif math.isfinite(free_gb) and self.per_image_gb:
+            spare_gb = free_gb - self.target_free_gb
+            fits = max(1, math.floor(spare_gb / self.per_image_gb))
+            self.size = max(1, min(self.maximum, fits, batch_size + 1))
+
+
 def cache_tokenizer_vocab(tokenizer: typing.Any) -> None:
     """Resolve the tokenizer's vocabulary once instead of on every lookup.
 
@@ -323,8 +403,17 @@ def effective_free_vram_gb() -> float:
     return (free + reusable) / 1e9
 
 
-def enforce_vram_headroom(label: str) -> float:
-    """Warn on low post-batch headroom and stop before the card is exhausted."""
+def enforce_vram_headroom(
+    label: str,
+    pause_deadline_seconds: float | None = None,
+    pauses: list[float] | None = None,
+) -> float:
+    """Warn on low post-batch headroom and stop before the card is exhausted.
+
+    With ``pause_deadline_seconds`` the run waits for the card instead of
+    stopping (see ``wait_for_vram_headroom``), appending each pause's length to
+    ``pauses``.
+    """
     if not torch.cuda.is_available():
         return math.inf
     free_gb = effective_free_vram_gb()
@@ -341,6 +430,10 @@ def enforce_vram_headroom(label: str) -> float:
         torch.cuda.empty_cache()
         free_gb = effective_free_vram_gb()
         if free_gb < CAPTION_MIN_FREE_VRAM_GB:
+            if pause_deadline_seconds is not None:
+                return wait_for_vram_headroom(
+                    label, free_gb, pause_deadline_seconds, pauses
+                )
             raise click.ClickException(
                 f"Only {free_gb:.2f} GB VRAM remains after {label}; "
                 "stopping with completed batches preserved"
@@ -348,11 +441,60 @@ def enforce_vram_headroom(label: str) -> float:
     return free_gb
 
 
+def wait_for_vram_headroom(
+    label: str,
+    free_gb: float,
+    deadline_seconds: float,
+    pauses: list[float] | None = None,
+) -> float:
+    """Hold the loop, model resident, until another process gives the card back.
+
+    Stopping on an oversubscribed card throws away the model load and the run's
+    place, and on a shared workstation the usual culprit is a short daytime GPU
+    job that is gone within minutes. Polling backs off from
+    ``VRAM_PAUSE_POLL_SECONDS`` to ``VRAM_PAUSE_MAX_POLL_SECONDS`` and resumes
+    only once headroom is back above the warning threshold, so a card hovering
+    at the stop threshold does not pause again after the very next batch. Past
+    the deadline it stops exactly as the guard always did.
+    """
+    log(
+        f"Pausing after {label}: only {free_gb:.2f} GB VRAM free; waiting up to "
+        f"{deadline_seconds:.0f}s for {VRAM_PAUSE_RESUME_FREE_GB:.2f} GB"
+    )
+    started_at = time.monotonic()
+    interval = VRAM_PAUSE_POLL_SECONDS
+    try:
+        while True:
+            waited = time.monotonic() - started_at
+            if waited >= deadline_seconds:
+                raise click.ClickException(
+                    f"Only {free_gb:.2f} GB VRAM remains {waited:.0f}s after "
+                    f"{label}; stopping with completed batches preserved"
+                )
+            time.sleep(min(interval, deadline_seconds - waited))
+            interval = min(interval * 2, VRAM_PAUSE_MAX_POLL_SECONDS)
+            torch.cuda.empty_cache()
+            free_gb = effective_free_vram_gb()
+            if free_gb >= VRAM_PAUSE_RESUME_FREE_GB:
+                log(
+                    f"Resuming after {time.monotonic() - started_at:.0f}s paused: "
+                    f"{free_gb:.2f} GB VRAM free"
+                )
+                return free_gb
+    finally:
+        if pauses is not None:
+            pauses.append(time.monotonic() - started_at)
+
+
 MODEL_PROFILE_CAPTIONS = "captions"
 MODEL_PROFILE_SIGLIP2 = "siglip2"
 MODEL_PROFILE_HYBRID = "hybrid"
 CLASSIFIER_BACKEND_GEMMA4 = "gemma4"
 CLASSIFIER_BACKEND_GEMMA4_GGUF = "gemma4-gguf"
+# Model-free backends for benchmark-pipeline; never offered on the index CLI.
+CLASSIFIER_BACKEND_STUB = "stub"
+EMBEDDER_BACKEND_SIGLIP = "siglip"
+EMBEDDER_BACKEND_STUB = "stub"
 DEFAULT_GEMMA4_MODEL_ID = "google/gemma-4-E2B-it"
 DEFAULT_GEMMA4_QUANTIZATION = None
 DEFAULT_GEMMA4_BATCH_SIZE = 1
@@ -363,10 +505,22 @@ DEFAULT_GEMMA4_GGUF_BATCH_SIZE = 1
 DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS = 256
 DEFAULT_GEMMA4_GGUF_IMAGE_MIN_TOKENS = 70
 DEFAULT_GEMMA4_GGUF_IMAGE_MAX_TOKENS = 140
+# --classifier-image-tokens: the most tokens llama-server may encode an image to,
+# from at least DEFAULT_GEMMA4_GGUF_IMAGE_MIN_TOKENS. Unset, the mmproj keeps its
+# own budget, which every caption before these tiers was generated under.
+GEMMA4_GGUF_IMAGE_TOKEN_TIERS = (70, 140, 280, 560)
 DEFAULT_GEMMA4_GGUF_THREADS = 8
 DEFAULT_GEMMA4_GGUF_CTX_SIZE = 32768
+DEFAULT_GEMMA4_GGUF_PARALLEL = 1
+# llama-server splits --ctx-size evenly between --parallel slots. One caption
+# request is at most ~140 image tokens, the prompt and 256 output tokens, so
+# each concurrent slot is given this much rather than a share of 32768.
+GEMMA4_GGUF_SLOT_CTX_SIZE = 4096
 GEMMA4_GGUF_IMAGE_MAX_EDGE = 1024
+CAPTION_DERIVATIVE_SPEC = f"jpeg-q80-edge{GEMMA4_GGUF_IMAGE_MAX_EDGE}-transposed"
 DEFAULT_GEMMA4_GGUF_SERVER_STARTUP_SECONDS = 180.0
+CAPTION_SERVER_IDLE_MINUTES = 30
+CAPTION_SERVER_WATCH_INTERVAL_SECONDS = 15.0
 DEFAULT_GEMMA4_GGUF_REQUEST_TIMEOUT = 300.0
 LLAMA_SERVER_ENV = "LLAMA_SERVER"
 # Discovery paths must outlive a reboot: a /tmp build silently disappears and
@@ -385,8 +539,27 @@ CAPTION_BATCH_MAX_NEW_TOKENS = 128
 # batch size against, not a runtime default. Changing the number rewrites every
 # caption version string and restamps the entire archive as stale.
 CAPTION_VERSION_BASELINE_BATCH_SIZE = 4
+# --classifier-reuse-near-duplicates copies a caption to a photo taken within this
+# many seconds of an already-captioned one whose 64-bit difference hash is within
+# this many bits of it: a burst frame, a bracket or a lightly edited re-export.
+CAPTION_REUSE_WINDOW_SECONDS = 10.0
+CAPTION_REUSE_MAX_DISTANCE = 6
+# Appended to the caption version of a copied caption, with the donor's pixel
+# digest, so reused captions stay distinguishable from generated ones.
+CAPTION_REUSE_MARKER = ":reusedFrom="
 CAPTION_WARN_FREE_VRAM_GB = 0.75
 CAPTION_MIN_FREE_VRAM_GB = 0.25
+# --vram-pause-minutes: a paused run polls for the card back every 5s, backing
+# off to once a minute, and resumes once headroom clears the warning threshold.
+VRAM_PAUSE_POLL_SECONDS = 5.0
+VRAM_PAUSE_MAX_POLL_SECONDS = 60.0
+VRAM_PAUSE_RESUME_FREE_GB = CAPTION_WARN_FREE_VRAM_GB
+# --classifier-adaptive-batch grows batches only while this much effective free
+# VRAM would remain beside the next batch's working memory: well clear of the
+# 0.75 GB warning, so the controller backs off before enforce_vram_headroom or
+# an OOM bisection has to.
+CAPTION_ADAPTIVE_TARGET_FREE_VRAM_GB = 2.0
+CAPTION_ADAPTIVE_MAX_BATCH_SIZE = 8
 MAX_CLASSIFIER_TAGS = 10
 MAX_CLASSIFIER_TAG_WORDS = 4
 MAX_CLASSIFIER_TAG_LENGTH = 60
@@ -394,11 +567,60 @@ MAX_CLASSIFIER_ALT_TEXT_WORDS = 35
 MAX_CLASSIFIER_ALT_TEXT_LENGTH = 320
 GEMMA4_MAX_NEW_TOKENS = 192
 EMBEDDER_BATCH_SIZE = 16
+# Batches decoded ahead of the one on the device. Each prepared batch of 16 is
+# ~10MB of 224px tensors, so two cost nothing next to the decode they hide.
+EMBEDDER_PREFETCH_DEPTH = 2
+# Draft decoding stops at twice the processor's input size, so its final resize
+# still averages over several source pixels rather than point-sampling them.
+EMBEDDER_DRAFT_OVERSAMPLE = 2
+EMBEDDER_DRAFT_CALIBRATION_SIZE = 48
+# The tolerance encode_embedding's int8 storage is already held to.
+EMBEDDER_DRAFT_MIN_NEIGHBOUR_OVERLAP = 0.98
+NEIGHBOUR_OVERLAP_K = 10
 COLORTHIEF_WORKERS = 4
 # Comparison-tooling defaults only; the published palette is full-resolution.
 COLOUR_THUMBNAIL_MAX_DIMENSION = 512
 COLOUR_THUMBNAIL_QUALITY = 10
 FILE_HASH_WORKERS = 8
+EMBEDDER_DECODE_WORKERS = 4
+# Widths of the process-wide executor lanes (see SharedExecutors): hashing and
+# stats are I/O-bound, model-input decodes and colour extraction CPU-bound.
+EXECUTOR_LANE_WORKERS = {
+    "io": FILE_HASH_WORKERS,
+    "decode": EMBEDDER_DECODE_WORKERS,
+    "cpu": COLORTHIEF_WORKERS,
+}
+# Relative core shares of the stages that can run at the same time: a model
+# pass (caption or embedding, never both) alongside background colour work.
+# See CoreBudget.
+CORE_WEIGHTS = {"caption": 3, "embedding": 3, "colour": 1}
+# Off by default: a full index holds far more than any sensible budget, and the
+# passes walk the work list in the same order, so the benefit is to incremental
+# runs whose changed photos fit. See SourceByteCache.
+SOURCE_BYTE_CACHE_MB = 0
+# ~0.5MB per photo (one caption JPEG, one raw 224px image per embedder), so this
+# keeps roughly the newest 8k photos' derivatives.
+DERIVATIVE_CACHE_MB = 4096
+DERIVATIVE_CACHE_FILENAME = ".derivatives.sqlite"
+# Sidecar beside the index database, shared by the working and staging copies
+# (the stat tuple it is keyed on says nothing about which database asked).
+DIGEST_CACHE_FILENAME = ".content-digests.sqlite"
+# Written by `caption-token-budget --apply`, read by --classifier-learned-token-budget.
+CAPTION_TOKEN_BUDGET_FILENAME = ".caption-token-budget.json"
+CAPTION_TOKEN_BUDGET_PERCENTILE = 95.0
+# Passing benchmark-caption-quality runs, keyed by model and image-token tier.
+# index refuses --classifier-image-tokens without one, so a cheaper tier is only
+# adopted once it has passed the fixture. Beside index.py, like the run stats,
+# so it does not depend on the directory either command is run from.
+CAPTION_QUALITY_GATES_PATH = str(
+    Path(__file__).with_name(".caption-quality-gates.json")
+)
+# Candidate outputs of compare-captioners and benchmark-caption-quality, kept in
+# the working directory beside their reports. See CaptionResultCache.
+CAPTION_RESULT_CACHE_FILENAME = ".caption-results.sqlite"
+# Both backends decode greedily (do_sample=False, temperature 0); recorded in the
+# result cache key so a sampled candidate could never be served a greedy one.
+CAPTION_DECODING = "greedy"
 INSERT_CHUNK_SIZE = 64
 # --- Video and external media -------------------------------------------------
 #
@@ -446,6 +668,619 @@ def configured_media_root(media_root: str):
         _MEDIA_ROOT = previous
 
 
+class SourceByteCache:
+    """Whole source files held in memory, so a run reads each from disk once.
+
+    Without it one photo is read by the digest pass, again for EXIF, again by
+    the colour extractor, and once more by each model pass that decodes it —
+    five or six reads of a ~15MB file, which on a cold page cache or a NAS mount
+    is most of the I/O in a run. The same bytes are handed to every reader
+    instead, bounded by ``max_bytes`` with least-recently-used eviction.
+
+    Once the work list is known, ``retain`` narrows the cache to those sources:
+    planning hashes changed files only, which are the likely work items, but any
+    that turn out to need nothing should not hold memory through the GPU passes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: dict[str, bytes] = {}
+        self.size = 0
+        self.admitted: set[str] | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def read(self, path: str) -> bytes:
+        with self.lock:
+            data = self.entries.pop(path, None)
+            if data is not None:
+                # Re-inserting moves it to the most-recently-used end.
+                self.entries[path] = data
+                self.hits += 1
+                return data
+            self.misses += 1
+        with open(path, "rb") as fh:
+            data = fh.read()
+        self._admit(path, data)
+        return data
+
+    def _admit(self, path: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if self.admitted is not None and path not in self.admitted:
+                return
+            if path in self.entries:
+                return
+            while self.entries and self.size + len(data) > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.size -= len(self.entries.pop(oldest))
+                self.evictions += 1
+            self.entries[path] = data
+            self.size += len(data)
+
+    def retain(self, paths: typing.Iterable[str]) -> None:
+        """Admit only ``paths`` from now on, dropping anything else held."""
+        with self.lock:
+            self.admitted = set(paths)
+            for path in [path for path in self.entries if path not in self.admitted]:
+                self.size -= len(self.entries.pop(path))
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "maxBytes": self.max_bytes,
+                "heldBytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide for the same reason as _MEDIA_ROOT: every pixel read happens
+# somewhere that only sees a path.
+_SOURCE_BYTES: SourceByteCache | None = None
+
+
+def set_source_byte_cache(cache: SourceByteCache | None) -> None:
+    global _SOURCE_BYTES
+    _SOURCE_BYTES = cache
+
+
+def read_source_bytes(path: str) -> bytes:
+    """The bytes of ``path``, through the source byte cache when one is set."""
+    if _SOURCE_BYTES is not None:
+        return _SOURCE_BYTES.read(path)
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def open_source(path: str) -> IO[bytes]:
+    """A binary handle on ``path``; an in-memory one when the cache is set."""
+    if _SOURCE_BYTES is not None:
+        return io.BytesIO(_SOURCE_BYTES.read(path))
+    return open(path, "rb")
+
+
+def source_image_input(path: str) -> str | io.BytesIO:
+    """What to hand ``Image.open`` or ``fast_colorthief`` for ``path``.
+
+    The path itself when no cache is set, so decoding is exactly as before."""
+    if _SOURCE_BYTES is not None:
+        return io.BytesIO(_SOURCE_BYTES.read(path))
+    return path
+
+
+def available_cores() -> int:
+    """Cores this process may run on: its affinity mask, not the machine's count."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ExecutorLane:
+    """One named thread pool of the shared executors, with its own counters.
+
+    ``workers`` bounds how much of the lane's work runs at once and can be moved
+    with ``resize`` while work is queued; the pool underneath is sized to the
+    process's cores so a lane can grow into them. ``queued`` is work submitted
+    but not yet running (the lane's depth), ``running`` work holding a slot
+    now. ``utilisation`` is busy thread-time over the lane's thread-time since
+    it was created."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = max(self.workers, available_cores())
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.capacity, thread_name_prefix=f"lane-{name}"
+        )
+        self.lock = threading.Condition()
+        self.created_at = time.perf_counter()
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.busy_s = 0.0
+
+    def _run(self, function, args, kwargs):
+        with self.lock:
+            while self.running >= self.workers:
+                self.lock.wait()
+            self.running += 1
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.busy_s += time.perf_counter() - started_at
+                self.lock.notify()
+
+    def resize(self, workers: int) -> None:
+        """Run at most ``workers`` items at once from now on.
+
+        Shrinking never interrupts running work; the lane just starts nothing
+        new until it is under the new width."""
+        with self.lock:
+            self.workers = max(1, min(workers, self.capacity))
+            self.lock.notify_all()
+
+    def _queued(self) -> int:
+        return self.submitted - self.completed - self.cancelled - self.running
+
+    def _count_cancelled(self, future: concurrent.futures.Future) -> None:
+        if future.cancelled():
+            with self.lock:
+                self.cancelled += 1
+
+    def submit(self, function, *args, **kwargs) -> concurrent.futures.Future:
+        with self.lock:
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self._queued())
+        future = self.executor.submit(self._run, function, args, kwargs)
+        future.add_done_callback(self._count_cancelled)
+        return future
+
+    def map(self, function, items: typing.Iterable) -> list:
+        """``[function(item) for item in items]``, run on the lane, in order.
+
+        Work not yet started is cancelled if any item raises or the caller is
+        interrupted, so an aborted batch does not keep the lane busy."""
+        futures = [self.submit(function, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stats(self) -> dict[str, typing.Any]:
+        with self.lock:
+            elapsed = time.perf_counter() - self.created_at
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "running": self.running,
+                "queued": self._queued(),
+                "peakQueued": self.peak_queued,
+                "busyMs": round(self.busy_s * 1000, 2),
+                "utilisation": (
+                    round(self.busy_s / (self.workers * elapsed), 3) if elapsed else 0.0
+                ),
+            }
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=cancel_futures)
+
+
+class CoreBudget:
+    """Splits the cores this process may run on between the stages running now.
+
+    llama-server's threads, torch's intra-op threads, the decode lane and the
+    colour lane were each sized as if they had the machine alone, so on an
+    8-core host a caption pass and background colour extraction fought over
+    far more runnable threads than cores. A stage ``claim``s a weight when it
+    starts and ``release``s it when it ends; every claimed stage gets
+    ``cores * weight / total weight`` (at least one), and every registered
+    ``apply`` callback is re-run with its stage's new share whenever the set of
+    stages changes. I/O-bound work (hashing) is deliberately outside the
+    budget: its threads mostly wait on the disk."""
+
+    def __init__(self, cores: int):
+        self.cores = max(1, cores)
+        self.lock = threading.Lock()
+        self.weights: dict[str, int] = {}
+        self.appliers: dict[str, typing.Callable[[int], None]] = {}
+        self.history: list[dict[str, typing.Any]] = []
+
+    def _shares(self) -> dict[str, int]:
+        total = sum(self.weights.values())
+        return {
+            stage: max(1, self.cores * weight // total)
+            for stage, weight in self.weights.items()
+        }
+
+    def _rebalance(self, event: str) -> dict[str, int]:
+        with self.lock:
+            shares = self._shares()
+            appliers = dict(self.appliers)
+            self.history.append({"event": event, "shares": shares})
+        # Outside the lock: an applier may resize a lane whose workers are
+        # themselves releasing a stage.
+        for stage, apply in appliers.items():
+            apply(shares[stage])
+        return shares
+
+    def claim(
+        self,
+        stage: str,
+        weight: int,
+        apply: typing.Callable[[int], None] | None = None,
+    ) -> int:
+        with self.lock:
+            self.weights[stage] = weight
+            if apply is not None:
+                self.appliers[stage] = apply
+        return self._rebalance(f"claim {stage}")[stage]
+
+    def release(self, stage: str) -> None:
+        with self.lock:
+            if stage not in self.weights:
+                return
+            del self.weights[stage]
+            self.appliers.pop(stage, None)
+        self._rebalance(f"release {stage}")
+
+    def share(self, stage: str) -> int | None:
+        with self.lock:
+            return self._shares().get(stage)
+
+    def stats(self) -> dict[str, typing.Any]:
+        with self.lock:
+            return {"cores": self.cores, "history": list(self.history)}
+
+
+_CORE_BUDGET: CoreBudget | None = None
+_DEFAULT_TORCH_THREADS: int | None = None
+
+
+def set_core_budget(budget: CoreBudget | None) -> None:
+    """Install the run's core budget; ``None`` also restores torch's own threads."""
+    global _CORE_BUDGET, _DEFAULT_TORCH_THREADS
+    if (
+        budget is not None
+        and _DEFAULT_TORCH_THREADS is None
+        and _MODEL_RUNTIME_AVAILABLE
+    ):
+        _DEFAULT_TORCH_THREADS = torch.get_num_threads()
+    if budget is None and _DEFAULT_TORCH_THREADS is not None:
+        torch.set_num_threads(_DEFAULT_TORCH_THREADS)
+        _DEFAULT_TORCH_THREADS = None
+    _CORE_BUDGET = budget
+
+
+def claim_cores(
+    stage: str, apply: typing.Callable[[int], None] | None = None
+) -> int | None:
+    """Claim ``stage``'s share of the budget; ``None`` when no budget is set."""
+    if _CORE_BUDGET is None:
+        return None
+    return _CORE_BUDGET.claim(stage, CORE_WEIGHTS[stage], apply)
+
+
+def release_cores(stage: str) -> None:
+    if _CORE_BUDGET is not None:
+        _CORE_BUDGET.release(stage)
+
+
+def core_share(stage: str, default: int) -> int:
+    """``stage``'s current share, or ``default`` outside a budgeted run."""
+    share = _CORE_BUDGET.share(stage) if _CORE_BUDGET is not None else None
+    return share if share is not None else default
+
+
+def apply_torch_threads(threads: int | None) -> None:
+    """Size torch's intra-op pool to a stage's share.
+
+    Only ever from the main thread at a stage boundary: the setting is
+    process-wide, and only one model pass runs at a time."""
+    if threads is not None and _MODEL_RUNTIME_AVAILABLE:
+        torch.set_num_threads(threads)
+
+
+class SharedExecutors:
+    """The process's worker threads, as fixed-width named lanes.
+
+    Hashing, model-input decoding and colour extraction used to size and spin
+    up their own pools — the embedder a fresh 4-thread one per batch — so
+    stages running at the same time oversubscribed the cores between them, and
+    every batch paid thread start-up. Lanes live for the run instead, and a
+    stage only ever adds work to its lane. Work on a lane must never wait on
+    work queued to that same lane, or a full lane deadlocks itself."""
+
+    def __init__(self, lanes: Mapping[str, int] = EXECUTOR_LANE_WORKERS):
+        self.lanes = {
+            name: ExecutorLane(name, workers) for name, workers in lanes.items()
+        }
+
+    def lane(self, name: str) -> ExecutorLane:
+        return self.lanes[name]
+
+    def stats(self) -> dict[str, dict[str, typing.Any]]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        for lane in self.lanes.values():
+            lane.shutdown(cancel_futures=cancel_futures)
+
+
+_EXECUTORS: SharedExecutors | None = None
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def executor_lane(name: str) -> ExecutorLane:
+    """The process-wide lane ``name``, starting the shared executors on first use."""
+    global _EXECUTORS
+    with _EXECUTORS_LOCK:
+        if _EXECUTORS is None:
+            _EXECUTORS = SharedExecutors()
+        return _EXECUTORS.lane(name)
+
+
+def shared_executor_stats() -> dict[str, dict[str, typing.Any]]:
+    with _EXECUTORS_LOCK:
+        return _EXECUTORS.stats() if _EXECUTORS is not None else {}
+
+
+def reset_shared_executors() -> None:
+    """Shut the shared executors down; the next ``executor_lane`` starts fresh ones."""
+    global _EXECUTORS
+    with _EXECUTORS_LOCK:
+        executors, _EXECUTORS = _EXECUTORS, None
+    if executors is not None:
+        executors.shutdown(cancel_futures=True)
+
+
+class DerivativeCache:
+    """Downsized model inputs on disk, keyed by pixel digest and derivative spec.
+
+    Every model pass decodes the full 24MP JPEG, then throws almost all of it
+    away: the GGUF captioner wants a 1024px JPEG and each SigLIP processor a
+    224x224 image. A derivative is exactly the bytes a pass would otherwise
+    have computed — the caption JPEG it would have uploaded, or the image the
+    processor's own resize would have produced — so a hit changes no model
+    input and needs no provenance bump. On a miss, one decode renders every
+    spec seen so far (``wanted``, remembered across runs), so a new photo is
+    decoded once for all passes. A rerun after a model or prompt bump skips
+    full-resolution decoding altogether.
+
+    Keyed on the pixel digest, which covers EXIF orientation too, so a
+    metadata-only edit keeps its derivatives. Bounded by ``max_bytes``; the
+    least recently used rows go first."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS derivatives (
+                source_sha256 TEXT NOT NULL,
+                spec TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source_sha256, spec)
+            )
+            """
+        )
+        self.con.execute(
+            "CREATE INDEX IF NOT EXISTS derivatives_last_used ON derivatives(last_used)"
+        )
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS derivative_specs (spec TEXT PRIMARY KEY)"
+        )
+        self.con.commit()
+        self.wanted = {
+            row[0] for row in self.con.execute("SELECT spec FROM derivative_specs")
+        }
+        self.held_bytes = self.con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM derivatives"
+        ).fetchone()[0]
+        # Pixel source path -> pixel digest, as planning computed it. Serving a
+        # derivative under the planned digest keeps model input and the
+        # provenance pinned for it in step even if the file moves mid-run.
+        self.known_digests: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def want(self, spec: str) -> None:
+        with self.lock:
+            if spec in self.wanted:
+                return
+            self.wanted.add(spec)
+            with self.con:
+                self.con.execute(
+                    "INSERT OR IGNORE INTO derivative_specs(spec) VALUES (?)", (spec,)
+                )
+
+    def get(self, digest: str, spec: str) -> bytes | None:
+        with self.lock:
+            row = self.con.execute(
+                "SELECT data FROM derivatives WHERE source_sha256 = ? AND spec = ?",
+                (digest, spec),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self.con:
+                self.con.execute(
+                    "UPDATE derivatives SET last_used = ? "
+                    "WHERE source_sha256 = ? AND spec = ?",
+                    (time.time(), digest, spec),
+                )
+            return row[0]
+
+    def put(self, digest: str, rendered: Mapping[str, bytes]) -> None:
+        with self.lock, self.con:
+            now = time.time()
+            for spec, data in rendered.items():
+                previous = self.con.execute(
+                    "SELECT size FROM derivatives WHERE source_sha256 = ? AND spec = ?",
+                    (digest, spec),
+                ).fetchone()
+                self.con.execute(
+                    "INSERT OR REPLACE INTO derivatives"
+                    "(source_sha256, spec, data, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (digest, spec, data, len(data), now),
+                )
+                self.held_bytes += len(data) - (previous[0] if previous else 0)
+            while self.held_bytes > self.max_bytes:
+                oldest = self.con.execute(
+                    "SELECT source_sha256, spec, size FROM derivatives "
+                    "ORDER BY last_used LIMIT 64"
+                ).fetchall()
+                if not oldest:
+                    break
+                for old_digest, old_spec, size in oldest:
+                    if self.held_bytes <= self.max_bytes:
+                        break
+                    self.con.execute(
+                        "DELETE FROM derivatives WHERE source_sha256 = ? AND spec = ?",
+                        (old_digest, old_spec),
+                    )
+                    self.held_bytes -= size
+                    self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "maxBytes": self.max_bytes,
+                "heldBytes": self.held_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            self.con.close()
+
+
+_DERIVATIVES: DerivativeCache | None = None
+
+
+def set_derivative_cache(cache: DerivativeCache | None) -> None:
+    global _DERIVATIVES
+    if _DERIVATIVES is not None and _DERIVATIVES is not cache:
+        _DERIVATIVES.close()
+    _DERIVATIVES = cache
+
+
+def derivative_cache_path_for(dbpath: str) -> str:
+    """The derivative cache sidecar that serves ``dbpath``."""
+    return os.path.join(
+        os.path.dirname(os.path.abspath(dbpath)), DERIVATIVE_CACHE_FILENAME
+    )
+
+
+def embedder_derivative_spec(processor: typing.Any) -> str | None:
+    """The derivative an image processor's resize would produce, if it has one.
+
+    Only a fixed ``height`` x ``width`` resize qualifies: the processor then
+    resizes a same-sized image as a no-op copy, so feeding it the derivative
+    yields exactly the tensor the full-resolution image would have."""
+    size = getattr(processor, "size", None) or {}
+    if not getattr(processor, "do_resize", False) or set(size) != {"height", "width"}:
+        return None
+    resample = getattr(processor, "resample", None)
+    if resample is None:
+        return None
+    return f"rgb-{size['width']}x{size['height']}-r{int(resample)}"
+
+
+def render_derivatives(
+    raw: Image.Image, specs: typing.Iterable[str]
+) -> dict[str, bytes]:
+    """Every spec in ``specs`` from one decoded image."""
+    rendered = {}
+    for spec in specs:
+        if spec == CAPTION_DERIVATIVE_SPEC:
+            rendered[spec] = encode_caption_jpeg(raw)
+            continue
+        match = re.fullmatch(r"rgb-(\d+)x(\d+)-r(\d+)", spec)
+        if match is None:
+            continue
+        width, height, resample = (int(value) for value in match.groups())
+        rendered[spec] = (
+            raw.convert("RGB")
+            .resize((width, height), resample=Image.Resampling(resample))
+            .tobytes()
+        )
+    return rendered
+
+
+@contextmanager
+def derivative_cache_at(path: str | None):
+    """Serve model inputs from the derivative cache at ``path`` for the block.
+
+    For the benchmark commands, which otherwise decode every input at full
+    resolution on every repeat. Yields ``None`` (and changes nothing) when
+    ``path`` is not given."""
+    if not path:
+        yield None
+        return
+    cache = DerivativeCache(path, DERIVATIVE_CACHE_MB * 1024 * 1024)
+    set_derivative_cache(cache)
+    try:
+        yield cache
+    finally:
+        log(f"Derivative cache: {cache.stats()}")
+        set_derivative_cache(None)
+
+
+def load_derivative(path: str, spec: str) -> bytes | None:
+    """The ``spec`` derivative of the pixel source ``path``.
+
+    ``None`` when no derivative cache is configured, so callers decode as they
+    always have."""
+    cache = _DERIVATIVES
+    if cache is None:
+        return None
+    digest = cache.known_digests.get(path)
+    if digest is not None:
+        data = cache.get(digest, spec)
+        if data is not None:
+            return data
+
+    # Key the rendered derivatives on the bytes actually decoded, never on a
+    # digest taken from some earlier read of the file.
+    source = read_source_bytes(path)
+    decoded_digest = pixel_digest_of(source)
+    if decoded_digest != digest:
+        data = cache.get(decoded_digest, spec)
+        if data is not None:
+            return data
+    with Image.open(io.BytesIO(source)) as raw:
+        raw.load()
+        rendered = render_derivatives(raw, cache.wanted | {spec})
+    cache.put(decoded_digest, rendered)
+    return rendered.get(spec)
+
+
 MEDIA_KIND_PHOTO = "photo"
 MEDIA_KIND_VIDEO = "video"
 
@@ -551,17 +1386,64 @@ def sidecar_number(value: typing.Any) -> float | None:
 
 
 def source_digests_for(
-    paths: list[str], media_root: str | None = None
+    paths: list[str],
+    media_root: str | None = None,
+    digest_cache: str | None = None,
+    verify: bool = False,
+    counters: dict | None = None,
+    pixel_digests: dict | None = None,
 ) -> dict[str, str | None]:
     """Content digest per path, taken from whatever pixels represent it.
 
     A video is identified by its own path but indexed through its poster frame,
     and the frame is what the models actually saw — so the frame is what the
     stage provenance is pinned to. Re-extracting a poster (because the clip
-    changed) is therefore what marks the clip for re-indexing."""
+    changed) is therefore what marks the clip for re-indexing.
+
+    ``digest_cache`` names a ``ContentDigestCache`` sidecar; only sources whose
+    stat tuple moved since they were last hashed are read. ``verify`` hashes
+    everything regardless and reports cached digests that turned out wrong.
+    ``counters`` receives the cache hit, hash and mismatch counts.
+
+    ``pixel_digests``, when given, is filled with each path's pixel digest (see
+    ``jpeg_pixel_sha256``) from the same read."""
     pixel_by_path = {path: pixel_source_for(path, media_root) for path in paths}
-    digests = file_content_sha256_many(list(dict.fromkeys(pixel_by_path.values())))
-    return {path: digests.get(pixels) for path, pixels in pixel_by_path.items()}
+    sources = list(dict.fromkeys(pixel_by_path.values()))
+    if digest_cache is not None:
+        both = cached_content_digests_many(
+            sources, digest_cache, verify=verify, counters=counters
+        )
+    elif pixel_digests is not None:
+        both = file_content_digests_many(sources)
+    else:
+        both = {
+            source: (digest, None)
+            for source, digest in file_content_sha256_many(sources).items()
+        }
+    if digest_cache is None and counters is not None:
+        counters.update(
+            {"cacheHits": 0, "hashed": len(sources), "staleCacheEntries": 0}
+        )
+    if pixel_digests is not None:
+        pixel_digests.update(
+            {path: both[pixels][1] for path, pixels in pixel_by_path.items()}
+        )
+    return {path: both[pixels][0] for path, pixels in pixel_by_path.items()}
+
+
+def stage_pin_is_current(
+    stage: str, pinned: str | None, file_digest: str | None, pixel_digest: str | None
+) -> bool:
+    """Whether stage provenance pinned to ``pinned`` still describes the source.
+
+    Pixel-pinned stages also accept the whole-file digest: a pin written before
+    pixel digests existed, to bytes that have not changed since, is just as
+    current — and rejecting it would re-run every caption and embedding once."""
+    if pinned is None:
+        return False
+    if stage in PIXEL_PINNED_STAGES:
+        return pinned in (pixel_digest, file_digest)
+    return pinned == file_digest
 
 
 def partition_indexable(
@@ -665,6 +1547,10 @@ CORE_STAGE = "core"
 CAPTION_STAGE = "caption"
 SIGLIP_V1_STAGE = "embedding:siglip-v1"
 SIGLIP_V2_STAGE = "embedding:siglip-v2"
+# Stages whose output is a function of the decoded pixels alone. They are pinned
+# to the pixel digest, so a metadata-only edit (GPS written by the geotag tool)
+# reruns only the CPU core stage. Core reads EXIF, so it stays on the file digest.
+PIXEL_PINNED_STAGES = (CAPTION_STAGE, SIGLIP_V1_STAGE, SIGLIP_V2_STAGE)
 # Unchanged from v1 on purpose: the published core output (EXIF fields, geocode,
 # full-resolution palette) is byte-identical to what v1 produced, verified across
 # real photos. `details=False` only drops MakerNote/thumbnail tags that were never
@@ -1013,15 +1899,10 @@ def parse_caption_with_retry(
     return None
 
 
-def resolve_caption_result(
-    classifier: BaseCaptionClassifier,
-    path: str,
-    geocode: Mapping | None,
-    raw_caption: str,
-    generation_metric: Mapping[str, typing.Any],
-    metric_sink: list[dict[str, typing.Any]] | None = None,
+def accept_caption_result(
+    path: str, raw_caption: str, generation_metric: Mapping[str, typing.Any]
 ) -> Mapping[str, typing.Any] | None:
-    """Accept a completed batch result or retry one non-EOS straggler singly."""
+    """Parse a completed batch result, or return ``None`` when it needs a retry."""
     if (
         generation_metric.get("completedWithEos") is not False
         or generation_metric.get("completedWithJson")
@@ -1042,22 +1923,19 @@ def resolve_caption_result(
         except (ValueError, KeyError, json.JSONDecodeError) as err:
             if isinstance(generation_metric, dict):
                 generation_metric["parseSuccess"] = False
-            log(f"Caption JSON was malformed for {path}: {err}; retrying singly")
+            log(f"Caption JSON was malformed for {path}: {err}; retrying it")
     else:
         if isinstance(generation_metric, dict):
             generation_metric["parseSuccess"] = False
-        log(f"Caption generation did not reach EOS for {path}; retrying singly")
+        log(f"Caption generation did not reach EOS for {path}; retrying it")
+    return None
 
-    with heartbeat(f"single caption retry for {os.path.basename(path)}"):
-        retry_raw = classifier.predict(path=path, geocode=geocode)
-    retry_metric = (
-        dict(classifier.last_generation_metrics[0])
-        if classifier.last_generation_metrics
-        else {}
-    )
+
+def finish_caption_retry(
+    path: str, retry_raw: str, retry_metric: dict[str, typing.Any]
+) -> Mapping[str, typing.Any] | None:
+    """Parse a retry's result; a retry that fails too leaves the path incomplete."""
     retry_metric["singleRetry"] = True
-    if metric_sink is not None:
-        metric_sink.append(retry_metric)
     if retry_metric.get("completedWithEos") is False:
         retry_metric["parseSuccess"] = False
         log(
@@ -1078,6 +1956,67 @@ def resolve_caption_result(
         return None
 
 
+def resolve_caption_result(
+    classifier: BaseCaptionClassifier,
+    path: str,
+    geocode: Mapping | None,
+    raw_caption: str,
+    generation_metric: Mapping[str, typing.Any],
+    metric_sink: list[dict[str, typing.Any]] | None = None,
+    raw_sink: list[str] | None = None,
+) -> Mapping[str, typing.Any] | None:
+    """Accept a completed batch result or retry one non-EOS straggler singly."""
+    parsed = accept_caption_result(path, raw_caption, generation_metric)
+    if parsed is not None:
+        return parsed
+    with heartbeat(f"single caption retry for {os.path.basename(path)}"):
+        retry_raw = classifier.predict(path=path, geocode=geocode)
+    retry_metric = (
+        dict(classifier.last_generation_metrics[0])
+        if classifier.last_generation_metrics
+        else {}
+    )
+    if metric_sink is not None:
+        metric_sink.append(retry_metric)
+    if raw_sink is not None:
+        raw_sink.append(retry_raw)
+    return finish_caption_retry(path, retry_raw, retry_metric)
+
+
+def reparse_caption_attempts(
+    path: str, attempts: list[Mapping[str, typing.Any]]
+) -> tuple[Mapping[str, typing.Any] | None, list[dict[str, typing.Any]]]:
+    """Parse cached raw attempts as resolve_caption_result parsed them live.
+
+    Returns the caption, if any, and each attempt's metric as parsed now."""
+    first, *retries = attempts
+    metric = dict(first["metric"])
+    parsed = accept_caption_result(path, first["raw"], metric)
+    metrics = [metric]
+    if parsed is None and retries:
+        retry_metric = dict(retries[0]["metric"])
+        metrics.append(retry_metric)
+        parsed = finish_caption_retry(path, retries[0]["raw"], retry_metric)
+    return parsed, metrics
+
+
+@contextmanager
+def caption_token_budget(classifier: BaseCaptionClassifier, max_new_tokens: int):
+    """Generate at ``max_new_tokens`` whether through predict or predict_batch."""
+    saved = {
+        name: getattr(classifier, name)
+        for name in ("max_new_tokens", "batch_max_new_tokens")
+        if hasattr(classifier, name)
+    }
+    for name in saved:
+        setattr(classifier, name, max_new_tokens)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(classifier, name, value)
+
+
 def complete_json_object_end(value: str) -> int | None:
     """Return the end offset of the first complete top-level JSON object.
 
@@ -1272,26 +2211,75 @@ def looks_like_runaway_tags(tags: list[str]) -> bool:
 
 def has_repeated_open_classifier_tags(value: str) -> bool:
     """Detect the measured caption loop inside an as-yet-unclosed tags array."""
+    emitted_tags = open_classifier_tags(value)
+    if emitted_tags is None:
+        return False
+    unique = {tag.strip().casefold() for tag in emitted_tags if tag.strip()}
+    return len(unique) >= 4 and len(emitted_tags) > len(unique)
+
+
+def open_classifier_tags(value: str) -> list[str] | None:
+    """The complete tag strings inside an as-yet-unclosed tags array, or
+    ``None`` when there is no open array to read."""
     tags_match = re.search(r'"tags"\s*:\s*\[(.*)$', value, re.DOTALL)
     if not tags_match or "]" in tags_match.group(1):
-        return False
+        return None
     try:
-        emitted_tags = [
+        return [
             json.loads(match.group(0))
             for match in re.finditer(r'"(?:\\.|[^"\\])*"', tags_match.group(1))
         ]
     except json.JSONDecodeError:
+        return None
+
+
+CAPTION_STREAM_STOP_CLOSED = "object-closed"
+CAPTION_STREAM_STOP_RUNAWAY = "runaway"
+# One tag emitted this many times in a streamed caption is a loop. A single
+# repeat is an ordinary slip that parse_classifier_response dedupes.
+CAPTION_STREAM_TAG_REPEATS = 3
+
+
+def has_looping_open_classifier_tag(value: str) -> bool:
+    """Detect one tag repeated into a loop inside an as-yet-unclosed tags array."""
+    emitted_tags = open_classifier_tags(value)
+    if not emitted_tags:
         return False
-    unique = {tag.strip().casefold() for tag in emitted_tags if tag.strip()}
-    return len(unique) >= 4 and len(emitted_tags) > len(unique)
+    counts = collections.Counter(
+        tag.strip().casefold() for tag in emitted_tags if tag.strip()
+    )
+    return max(counts.values(), default=0) >= CAPTION_STREAM_TAG_REPEATS
+
+
+def caption_stream_stop(content: str) -> str | None:
+    """Why a streamed caption can stop now, or ``None`` to keep reading.
+
+    The object closing ends its content: anything after it is ignored, though
+    the stream is still read for its usage and timings. A tag loop ends it as
+    runaway: the rest of the budget would only extend the loop. Unlike
+    the transformers logits processor, a single repeated tag does not count.
+    Cut here, the row would be retried and cut again, while left to close it
+    parses once the duplicate is dropped."""
+    if complete_json_object_end(content) is not None:
+        return CAPTION_STREAM_STOP_CLOSED
+    if has_looping_open_classifier_tag(content):
+        return CAPTION_STREAM_STOP_RUNAWAY
+    tags = open_classifier_tags(content)
+    if tags and looks_like_runaway_tags(tags):
+        return CAPTION_STREAM_STOP_RUNAWAY
+    return None
 
 
 class JsonCompletionLogitsProcessor:
-    """Force EOS independently for rows whose top-level JSON is complete."""
+    """Force EOS independently for rows whose top-level JSON is complete.
 
-    def __init__(self, tokenizer, eos_token_id: int) -> None:
+    ``prompt_length`` is where generated tokens start in each row. The prompt
+    itself quotes the schema as a balanced object, so it must not be decoded."""
+
+    def __init__(self, tokenizer, eos_token_id: int, prompt_length: int = 0) -> None:
         self.tokenizer = tokenizer
         self.eos_token_id = eos_token_id
+        self.prompt_length = prompt_length
         try:
             closing_ids = tokenizer.encode("]", add_special_tokens=False)
         except (AttributeError, TypeError):
@@ -1304,42 +2292,143 @@ class JsonCompletionLogitsProcessor:
 
     def __call__(self, input_ids, scores):
         for row_index, row in enumerate(input_ids):
+            if self.prompt_length:
+                row = row[self.prompt_length :]
             text = self.tokenizer.decode(row.detach().cpu().tolist())
-            if complete_json_object_end(
-                text
-            ) is not None or complete_classifier_json_prefix(text):
-                scores[row_index].fill_(float("-inf"))
-                scores[row_index, self.eos_token_id] = 0.0
-            elif (
-                self.closing_bracket_token_id is not None
-                and has_repeated_open_classifier_tags(text)
-            ):
-                scores[row_index].fill_(float("-inf"))
-                scores[row_index, self.closing_bracket_token_id] = 0.0
+            self._constrain(row_index, text, scores)
         return scores
 
+    @staticmethod
+    def _force(scores, row_index: int, token_id: int) -> None:
+        scores[row_index].fill_(float("-inf"))
+        scores[row_index, token_id] = 0.0
+
+    def _constrain(self, row_index: int, text: str, scores) -> None:
+        if complete_json_object_end(
+            text
+        ) is not None or complete_classifier_json_prefix(text):
+            self._force(scores, row_index, self.eos_token_id)
+        elif (
+            self.closing_bracket_token_id is not None
+            and has_repeated_open_classifier_tags(text)
+        ):
+            self._force(scores, row_index, self.closing_bracket_token_id)
 
-def filter_exif_for_search(
-    exif: Mapping[str, typing.Any] | None,
-) -> Mapping[str, typing.Any]:
-    if not exif or not hasattr(exif, "get"):
-        return {}
 
-    filtered = {}
-    for field in EXIF_SEARCH_FIELDS:
-        value = exif.get(field)
-        if value is None:
-            continue
-        resolved = str(value).strip()
-        if resolved == "":
-            continue
-        filtered[field] = value
-    return filtered
+CAPTION_JSON_OPENING = '{"tags": ['
+CAPTION_JSON_BETWEEN_FIELDS = ', "alt_text": "'
 
 
-class BaseCaptionClassifier:
-    backend = "base"
-    batch_size = 1
+def _json_string_end(value: str, start: int = 0) -> int | None:
+    """Offset just past the quote that closes a string whose body starts at
+    ``start``, or ``None`` while it is still open."""
+    escaped = False
+    for position in range(start, len(value)):
+        character = value[position]
+        if escaped:
+            escaped = False
+        elif character == "\\":
+            escaped = True
+        elif character == '"':
+            return position + 1
+    return None
+
+
+def caption_json_forced_continuation(text: str) -> str | None:
+    """The literal the caption schema requires next, or ``None`` where the model
+    chooses (tag strings, alt text, and whether to add another tag).
+
+    The schema ``{tags: string[], alt_text: string}`` leaves the model only those
+    choices: the opening, the text between the fields and the closing brace are
+    fixed. Output that has already left the skeleton returns ``None`` and is
+    judged by the parser as before."""
+    if len(text) < len(CAPTION_JSON_OPENING):
+        return (
+            CAPTION_JSON_OPENING[len(text) :]
+            if CAPTION_JSON_OPENING.startswith(text)
+            else None
+        )
+    if not text.startswith(CAPTION_JSON_OPENING):
+        return None
+    position = len(CAPTION_JSON_OPENING)
+    while True:
+        while position < len(text) and text[position] in " ,":
+            position += 1
+        if position >= len(text):
+            return None
+        if text[position] == "]":
+            break
+        if text[position] != '"':
+            return None
+        end = _json_string_end(text, position + 1)
+        if end is None:
+            return None
+        position = end
+    after_tags = text[position + 1 :]
+    if len(after_tags) < len(CAPTION_JSON_BETWEEN_FIELDS):
+        return (
+            CAPTION_JSON_BETWEEN_FIELDS[len(after_tags) :]
+            if CAPTION_JSON_BETWEEN_FIELDS.startswith(after_tags)
+            else None
+        )
+    if not after_tags.startswith(CAPTION_JSON_BETWEEN_FIELDS):
+        return None
+    alt_end = _json_string_end(after_tags, len(CAPTION_JSON_BETWEEN_FIELDS))
+    if alt_end is None or after_tags[alt_end:]:
+        return None
+    return "}"
+
+
+class CaptionSchemaLogitsProcessor(JsonCompletionLogitsProcessor):
+    """Constrain generation to the caption schema, as ``response_format`` does
+    for llama-server.
+
+    Wherever the schema fixes the next characters, the next token is forced to
+    the first token of that literal. Once the object closes, EOS is forced. The
+    model keeps every free choice, and the repeated-tag guard still applies
+    inside the tags array. Checking the decoded text every step costs one
+    decode of at most ``max_new_tokens`` tokens per row."""
+
+    def __init__(self, tokenizer, eos_token_id: int, prompt_length: int = 0) -> None:
+        super().__init__(tokenizer, eos_token_id, prompt_length)
+        self._literal_token_ids: dict[str, list[int]] = {}
+
+    def _constrain(self, row_index: int, text: str, scores) -> None:
+        literal = caption_json_forced_continuation(text)
+        if literal is not None:
+            if literal not in self._literal_token_ids:
+                self._literal_token_ids[literal] = self.tokenizer.encode(
+                    literal, add_special_tokens=False
+                )
+            token_ids = self._literal_token_ids[literal]
+            if token_ids:
+                self._force(scores, row_index, token_ids[0])
+                return
+        super()._constrain(row_index, text, scores)
+
+
+def filter_exif_for_search(
+    exif: Mapping[str, typing.Any] | None,
+) -> Mapping[str, typing.Any]:
+    if not exif or not hasattr(exif, "get"):
+        return {}
+
+    filtered = {}
+    for field in EXIF_SEARCH_FIELDS:
+        value = exif.get(field)
+        if value is None:
+            continue
+        resolved = str(value).strip()
+        if resolved == "":
+            continue
+        filtered[field] = value
+    return filtered
+
+
+class BaseCaptionClassifier:
+    backend = "base"
+    batch_size = 1
+    parallel = 1
 
     def __init__(self) -> None:
         self.last_generation_metrics: list[dict[str, typing.Any]] = []
@@ -1351,7 +2440,14 @@ class BaseCaptionClassifier:
         raise NotImplementedError
 
     def predict_batch(self, items: list[tuple[str, Mapping | None]]) -> list[str]:
-        return [self.predict(path, geocode) for path, geocode in items]
+        results = []
+        metrics: list[dict[str, typing.Any]] = []
+        for path, geocode in items:
+            results.append(self.predict(path, geocode))
+            # Each predict replaces the metrics, so keep every item's row.
+            metrics.extend(self.last_generation_metrics[:1] or [{}])
+        self.last_generation_metrics = metrics
+        return results
 
     def release(self) -> None:
         """Free GPU memory held by this model so the next pass can load alone.
@@ -1385,15 +2481,24 @@ class Gemma4Classifier(BaseCaptionClassifier):
         max_new_tokens: int = GEMMA4_MAX_NEW_TOKENS,
         gpu_headroom_gb: float | None = None,
         low_impact: bool = False,
+        prompt_first: bool = False,
+        batch_max_new_tokens: int = CAPTION_BATCH_MAX_NEW_TOKENS,
+        static_cache: bool = False,
     ):
         super().__init__()
         self.model_id = model_id
         self.quantization = quantization
         self.batch_size = batch_size
         self.max_new_tokens = max_new_tokens
+        self.batch_max_new_tokens = batch_max_new_tokens
+        self.static_cache = static_cache
         self.gpu_headroom_gb = gpu_headroom_gb
         self.low_impact = low_impact
+        self.prompt_first = prompt_first
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._prefix_ids: list[int] | None = None
+        self._prefix_cache: typing.Any = None
+        self._prefix_cache_reaches_image: bool | None = None
 
     def _build_max_memory(self) -> dict[typing.Any, str] | None:
         if not torch.cuda.is_available():
@@ -1433,6 +2538,9 @@ class Gemma4Classifier(BaseCaptionClassifier):
                 "Warning: local testing found Gemma 4 vision captions can become placeholder-like under bitsandbytes 4-bit quantisation. Prefer full precision for quality checks."
             )
         self.processor = AutoProcessor.from_pretrained(self.model_id, use_fast=False)
+        # Batched prompts are padded on the left so every row's last prompt token
+        # sits in the final column, where generate() appends the next one.
+        self.processor.tokenizer.padding_side = "left"
 
         model_kwargs: dict[str, typing.Any] = {}
         max_memory = self._build_max_memory()
@@ -1476,57 +2584,297 @@ class Gemma4Classifier(BaseCaptionClassifier):
     def _build_prompt(self, geocode: Mapping | None) -> str:
         return build_classifier_prompt(geocode)
 
-    def _build_inputs(
-        self, path: str, geocode: Mapping | None
-    ) -> dict[str, torch.Tensor]:
-        prompt = self._build_prompt(geocode)
-        with Image.open(pixel_source_for(path)) as raw_image:
-            image = raw_image.convert("RGB")
-
-        messages = [
+    @staticmethod
+    def _load_image(path: str) -> Image.Image:
+        with Image.open(source_image_input(pixel_source_for(path))) as raw_image:
+            return raw_image.convert("RGB")
+
+    def _messages(
+        self, image: Image.Image, geocode: Mapping | None
+    ) -> list[dict[str, typing.Any]]:
+        return [
             {
                 "role": "user",
-                "content": [
+                "content": caption_message_content(
                     {"type": "image", "image": image},
-                    {"type": "text", "text": prompt},
-                ],
+                    self._build_prompt(geocode),
+                    self.prompt_first,
+                ),
             }
         ]
+
+    def _to_model_device(self, inputs: Mapping[str, typing.Any]) -> dict:
+        resolved_device = getattr(self.model, "device", None)
+        if resolved_device is None or str(resolved_device) == "meta":
+            resolved_device = self.device
+        return {k: v.to(resolved_device) for k, v in inputs.items()}
+
+    def _build_inputs(
+        self, path: str, geocode: Mapping | None
+    ) -> dict[str, torch.Tensor]:
         inputs = self.processor.apply_chat_template(
-            messages,
+            self._messages(self._load_image(path), geocode),
             tokenize=True,
             return_dict=True,
             return_tensors="pt",
             add_generation_prompt=True,
         )
+        return self._to_model_device(inputs)
+
+    def _eos_token_ids(self) -> set[int]:
+        generation_config = getattr(self.model, "generation_config", None)
+        eos = getattr(generation_config, "eos_token_id", None)
+        if eos is None:
+            eos = getattr(self.processor.tokenizer, "eos_token_id", None)
+        if eos is None:
+            return set()
+        return {eos} if isinstance(eos, int) else set(eos)
+
+    def _generate_kwargs(
+        self, max_new_tokens: int, prompt_length: int
+    ) -> dict[str, typing.Any]:
+        from transformers import LogitsProcessorList
+
+        eos_ids = self._eos_token_ids()
+        tokenizer_eos = getattr(self.processor.tokenizer, "eos_token_id", None)
+        kwargs: dict[str, typing.Any] = {
+            "max_new_tokens": max_new_tokens,
+            "do_sample": False,
+            "use_cache": True,
+        }
+        if eos_ids:
+            kwargs["logits_processor"] = LogitsProcessorList(
+                [
+                    CaptionSchemaLogitsProcessor(
+                        self.processor.tokenizer,
+                        tokenizer_eos if tokenizer_eos in eos_ids else min(eos_ids),
+                        prompt_length,
+                    )
+                ]
+            )
+        if self.static_cache:
+            # Preallocated to prompt + max_new_tokens, so each decode step is
+            # the same shape rather than growing the cache by one token.
+            kwargs["cache_implementation"] = "static"
+        return kwargs
 
-        resolved_device = getattr(self.model, "device", None)
-        if resolved_device is None or str(resolved_device) == "meta":
-            resolved_device = self.device
-        return {k: v.to(resolved_device) for k, v in inputs.items()}
+    @torch.inference_mode()
+    def predict_batch(self, items: list[tuple[str, Mapping | None]]) -> list[str]:
+        """One left-padded generate() for the whole batch, at the batch token cap.
+
+        Rows finish independently: HF pads a row once it emits EOS, and each
+        row's metrics record where its EOS fell, or that it ran out of tokens,
+        so ``resolve_caption_result`` retries only those rows singly at the
+        larger single cap. A CUDA OOM propagates, and
+        ``predict_caption_batch_resilient`` bisects the batch. The prompt-prefix
+        cache is single-image only, because left padding moves the prefix."""
+        if len(items) <= 1:
+            return super().predict_batch(items)
+        decode_started_at = time.perf_counter()
+        images = executor_lane("decode").map(
+            self._load_image, [path for path, _ in items]
+        )
+        decode_ms = (time.perf_counter() - decode_started_at) * 1000
+        processor_started_at = time.perf_counter()
+        inputs = self.processor.apply_chat_template(
+            [
+                self._messages(image, geocode)
+                for image, (_, geocode) in zip(images, items)
+            ],
+            tokenize=True,
+            return_dict=True,
+            return_tensors="pt",
+            add_generation_prompt=True,
+            padding=True,
+        )
+        inputs = self._to_model_device(inputs)
+        processor_ms = (time.perf_counter() - processor_started_at) * 1000
+        generate_started_at = time.perf_counter()
+        prompt_length = inputs["input_ids"].shape[-1]
+        generated = self.model.generate(
+            **inputs, **self._generate_kwargs(self.batch_max_new_tokens, prompt_length)
+        )
+        generate_ms = (time.perf_counter() - generate_started_at) * 1000
+        new_tokens = generated[:, prompt_length:]
+        texts = self.processor.batch_decode(
+            new_tokens,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=True,
+        )
+        eos_ids = self._eos_token_ids()
+        self.last_generation_metrics = [
+            {
+                **generation_row_metrics(row, text, eos_ids, self.batch_max_new_tokens),
+                "batchSize": len(items),
+                "decodeMs": round(decode_ms, 2),
+                "processorMs": round(processor_ms, 2),
+                "generateBatchMs": round(generate_ms, 2),
+            }
+            for row, text in zip(new_tokens.tolist(), texts)
+        ]
+        return texts
+
+    def _prompt_prefix_cache(self, input_ids: torch.Tensor) -> tuple[typing.Any, int]:
+        """The KV cache for the tokens before the image, and their count.
+
+        With the prompt first, everything up to the first image token is the same
+        for every photo: the chat template and the whole caption prompt. Its
+        keys and values are computed once, and each generate() only prefills the
+        image and the tail. The prefix is re-checked against every input, so a
+        changed prompt rebuilds the cache instead of reusing a stale one. The
+        cache is shared, not copied: generate() extends it in place, and
+        ``_trim_prefix_cache`` cuts it back afterwards."""
+        image_token_id = getattr(self.processor, "image_token_id", None)
+        if not self.prompt_first or image_token_id is None:
+            return None, 0
+        row = input_ids[0].tolist()
+        if image_token_id not in row or not self._prefix_cache_passes_image():
+            return None, 0
+        prefix = row[: row.index(image_token_id)]
+        if prefix != self._prefix_ids or self._prefix_cache is None:
+            from transformers import DynamicCache
+
+            self._prefix_cache = self.model(
+                input_ids=input_ids[:, : len(prefix)],
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            ).past_key_values
+            self._prefix_ids = prefix
+        return self._prefix_cache, len(prefix)
+
+    def _prefix_cache_passes_image(self) -> bool:
+        """Whether generate() still hands the image to the model after a prefix.
+
+        HF vision-language models commonly forward ``pixel_values`` only when
+        ``cache_position`` starts at 0 (Gemma 3 and PaliGemma do). A prefilled
+        prefix starts it later, so the image would be silently dropped. The
+        model's own ``prepare_inputs_for_generation`` is asked once per load,
+        and anything but a clear yes leaves the prefix uncached."""
+        if self._prefix_cache_reaches_image is None:
+            from transformers import DynamicCache
+
+            pixel_values = torch.zeros((1, 3, 2, 2))
+            try:
+                probe = self.model.prepare_inputs_for_generation(
+                    torch.zeros((1, 2), dtype=torch.long),
+                    past_key_values=DynamicCache(),
+                    attention_mask=torch.ones((1, 2), dtype=torch.long),
+                    cache_position=torch.tensor([1]),
+                    pixel_values=pixel_values,
+                    use_cache=True,
+                )
+                passes = probe.get("pixel_values") is pixel_values
+            except Exception as err:  # noqa: BLE001 - any failure means "unknown"
+                log(f"WARNING: could not probe {self.model_id} input forwarding: {err}")
+                passes = False
+            if not passes:
+                log(
+                    f"{self.model_id} drops pixel_values after a cached prefix; "
+                    "prefilling the prompt with every image instead."
+                )
+            self._prefix_cache_reaches_image = passes
+        return self._prefix_cache_reaches_image
+
+    def _trim_prefix_cache(self, prefix_tokens: int) -> None:
+        """Cut the shared prefix cache back to the prompt after a generate()."""
+        try:
+            self._prefix_cache.crop(prefix_tokens)
+        except (AttributeError, NotImplementedError, ValueError, RuntimeError):
+            # A cache that cannot be cropped is rebuilt for the next image
+            # rather than reused with this one's tokens still in it.
+            self._prefix_ids = None
+            self._prefix_cache = None
+
+    def release(self) -> None:
+        self._prefix_ids = None
+        self._prefix_cache = None
+        self._prefix_cache_reaches_image = None
+        super().release()
 
     @torch.inference_mode()
     def predict(self, path: str, geocode: Mapping | None) -> str:
         inputs = self._build_inputs(path, geocode)
         input_ids = inputs.get("input_ids")
-        generated = self.model.generate(
-            **inputs,
-            max_new_tokens=self.max_new_tokens,
-            do_sample=False,
-            use_cache=True,
+        prefix_cache, cached_tokens = (
+            self._prompt_prefix_cache(input_ids) if input_ids is not None else (None, 0)
+        )
+        generate_kwargs = self._generate_kwargs(
+            self.max_new_tokens, input_ids.shape[-1] if input_ids is not None else 0
         )
+        if prefix_cache is not None:
+            # The prefix arrives as a ready cache, which a static one would replace.
+            generate_kwargs.pop("cache_implementation", None)
+            generate_kwargs["past_key_values"] = prefix_cache
+        started_at = time.perf_counter()
+        try:
+            generated = self.model.generate(**inputs, **generate_kwargs)
+        finally:
+            if prefix_cache is not None:
+                self._trim_prefix_cache(cached_tokens)
+        generate_ms = round((time.perf_counter() - started_at) * 1000, 2)
 
         if input_ids is not None:
             prompt_len = input_ids.shape[-1]
             generated_tokens = generated[:, prompt_len:]
         else:
             generated_tokens = generated
-
-        return self.processor.batch_decode(
+        text = self.processor.batch_decode(
             generated_tokens,
             skip_special_tokens=True,
             clean_up_tokenization_spaces=True,
         )[0]
+        metric = {
+            "batchSize": 1,
+            "generateBatchMs": generate_ms,
+            "promptTokens": (input_ids.shape[-1] if input_ids is not None else None),
+            "cachedPromptTokens": cached_tokens,
+        }
+        if input_ids is not None:
+            metric.update(
+                generation_row_metrics(
+                    generated_tokens.tolist()[0],
+                    text,
+                    self._eos_token_ids(),
+                    self.max_new_tokens,
+                )
+            )
+        self.last_generation_metrics = [metric]
+        return text
+
+
+def generation_row_metrics(
+    tokens: list[int], text: str, eos_token_ids: set[int], max_new_tokens: int
+) -> dict[str, typing.Any]:
+    """EOS, JSON and token-budget metrics for one row of generate() output.
+
+    Only the tokens up to the row's first EOS count: in a batch, a row that
+    finished early is padded out to the longest row. A row that closed its
+    JSON object but ran out of tokens before EOS is still parsed rather than
+    retried."""
+    end = next(
+        (position for position, token in enumerate(tokens) if token in eos_token_ids),
+        None,
+    )
+    completed = end is not None
+    token_count = end if completed else len(tokens)
+    return {
+        "maxNewTokens": max_new_tokens,
+        "tokenCount": token_count,
+        "completedWithEos": completed,
+        "completedWithJson": complete_json_object_end(text) is not None,
+        "hitTokenLimit": not completed and token_count >= max_new_tokens,
+    }
+
+
+def caption_message_content(
+    image_part: dict[str, typing.Any], prompt: str, prompt_first: bool
+) -> list[dict[str, typing.Any]]:
+    """The user turn of a caption request. Putting the constant prompt before
+    the image makes it a prefix shared by every request, which a KV cache can
+    reuse; it is also a different input, so captions differ (see
+    ``caption_pipeline_version``)."""
+    text_part = {"type": "text", "text": prompt}
+    return [text_part, image_part] if prompt_first else [image_part, text_part]
 
 
 def _free_tcp_port() -> int:
@@ -1564,6 +2912,123 @@ def resolve_llama_server_command() -> str:
     )
 
 
+def caption_server_state_path(suffix: str) -> str:
+    """Registry, lock and lease files for the kept llama-server, per checkout
+    like the global indexer lock."""
+    return os.path.join(
+        tempfile.gettempdir(),
+        "photo-gallery-caption-server-"
+        f"{hashlib.sha256(os.path.abspath(__file__).encode()).hexdigest()[:12]}.{suffix}",
+    )
+
+
+@contextmanager
+def caption_server_registry_lock():
+    """Serialise attach, start, stop and the idle watchdog on the registry."""
+    fd = os.open(caption_server_state_path("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def read_caption_server_registry() -> dict[str, typing.Any] | None:
+    try:
+        with open(caption_server_state_path("json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_caption_server_registry(entry: Mapping[str, typing.Any] | None) -> None:
+    path = caption_server_state_path("json")
+    if entry is None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return
+    staging = f"{path}.tmp"
+    with open(staging, "w", encoding="utf-8") as fh:
+        json.dump(entry, fh, indent=2)
+    os.replace(staging, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        # Reap it first if this process started it, or a zombie reads as alive.
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def caption_server_healthy(entry: Mapping[str, typing.Any]) -> bool:
+    if not _pid_alive(int(entry["pid"])):
+        return False
+    try:
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{entry['port']}/health", timeout=2
+        ) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def caption_server_in_use() -> bool:
+    """Whether a run holds a lease on the kept server. Leases are shared flocks
+    the OS drops when a run exits or crashes, so none can be left stale."""
+    fd = os.open(caption_server_state_path("lease"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def caption_server_idle_seconds() -> float:
+    try:
+        return time.time() - os.stat(caption_server_state_path("lease")).st_mtime
+    except OSError:
+        return math.inf
+
+
+def stop_caption_server(entry: Mapping[str, typing.Any]) -> None:
+    """Terminate a registered server and drop the registry. Call under the lock."""
+    pid = int(entry["pid"])
+    try:
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + 15
+        while _pid_alive(pid) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if _pid_alive(pid):
+            os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    write_caption_server_registry(None)
+
+
+def encode_caption_jpeg(raw: Image.Image) -> bytes:
+    """The JPEG the GGUF captioner is sent for a decoded photo."""
+    image = ImageOps.exif_transpose(raw).convert("RGB")
+    image.thumbnail(
+        (GEMMA4_GGUF_IMAGE_MAX_EDGE, GEMMA4_GGUF_IMAGE_MAX_EDGE), Image.LANCZOS
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
 class Gemma4GgufClassifier(BaseCaptionClassifier):
     backend = CLASSIFIER_BACKEND_GEMMA4_GGUF
 
@@ -1575,6 +3040,14 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
         max_new_tokens: int = DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS,
         gpu_headroom_gb: float | None = None,
         low_impact: bool = False,
+        parallel: int = DEFAULT_GEMMA4_GGUF_PARALLEL,
+        persistent: bool = False,
+        idle_timeout_seconds: float = CAPTION_SERVER_IDLE_MINUTES * 60,
+        prompt_first: bool = False,
+        threads: int | None = None,
+        ctx_size: int | None = None,
+        image_min_tokens: int | None = None,
+        image_max_tokens: int | None = None,
     ):
         super().__init__()
         self.model_id = model_id
@@ -1583,12 +3056,26 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
         self.max_new_tokens = max_new_tokens
         self.gpu_headroom_gb = gpu_headroom_gb
         self.low_impact = low_impact
+        self.parallel = max(1, parallel)
+        self.persistent = persistent
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.prompt_first = prompt_first
+        # Server settings left to their defaults unless given, as
+        # `benchmark-classifier --sweep` does.
+        self.threads = threads
+        self.ctx_size = ctx_size
+        self.image_min_tokens = image_min_tokens
+        self.image_max_tokens = image_max_tokens
         self.command = None
         self.port: int | None = None
         self._server: subprocess.Popen | None = None
         self._base_url: str | None = None
         self._stderr_log_path: str | None = None
         self._stderr_log_handle: typing.IO[bytes] | None = None
+        self._slots: concurrent.futures.ThreadPoolExecutor | None = None
+        self._connections = threading.local()
+        self._open_connections: list[http.client.HTTPConnection] = []
+        self._lease_fd: int | None = None
 
     def _model_and_mmproj(self) -> tuple[list[str], str | None]:
         """Server args for a local .gguf pair, or an -hf-repo tag."""
@@ -1639,20 +3126,28 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
         `content` comes back empty. `response_format` does not prevent that and a
         request-level `reasoning_budget` is ignored. Disabling thinking is also most of
         the speed win (2.6s -> 1.4s per image).
+
+        `cache_prompt` is already llama-server's default and is sent so the reuse
+        of a slot's cached prefix does not hinge on the server build. It only
+        helps when the prompt comes first: with the image first, the prefix that
+        every request shares is the chat template's opening tokens.
         """
+        image_part = {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
+        }
         return {
             "messages": [
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                        },
-                        {"type": "text", "text": prompt},
-                    ],
+                    "content": caption_message_content(
+                        image_part, prompt, self.prompt_first
+                    ),
                 }
             ],
+            "cache_prompt": True,
+            "stream": True,
+            "stream_options": {"include_usage": True},
             "max_tokens": self.max_new_tokens,
             "temperature": 0,
             "chat_template_kwargs": {"enable_thinking": False},
@@ -1683,14 +3178,22 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
 
     @staticmethod
     def _encode_image(path: str) -> str:
-        with Image.open(pixel_source_for(path)) as raw:
-            image = ImageOps.exif_transpose(raw).convert("RGB")
-        image.thumbnail(
-            (GEMMA4_GGUF_IMAGE_MAX_EDGE, GEMMA4_GGUF_IMAGE_MAX_EDGE), Image.LANCZOS
-        )
-        buffer = io.BytesIO()
-        image.save(buffer, "JPEG", quality=80)
-        return base64.b64encode(buffer.getvalue()).decode("ascii")
+        pixels = pixel_source_for(path)
+        payload = load_derivative(pixels, CAPTION_DERIVATIVE_SPEC)
+        if payload is None:
+            with Image.open(source_image_input(pixels)) as raw:
+                payload = encode_caption_jpeg(raw)
+        return base64.b64encode(payload).decode("ascii")
+
+    def _ctx_size(self) -> int:
+        """A single slot keeps the historical 32768 context; concurrent slots are
+        sized per slot, so N of them cost N * 4096 of KV cache rather than each
+        being handed an eighth of a context nothing fills."""
+        if self.ctx_size is not None:
+            return self.ctx_size
+        if self.parallel == 1:
+            return DEFAULT_GEMMA4_GGUF_CTX_SIZE
+        return self.parallel * GEMMA4_GGUF_SLOT_CTX_SIZE
 
     def init_model(self) -> None:
         """Start one llama-server and leave it resident.
@@ -1701,24 +3204,75 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
         once takes the same path to ~1.4s per image.
         """
         self._sweep_stale_stderr_logs()
+        if _DERIVATIVES is not None:
+            _DERIVATIVES.want(CAPTION_DERIVATIVE_SPEC)
         self.command = resolve_llama_server_command()
-        model_args, _ = self._model_and_mmproj()
+        if self.parallel > 1:
+            self._slots = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.parallel, thread_name_prefix="llama-slot"
+            )
+        if self.persistent:
+            self._attach_or_start_persistent()
+            return
         self.port = _free_tcp_port()
+        self._start_server()
+
+    def _server_signature(self) -> dict[str, typing.Any]:
+        """What a kept server must have been started with to serve this run.
+        --threads is left out: it changes speed, never a caption."""
+        model_args, _ = self._model_and_mmproj()
+        signature = {
+            "command": self.command,
+            "modelArgs": model_args,
+            "ctxSize": self._ctx_size(),
+            "parallel": self.parallel,
+        }
+        # Only when set, so servers kept before these existed still match.
+        if self._image_token_args():
+            signature["imageTokens"] = [self.image_min_tokens, self.image_max_tokens]
+        return signature
+
+    def _image_token_args(self) -> list[str]:
+        """llama-server's per-image token bounds; the mmproj's own when unset."""
+        args = []
+        if self.image_min_tokens is not None:
+            args.extend(["--image-min-tokens", str(self.image_min_tokens)])
+        if self.image_max_tokens is not None:
+            args.extend(["--image-max-tokens", str(self.image_max_tokens)])
+        return args
+
+    def _server_threads(self) -> int:
+        """An explicit --threads, else the caption share of the core budget.
+
+        The share is capped at DEFAULT_GEMMA4_GGUF_THREADS: it counts logical
+        CPUs, and more threads than that have not been measured to help."""
+        if self.threads:
+            return self.threads
+        return min(
+            core_share("caption", DEFAULT_GEMMA4_GGUF_THREADS),
+            DEFAULT_GEMMA4_GGUF_THREADS,
+        )
+
+    def _start_server(self, detached: bool = False) -> None:
+        model_args, _ = self._model_and_mmproj()
         self._base_url = f"http://127.0.0.1:{self.port}"
         command = [
             self.command,
             *model_args,
             "--ctx-size",
-            str(DEFAULT_GEMMA4_GGUF_CTX_SIZE),
+            str(self._ctx_size()),
             "--threads",
-            str(DEFAULT_GEMMA4_GGUF_THREADS),
+            str(self._server_threads()),
             "--gpu-layers",
             "auto",
             "--port",
             str(self.port),
             "--host",
             "127.0.0.1",
+            *self._image_token_args(),
         ]
+        if self.parallel > 1:
+            command.extend(["--parallel", str(self.parallel), "--cont-batching"])
         log(f"Starting llama-server for {self.model_id} on port {self.port}.")
         # Capture stderr to a temp log instead of discarding it: when startup
         # fails the reason (missing binary, bad model tag, port clash, VRAM) is
@@ -1732,9 +3286,90 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
             stdout=subprocess.DEVNULL,
             stderr=self._stderr_log_handle,
             env=os.environ.copy(),
+            # A kept server must outlive this run and its terminal's Ctrl-C.
+            start_new_session=detached,
         )
         self._await_health()
 
+    def _attach_or_start_persistent(self) -> None:
+        """Reuse the registered llama-server if it is healthy and was started for
+        the same model, mmproj, context and slots; otherwise replace it.
+
+        The run then holds a shared lease on it until release(), which the idle
+        watchdog and ``caption-server stop`` both respect."""
+        signature = self._server_signature()
+        with caption_server_registry_lock():
+            entry = read_caption_server_registry()
+            if entry is not None and not _pid_alive(int(entry["pid"])):
+                write_caption_server_registry(None)
+                entry = None
+            if entry is not None and not caption_server_healthy(entry):
+                # Alive but not answering /health, perhaps only slow under load.
+                # Forgetting it would orphan its VRAM, and its watchdog exits
+                # once the registry names another server.
+                if caption_server_in_use():
+                    raise RuntimeError(
+                        "The kept llama-server is not answering /health and another "
+                        "run is using it; wait for that run or drop "
+                        "--classifier-keep-server."
+                    )
+                log("Stopping the kept llama-server, which is not answering /health.")
+                stop_caption_server(entry)
+                entry = None
+            if entry is not None and entry.get("signature") != signature:
+                if caption_server_in_use():
+                    raise RuntimeError(
+                        "The kept llama-server serves a different model and another "
+                        "run is using it; wait for that run or drop "
+                        "--classifier-keep-server."
+                    )
+                log("Stopping the kept llama-server, which serves a different model.")
+                stop_caption_server(entry)
+                entry = None
+            if entry is None:
+                self.port = _free_tcp_port()
+                self._start_server(detached=True)
+                assert self._server is not None
+                entry = {
+                    "pid": self._server.pid,
+                    "port": self.port,
+                    "signature": signature,
+                    "modelId": self.model_id,
+                    "idleTimeoutSeconds": self.idle_timeout_seconds,
+                    "startedAt": datetime.now()
+                    .astimezone()
+                    .isoformat(timespec="seconds"),
+                    "logPath": self._stderr_log_path,
+                }
+                write_caption_server_registry(entry)
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "caption-server",
+                        "watch",
+                        str(entry["pid"]),
+                    ],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+                # Ownership passes to the registry: release() must not stop it.
+                self._server = None
+            else:
+                self.port = int(entry["port"])
+                self._base_url = f"http://127.0.0.1:{self.port}"
+                log(
+                    f"Attached to the kept llama-server for {self.model_id} "
+                    f"on port {self.port} (PID {entry['pid']})."
+                )
+            self._lease_fd = os.open(
+                caption_server_state_path("lease"), os.O_RDWR | os.O_CREAT, 0o644
+            )
+            fcntl.flock(self._lease_fd, fcntl.LOCK_SH)
+            os.utime(self._lease_fd)
+
     @staticmethod
     def _sweep_stale_stderr_logs(max_age_seconds: float = 7 * 24 * 3600) -> None:
         """Best-effort cleanup of llama-server stderr logs left by past runs.
@@ -1798,42 +3433,220 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
             f"See the server log at {log_path}."
         )
 
-    @torch.inference_mode()
-    def predict(self, path: str, geocode: Mapping | None) -> str:
-        if self._server is None:
+    def _request_bytes(self, path: str, geocode: Mapping | None) -> bytes:
+        if self._base_url is None:
             raise RuntimeError(
                 "Gemma4GgufClassifier.init_model() must be called first."
             )
-        body = json.dumps(
+        return json.dumps(
             self._build_request_body(
                 self._build_prompt(geocode), self._encode_image(path)
             )
         ).encode("utf-8")
-        request = urllib.request.Request(
-            f"{self._base_url}/v1/chat/completions",
-            data=body,
-            headers={"Content-Type": "application/json"},
-        )
-        started_at = time.perf_counter()
-        with urllib.request.urlopen(
-            request, timeout=DEFAULT_GEMMA4_GGUF_REQUEST_TIMEOUT
-        ) as response:
-            payload = json.load(response)
+
+    def _completion_result(
+        self,
+        payload: Mapping[str, typing.Any],
+        started_at: float,
+        stream_stop: str | None = None,
+    ) -> tuple[str, dict[str, typing.Any]]:
         text = self._extract_answer_text(self._read_completion(payload))
         usage = payload.get("usage") or {}
-        self.last_generation_metrics = [
-            {
-                "durationMs": round((time.perf_counter() - started_at) * 1000, 2),
-                "completedWithEos": True,
-                "completedWithSchema": True,
-                "promptTokens": usage.get("prompt_tokens"),
-                "outputTokens": usage.get("completion_tokens"),
+        timings = payload.get("timings") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        # Newer servers report cache hits directly; older ones only say how many
+        # prompt tokens they evaluated, and the rest came from the slot's cache.
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens is None and None not in (
+            prompt_tokens,
+            timings.get("prompt_n"),
+        ):
+            cached_tokens = max(0, prompt_tokens - timings["prompt_n"])
+        # A stream cut short for runaway output never finished its object.
+        finished = stream_stop != CAPTION_STREAM_STOP_RUNAWAY
+        return text, {
+            "durationMs": round((time.perf_counter() - started_at) * 1000, 2),
+            "completedWithEos": finished,
+            "completedWithSchema": finished,
+            "promptTokens": prompt_tokens,
+            "cachedPromptTokens": cached_tokens,
+            "prefillMs": timings.get("prompt_ms"),
+            "outputTokens": usage.get("completion_tokens"),
+            "streamStop": stream_stop,
+        }
+
+    def _slot_connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._connections, "connection", None)
+        if connection is None:
+            assert self.port is not None
+            connection = http.client.HTTPConnection(
+                "127.0.0.1", self.port, timeout=DEFAULT_GEMMA4_GGUF_REQUEST_TIMEOUT
+            )
+            self._connections.connection = connection
+            self._open_connections.append(connection)
+        return connection
+
+    def _drop_connection(self) -> None:
+        connection = getattr(self._connections, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._connections.connection = None
+
+    def _stream_completion(
+        self, body: bytes
+    ) -> tuple[dict[str, typing.Any], str | None]:
+        """POST one streamed completion over this thread's kept-alive connection
+        and read it until the output runs away or the server ends it.
+
+        Content after the caption object closes is ignored, but the stream is
+        still read to the end for its usage and timings, keeping the
+        connection. A runaway closes the connection, which is how llama-server
+        learns to stop decoding for that slot. Returns the completion shaped like a
+        non-streamed payload, with the reason the stream was stopped, if any."""
+        for attempt in range(2):
+            connection = self._slot_connection()
+            try:
+                connection.request(
+                    "POST",
+                    "/v1/chat/completions",
+                    body=body,
+                    headers={"Content-Type": "application/json"},
+                )
+                response = connection.getresponse()
+                break
+            except BaseException as err:
+                self._drop_connection()
+                # The server may close an idle keep-alive connection; reconnect
+                # once. Anything else, or a second failure, is a real one.
+                if attempt or not isinstance(
+                    err, (http.client.RemoteDisconnected, ConnectionError)
+                ):
+                    raise
+        if response.status != 200:
+            raw = response.read()
+            raise RuntimeError(
+                f"llama-server returned HTTP {response.status}: "
+                f"{raw[:500].decode('utf-8', errors='replace')}"
+            )
+        content: list[str] = []
+        reasoning: list[str] = []
+        finish_reason = None
+        usage: Mapping[str, typing.Any] | None = None
+        timings: Mapping[str, typing.Any] | None = None
+        chunks = 0
+        stop = None
+        try:
+            for line in iter(response.readline, b""):
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                timings = event.get("timings") or timings
+                choice = (event.get("choices") or [{}])[0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                if stop is not None:
+                    # Past the closed object only the EOS chunk and the one
+                    # carrying usage and timings remain, so read them.
+                    continue
+                delta = choice.get("delta") or {}
+                if delta.get("reasoning_content"):
+                    reasoning.append(delta["reasoning_content"])
+                if not delta.get("content"):
+                    continue
+                content.append(delta["content"])
+                chunks += 1
+                stop = caption_stream_stop("".join(content))
+                if stop == CAPTION_STREAM_STOP_RUNAWAY:
+                    break
+        except BaseException:
+            self._drop_connection()
+            raise
+        if stop == CAPTION_STREAM_STOP_RUNAWAY:
+            self._drop_connection()
+        else:
+            # Drain the tail (the [DONE] line and chunk terminator) so the
+            # connection can be reused.
+            response.read()
+        if usage is None or stop == CAPTION_STREAM_STOP_RUNAWAY:
+            usage = {
+                **(usage or {}),
+                "completion_tokens": chunks,
             }
-        ]
+        return {
+            "choices": [
+                {
+                    "finish_reason": finish_reason,
+                    "message": {
+                        "content": "".join(content),
+                        "reasoning_content": "".join(reasoning),
+                    },
+                }
+            ],
+            "usage": usage,
+            "timings": timings,
+        }, stop
+
+    @torch.inference_mode()
+    def predict(self, path: str, geocode: Mapping | None) -> str:
+        body = self._request_bytes(path, geocode)
+        started_at = time.perf_counter()
+        payload, stop = self._stream_completion(body)
+        text, metric = self._completion_result(payload, started_at, stop)
+        self.last_generation_metrics = [metric]
         return text
 
+    def _predict_on_slot(
+        self, path: str, geocode: Mapping | None, submitted_at: float
+    ) -> tuple[str, dict[str, typing.Any]]:
+        """One request from a slot thread, over that thread's kept-alive
+        connection. The image is encoded here too, so JPEG work for request N+1
+        overlaps the server decoding request N."""
+        body = self._request_bytes(path, geocode)
+        started_at = time.perf_counter()
+        payload, stop = self._stream_completion(body)
+        text, metric = self._completion_result(payload, started_at, stop)
+        metric["queueMs"] = round((started_at - submitted_at) * 1000, 2)
+        metric["parallelSlots"] = self.parallel
+        return text, metric
+
+    def predict_batch(self, items: list[tuple[str, Mapping | None]]) -> list[str]:
+        """Keep ``parallel`` requests in flight so the server's slots decode them
+        together through continuous batching. Results and metrics come back in
+        input order; one failure cancels what has not started and re-raises."""
+        if self._slots is None or len(items) <= 1:
+            return super().predict_batch(items)
+        submitted_at = time.perf_counter()
+        futures = [
+            self._slots.submit(self._predict_on_slot, path, geocode, submitted_at)
+            for path, geocode in items
+        ]
+        try:
+            outcomes = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        self.last_generation_metrics = [metric for _, metric in outcomes]
+        return [text for text, _ in outcomes]
+
     def release(self) -> None:
         super().release()
+        if self._slots is not None:
+            self._slots.shutdown(wait=True, cancel_futures=True)
+            self._slots = None
+        for connection in self._open_connections:
+            connection.close()
+        self._open_connections = []
+        self._connections = threading.local()
+        if self._lease_fd is not None:
+            # The idle clock starts when the last run lets go.
+            os.utime(self._lease_fd)
+            os.close(self._lease_fd)
+            self._lease_fd = None
         if self._server is not None:
             self._server.terminate()
             try:
@@ -1854,11 +3667,138 @@ class Gemma4GgufClassifier(BaseCaptionClassifier):
         self._base_url = None
 
 
-class BaseImageEmbedder:
-    MODEL_ID: str
-    MODEL_REVISION: str
+def decode_near_size(image: Image.Image, width: int, height: int) -> Image.Image:
+    """Decode ``image`` at the smallest scale still covering ``width`` x ``height``
+    ``EMBEDDER_DRAFT_OVERSAMPLE`` times over.
 
-    def init_model(self) -> None:
+    A JPEG is drafted, so the DCT is decoded at 1/2, 1/4 or 1/8 scale and the
+    full-resolution pixels are never materialised. Other formats decode fully
+    and are then box-reduced by a whole factor before the processor resizes."""
+    floor_width = width * EMBEDDER_DRAFT_OVERSAMPLE
+    floor_height = height * EMBEDDER_DRAFT_OVERSAMPLE
+    if image.format == "JPEG":
+        image.draft("RGB", (floor_width, floor_height))
+    factor = min(image.width // floor_width, image.height // floor_height)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def mean_top_k_neighbour_overlap(
+    baseline: list[list[float]],
+    candidate: list[list[float]],
+    k: int = NEIGHBOUR_OVERLAP_K,
+) -> float:
+    """Mean share of each vector's ``k`` nearest cosine neighbours that survive.
+
+    The search-facing measure of two embedding sets for the same images: it is
+    what ``encode_embedding``'s int8 storage was accepted on, and what decides
+    whether "similar photos" still returns the same photos."""
+    k = min(k, len(baseline) - 1)
+    if k < 1:
+        return 1.0
+
+    def neighbours(vectors: list[list[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float64)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        similarity = matrix @ matrix.T
+        np.fill_diagonal(similarity, -np.inf)
+        return np.argsort(-similarity, axis=1, kind="stable")[:, :k]
+
+    overlaps = [
+        len(set(left) & set(right)) / k
+        for left, right in zip(neighbours(baseline), neighbours(candidate))
+    ]
+    return float(statistics.mean(overlaps))
+
+
+class ImageBatchPreprocessor:
+    """The slow Hugging Face image processor's resize-rescale-normalise, batched.
+
+    Produces bit-identical ``pixel_values``: each image is resized by the same
+    PIL call the processor makes, but into one uint8 batch buffer, and rescaling
+    and normalising then run once over the whole batch with the processor's own
+    dtypes (float64 rescale cast to float32, float32 normalise) rather than per
+    image in Python. ``for_processor`` returns ``None`` for any configuration
+    this does not reproduce, and the embedder keeps the processor."""
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        resample: int,
+        rescale_factor: float | None,
+        mean: list[float] | None,
+        std: list[float] | None,
+    ):
+        self.width = width
+        self.height = height
+        self.resample = Image.Resampling(resample)
+        self.rescale_factor = rescale_factor
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.std = None if std is None else np.asarray(std, dtype=np.float32)
+
+    @classmethod
+    def for_processor(cls, processor: typing.Any) -> ImageBatchPreprocessor | None:
+        size = getattr(processor, "size", None) or {}
+        if (
+            not getattr(processor, "do_resize", False)
+            or set(size) != {"height", "width"}
+            or getattr(processor, "resample", None) is None
+            or getattr(processor, "do_center_crop", False)
+            or getattr(processor, "do_pad", False)
+        ):
+            return None
+        do_normalize = getattr(processor, "do_normalize", False)
+        return cls(
+            width=size["width"],
+            height=size["height"],
+            resample=int(processor.resample),
+            rescale_factor=(
+                processor.rescale_factor
+                if getattr(processor, "do_rescale", False)
+                else None
+            ),
+            mean=list(processor.image_mean) if do_normalize else None,
+            std=list(processor.image_std) if do_normalize else None,
+        )
+
+    def resize(self, image: Image.Image) -> Image.Image:
+        if image.size == (self.width, self.height):
+            return image
+        return image.resize((self.width, self.height), resample=self.resample)
+
+    def pixel_values(self, images: list[Image.Image]) -> np.ndarray:
+        batch = np.empty((len(images), self.height, self.width, 3), dtype=np.uint8)
+        for position, image in enumerate(images):
+            batch[position] = np.asarray(self.resize(image.convert("RGB")))
+        if self.rescale_factor is not None:
+            values = (batch.astype(np.float64) * self.rescale_factor).astype(np.float32)
+        else:
+            values = batch.astype(np.float32)
+        if self.mean is not None and self.std is not None:
+            values = (values - self.mean) / self.std
+        return np.ascontiguousarray(values.transpose(0, 3, 1, 2))
+
+    def __call__(self, images: list[Image.Image]) -> dict[str, typing.Any]:
+        return {"pixel_values": torch.from_numpy(self.pixel_values(images))}
+
+
+# (input count, positions that opened, processor inputs or None if none did)
+PreparedImageBatch = tuple[int, list[int], Mapping[str, typing.Any] | None]
+
+
+class BaseImageEmbedder:
+    MODEL_ID: str
+    MODEL_REVISION: str
+
+    def __init__(self, draft_decode: bool = False):
+        # Requested only. Draft decoding is switched on by calibrate_draft_decode,
+        # and only once it has shown neighbour rankings survive it.
+        self.draft_decode = draft_decode
+        self.draft_decode_active = False
+
+    def init_model(self) -> None:
         self.model_id = self.MODEL_ID
         log(f"Loading image embedder {self.model_id}...")
         self.processor = AutoImageProcessor.from_pretrained(
@@ -1869,42 +3809,163 @@ class BaseImageEmbedder:
         )
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model = self.model.to(self.device).eval()
+        self.preprocessor = ImageBatchPreprocessor.for_processor(self.processor)
+        self.derivative_spec = embedder_derivative_spec(self.processor)
+        if self.derivative_spec is not None and _DERIVATIVES is not None:
+            _DERIVATIVES.want(self.derivative_spec)
         log(f"Loaded image embedder {self.model_id} on {self.device}.")
 
     @torch.inference_mode()
     def predict_image_embedding(self, path: str) -> list[float]:
         return self.predict_image_embeddings_batch([path])[0]
 
+    def _input_size(self) -> tuple[int, int] | None:
+        size = getattr(self.processor, "size", None) or {}
+        if set(size) != {"height", "width"}:
+            return None
+        return size["width"], size["height"]
+
+    def _open_image(
+        self, path: str, draft: bool, derivatives: bool = True
+    ) -> Image.Image | None:
+        # A single truncated/corrupt file must not abort the whole GPU run, so an
+        # unreadable image yields None (aligned to its input position) instead of
+        # raising; the caller skips None entries.
+        spec = getattr(self, "derivative_spec", None) if derivatives else None
+        try:
+            pixels = pixel_source_for(path)
+            derivative = load_derivative(pixels, spec) if spec else None
+            if derivative is not None:
+                width, height = (int(value) for value in spec.split("-")[1].split("x"))
+                return Image.frombytes("RGB", (width, height), derivative)
+            image = Image.open(source_image_input(pixels))
+            target = self._input_size() if draft else None
+            if target is not None:
+                image = decode_near_size(image, *target)
+            image = image.convert("RGB")
+            # Shrink on this worker thread, so a batch never holds its
+            # full-resolution decodes at once.
+            preprocessor = getattr(self, "preprocessor", None)
+            return preprocessor.resize(image) if preprocessor else image
+        except (OSError, ValueError) as err:
+            log(f"Skipping unreadable image {path}: {err}")
+            return None
+
+    def _open_images(
+        self, paths: list[str], draft: bool, derivatives: bool = True
+    ) -> list[Image.Image | None]:
+        # Thread image opens — JPEG decode releases the GIL (~2.5x vs serial for large files).
+        return executor_lane("decode").map(
+            lambda path: self._open_image(path, draft, derivatives), paths
+        )
+
     @torch.inference_mode()
     def predict_image_embeddings_batch(
         self, paths: list[str]
     ) -> list[list[float] | None]:
-        # Thread image opens — JPEG decode releases the GIL (~2.5x vs serial for large files).
-        # A single truncated/corrupt file must not abort the whole GPU run, so an
-        # unreadable image yields None (aligned to its input position) instead of
-        # raising; the caller skips None entries.
-        def _open(path: str) -> Image.Image | None:
-            try:
-                return Image.open(pixel_source_for(path)).convert("RGB")
-            except (OSError, ValueError) as err:
-                log(f"Skipping unreadable image {path}: {err}")
-                return None
+        return self.embed_prepared_batch(self.prepare_image_batch(paths))
+
+    def prepare_image_batch(self, paths: list[str]) -> PreparedImageBatch:
+        """Decode and preprocess one batch: the CPU half, safe off the main thread."""
+        return self._preprocess_images(
+            self._open_images(paths, draft=self.draft_decode_active)
+        )
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as ex:
-            opened = list(ex.map(_open, paths))
+    def draft_decode_skip_reason(self, path_count: int) -> str | None:
+        """Why calibrating draft decoding for a pass would be wasted, if it would.
 
-        results: list[list[float] | None] = [None] * len(paths)
-        valid = [(i, img) for i, img in enumerate(opened) if img is not None]
+        Inputs served from the derivative cache were rendered from a full
+        decode, so the draft path is never taken. With no more images than the
+        top-k neighbourhood, the gate can never enable."""
+        if getattr(self, "derivative_spec", None) and _DERIVATIVES is not None:
+            return "inputs come from the derivative cache"
+        if path_count <= NEIGHBOUR_OVERLAP_K:
+            return f"{path_count} image(s) are too few to measure neighbour overlap"
+        return None
+
+    def calibrate_draft_decode(
+        self, paths: list[str], sample_size: int = EMBEDDER_DRAFT_CALIBRATION_SIZE
+    ) -> dict[str, typing.Any]:
+        """Enable draft decoding for this pass only if it keeps neighbour rankings.
+
+        Embeds an evenly spread sample of ``paths`` from both full and draft
+        decodes (never from derivatives, which would make the two identical) and
+        compares their mean top-10 neighbour overlap with
+        ``EMBEDDER_DRAFT_MIN_NEIGHBOUR_OVERLAP``. Below it, or with too few
+        readable images to measure, the pass decodes at full resolution."""
+        step = max(1, len(paths) // sample_size)
+        sample = paths[::step][:sample_size]
+        started_at = time.perf_counter()
+        full = self._embed_images(self._open_images(sample, False, derivatives=False))
+        full_ms = (time.perf_counter() - started_at) * 1000
+        started_at = time.perf_counter()
+        draft = self._embed_images(self._open_images(sample, True, derivatives=False))
+        draft_ms = (time.perf_counter() - started_at) * 1000
+        pairs = [
+            (left, right)
+            for left, right in zip(full, draft)
+            if left is not None and right is not None
+        ]
+        gate: dict[str, typing.Any] = {
+            "sampleSize": len(pairs),
+            "threshold": EMBEDDER_DRAFT_MIN_NEIGHBOUR_OVERLAP,
+            "fullMs": round(full_ms, 2),
+            "draftMs": round(draft_ms, 2),
+            "meanTopKNeighbourOverlap": None,
+            "enabled": False,
+        }
+        if len(pairs) > NEIGHBOUR_OVERLAP_K:
+            overlap = mean_top_k_neighbour_overlap(
+                [left for left, _ in pairs], [right for _, right in pairs]
+            )
+            gate["meanTopKNeighbourOverlap"] = round(overlap, 4)
+            gate["enabled"] = overlap >= EMBEDDER_DRAFT_MIN_NEIGHBOUR_OVERLAP
+        self.draft_decode_active = gate["enabled"]
+        log(
+            f"{self.model_id} draft decode "
+            f"{'enabled' if gate['enabled'] else 'disabled'}: {gate}"
+        )
+        return gate
+
+    @torch.inference_mode()
+    def _embed_images(
+        self, opened: list[Image.Image | None]
+    ) -> list[list[float] | None]:
+        return self.embed_prepared_batch(self._preprocess_images(opened))
+
+    def _preprocess_images(
+        self, opened: list[Image.Image | None]
+    ) -> PreparedImageBatch:
+        valid = [position for position, img in enumerate(opened) if img is not None]
         if not valid:
-            return results
+            return len(opened), valid, None
+        images = [opened[position] for position in valid]
+        preprocessor = getattr(self, "preprocessor", None)
+        inputs = (
+            preprocessor(images)
+            if preprocessor is not None
+            else self.processor(images=images, return_tensors="pt")
+        )
+        return len(opened), valid, inputs
+
+    @torch.inference_mode()
+    def embed_prepared_batch(
+        self, prepared: PreparedImageBatch
+    ) -> list[list[float] | None]:
+        """The device half: one forward pass over a prepared batch.
 
-        inputs = self.processor(images=[img for _, img in valid], return_tensors="pt")
+        Aligned to the batch's input paths, with ``None`` wherever an image
+        could not be opened."""
+        count, valid, inputs = prepared
+        results: list[list[float] | None] = [None] * count
+        if inputs is None:
+            return results
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
         features = self.model.get_image_features(**inputs)
         # Normalise for cosine similarity; store as float list for SQLite JSON.
         features = torch.nn.functional.normalize(features, p=2, dim=-1)
         vectors = features.detach().float().cpu().tolist()
-        for (position, _), vector in zip(valid, vectors):
+        for position, vector in zip(valid, vectors):
             results[position] = vector
         return results
 
@@ -1912,6 +3973,7 @@ class BaseImageEmbedder:
         """Free the embedder's GPU weights so the next pass loads into a clear card."""
         self.model = None
         self.processor = None
+        self.preprocessor = None
         gc.collect()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -1927,6 +3989,145 @@ class Siglip2Embedder(BaseImageEmbedder):
     MODEL_REVISION = SIGLIP_V2_MODEL_REVISION
 
 
+# Per-image latency the stub backends simulate, and the time they have spent
+# simulating it. Set and read by benchmark-pipeline.
+_STUB_LATENCY_MS = {"caption": 0.0, "embedding": 0.0}
+_STUB_MODEL_MS = {"caption": 0.0, "embedding": 0.0}
+STUB_EMBEDDING_DIM = 768
+STUB_CAPTION_WORDS = (
+    "street",
+    "harbour",
+    "mountain",
+    "temple",
+    "market",
+    "train",
+    "forest",
+    "sunset",
+)
+
+
+def configure_stub_backends(caption_ms: float, embedding_ms: float) -> None:
+    """Set the stub backends' per-image latency and zero their model time."""
+    _STUB_LATENCY_MS.update({"caption": caption_ms, "embedding": embedding_ms})
+    _STUB_MODEL_MS.update({"caption": 0.0, "embedding": 0.0})
+
+
+def stub_backend_model_ms() -> dict[str, float]:
+    return {kind: round(ms, 2) for kind, ms in _STUB_MODEL_MS.items()}
+
+
+def simulate_stub_model(kind: str, images: int) -> None:
+    started_at = time.perf_counter()
+    time.sleep(_STUB_LATENCY_MS[kind] * images / 1000)
+    _STUB_MODEL_MS[kind] += (time.perf_counter() - started_at) * 1000
+
+
+class StubCaptionClassifier(BaseCaptionClassifier):
+    """A captioner that loads nothing and answers after a set latency.
+
+    Tags are picked from the file name's digest, so a path always gets the
+    same caption, and every reply completes with EOS."""
+
+    backend = CLASSIFIER_BACKEND_STUB
+    model_id = "stub"
+    quantization = None
+
+    def __init__(
+        self, batch_size: int = 1, max_new_tokens: int = CAPTION_MAX_NEW_TOKENS
+    ):
+        super().__init__()
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self.batch_max_new_tokens = max_new_tokens
+
+    def init_model(self) -> None:
+        pass
+
+    def predict(self, path: str, geocode: Mapping | None) -> str:
+        started_at = time.perf_counter()
+        simulate_stub_model("caption", 1)
+        seed = hashlib.sha256(os.path.basename(path).encode("utf-8")).digest()
+        tags = list(
+            dict.fromkeys(
+                STUB_CAPTION_WORDS[byte % len(STUB_CAPTION_WORDS)] for byte in seed[:3]
+            )
+        )
+        self.last_generation_metrics = [
+            {
+                "durationMs": round((time.perf_counter() - started_at) * 1000, 2),
+                "completedWithEos": True,
+                "tokenCount": 8 * len(tags),
+                "hitTokenLimit": False,
+            }
+        ]
+        return json.dumps({"tags": tags, "alt_text": f"A {tags[0]} scene."})
+
+
+class StubImageEmbedder(BaseImageEmbedder):
+    """An embedder with the real decode and a simulated forward pass.
+
+    Images are opened, decoded and batched exactly as for SigLIP, so the decode
+    lane and prefetching are measured. The forward pass is a set latency per
+    image and a unit vector seeded from the decoded pixels, so the same library
+    always embeds the same way. It stores under the model id it stands in for,
+    so the index plans and records its stage as it would the real one."""
+
+    MODEL_REVISION = "stub"
+
+    def __init__(self, model_id: str):
+        super().__init__()
+        self.MODEL_ID = model_id
+
+    def init_model(self) -> None:
+        self.model_id = self.MODEL_ID
+        self.processor = None
+        self.preprocessor = None
+
+    def _preprocess_images(
+        self, opened: list[Image.Image | None]
+    ) -> PreparedImageBatch:
+        valid = [position for position, img in enumerate(opened) if img is not None]
+        images = [opened[position] for position in valid]
+        return len(opened), valid, images or None
+
+    def embed_prepared_batch(
+        self, prepared: PreparedImageBatch
+    ) -> list[list[float] | None]:
+        count, valid, images = prepared
+        results: list[list[float] | None] = [None] * count
+        if images is None:
+            return results
+        simulate_stub_model("embedding", len(images))
+        for position, image in zip(valid, images):
+            thumbnail = image.resize((8, 8), resample=Image.Resampling.BOX).tobytes()
+            seed = int.from_bytes(hashlib.sha256(thumbnail).digest()[:8], "big")
+            vector = np.random.default_rng(seed).standard_normal(STUB_EMBEDDING_DIM)
+            results[position] = (vector / np.linalg.norm(vector)).tolist()
+        return results
+
+
+def create_embedder(
+    embedder_class: type[BaseImageEmbedder],
+    backend: str = EMBEDDER_BACKEND_SIGLIP,
+    draft_decode: bool = False,
+) -> BaseImageEmbedder:
+    """The embedder that fills ``embedder_class``'s stage on ``backend``."""
+    if backend == EMBEDDER_BACKEND_STUB:
+        return StubImageEmbedder(embedder_class.MODEL_ID)
+    if backend == EMBEDDER_BACKEND_SIGLIP:
+        return embedder_class(draft_decode=draft_decode)
+    raise ValueError(f"Unsupported embedder backend: {backend}")
+
+
+def default_caption_max_new_tokens(backend: str) -> int:
+    """The single-caption token cap a backend runs at when none is given."""
+    if backend == CLASSIFIER_BACKEND_GEMMA4:
+        return GEMMA4_MAX_NEW_TOKENS
+    if backend == CLASSIFIER_BACKEND_GEMMA4_GGUF:
+        return DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS
+    return CAPTION_MAX_NEW_TOKENS
+
+
 def create_classifier(
     backend: str,
     model_id: str | None = None,
@@ -1936,6 +4137,15 @@ def create_classifier(
     batch_max_new_tokens: int | None = None,
     gpu_headroom_gb: float | None = None,
     low_impact: bool = False,
+    parallel: int | None = None,
+    persistent: bool = False,
+    idle_timeout_seconds: float | None = None,
+    prompt_first: bool = False,
+    static_cache: bool = False,
+    threads: int | None = None,
+    ctx_size: int | None = None,
+    image_min_tokens: int | None = None,
+    image_max_tokens: int | None = None,
 ) -> BaseCaptionClassifier:
     if backend == CLASSIFIER_BACKEND_GEMMA4:
         return Gemma4Classifier(
@@ -1949,6 +4159,9 @@ def create_classifier(
             max_new_tokens=max_new_tokens or GEMMA4_MAX_NEW_TOKENS,
             gpu_headroom_gb=gpu_headroom_gb,
             low_impact=low_impact,
+            prompt_first=prompt_first,
+            batch_max_new_tokens=batch_max_new_tokens or CAPTION_BATCH_MAX_NEW_TOKENS,
+            static_cache=static_cache,
         )
 
     if backend == CLASSIFIER_BACKEND_GEMMA4_GGUF:
@@ -1959,6 +4172,24 @@ def create_classifier(
             max_new_tokens=max_new_tokens or DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS,
             gpu_headroom_gb=gpu_headroom_gb,
             low_impact=low_impact,
+            parallel=parallel or DEFAULT_GEMMA4_GGUF_PARALLEL,
+            persistent=persistent,
+            idle_timeout_seconds=(
+                idle_timeout_seconds
+                if idle_timeout_seconds is not None
+                else CAPTION_SERVER_IDLE_MINUTES * 60
+            ),
+            prompt_first=prompt_first,
+            threads=threads,
+            ctx_size=ctx_size,
+            image_min_tokens=image_min_tokens,
+            image_max_tokens=image_max_tokens,
+        )
+
+    if backend == CLASSIFIER_BACKEND_STUB:
+        return StubCaptionClassifier(
+            batch_size=batch_size or 1,
+            max_new_tokens=max_new_tokens or CAPTION_MAX_NEW_TOKENS,
         )
 
     raise ValueError(f"Unsupported classifier backend: {backend}")
@@ -2098,7 +4329,7 @@ def prepare_colour_thumbnail(
     materialised; ``thumbnail`` then bounds non-JPEG inputs too. Median-cut colour
     clustering does not need the source's multi-megapixel spatial resolution.
     """
-    with Image.open(pixel_source_for(path)) as image:
+    with Image.open(source_image_input(pixel_source_for(path))) as image:
         image.draft("RGB", (max_dimension, max_dimension))
         image.thumbnail((max_dimension, max_dimension), resample=Image.Resampling.BOX)
         return np.array(image.convert("RGBA"), dtype=np.uint8)
@@ -2116,7 +4347,7 @@ def extract_colour_palette(path: str) -> list[tuple[int, int, int]]:
     the speedup buys no measurable wall-clock on a full index. See
     ``benchmark-colours`` for the comparison.
     """
-    return fast_colorthief.get_palette(pixel_source_for(path))
+    return fast_colorthief.get_palette(source_image_input(pixel_source_for(path)))
 
 
 def extract_thumbnail_colour_palette(
@@ -2361,7 +4592,9 @@ class Sqlite3Client:
             "completed_with_json INTEGER, completed_with_schema INTEGER, "
             "hit_token_limit INTEGER, parse_success INTEGER, oom_fallback INTEGER, "
             "decode_ms REAL, processor_ms REAL, vision_preparation_ms REAL, "
-            "generate_batch_ms REAL)"
+            "generate_batch_ms REAL, prompt_tokens INTEGER, "
+            "cached_prompt_tokens INTEGER, prefill_ms REAL, stream_stop TEXT, "
+            "planned_batch_size INTEGER)"
         )
         cur.execute(
             "CREATE INDEX IF NOT EXISTS idx_caption_generation_metrics_path "
@@ -2383,6 +4616,18 @@ class Sqlite3Client:
                 "ALTER TABLE caption_generation_metrics "
                 "ADD COLUMN completed_with_schema INTEGER"
             )
+        for column, column_type in (
+            ("prompt_tokens", "INTEGER"),
+            ("cached_prompt_tokens", "INTEGER"),
+            ("prefill_ms", "REAL"),
+            ("stream_stop", "TEXT"),
+            ("planned_batch_size", "INTEGER"),
+        ):
+            if column not in metric_columns:
+                cur.execute(
+                    "ALTER TABLE caption_generation_metrics "
+                    f"ADD COLUMN {column} {column_type}"
+                )
         cur.execute(EMBEDDINGS_TABLE_SQL)
         # Rebuild older embeddings schemas in place. Two legacy shapes exist:
         # PRIMARY KEY(path) only (pre v1+v2 coexistence) and JSON-text vectors
@@ -2643,8 +4888,9 @@ class Sqlite3Client:
             "path, pipeline_version, attempted_at, attempt, batch_size, max_new_tokens, "
             "token_count, completed_with_eos, completed_with_json, completed_with_schema, "
             "hit_token_limit, parse_success, oom_fallback, decode_ms, processor_ms, "
-            "vision_preparation_ms, generate_batch_ms) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            "vision_preparation_ms, generate_batch_ms, prompt_tokens, "
+            "cached_prompt_tokens, prefill_ms, stream_stop, planned_batch_size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             [
                 (
                     metric["path"],
@@ -2664,6 +4910,11 @@ class Sqlite3Client:
                     metric.get("processorMs"),
                     metric.get("visionPreparationMs"),
                     metric.get("generateBatchMs"),
+                    metric.get("promptTokens"),
+                    metric.get("cachedPromptTokens"),
+                    metric.get("prefillMs"),
+                    metric.get("streamStop"),
+                    metric.get("plannedBatchSize"),
                 )
                 for metric in rows
             ],
@@ -2723,6 +4974,31 @@ class Sqlite3Client:
             return set()
         return {row[0] for row in self.con.execute("SELECT path FROM metadata")}
 
+    def list_capture_times(self) -> dict[str, str | None]:
+        if not self.table_exists("metadata"):
+            return {}
+        return dict(self.con.execute("SELECT path, iso8601 FROM metadata"))
+
+    def copy_caption(self, donor: str, path: str, cur: sqlite3.Cursor) -> bool:
+        """Give ``path`` the caption and classifier tags ``donor`` has now."""
+        row = cur.execute(
+            "SELECT alt_text, tags FROM images WHERE path = ?", (donor,)
+        ).fetchone()
+        if row is None or not (row[0] or row[1]):
+            return False
+        tags = [
+            tag
+            for (tag,) in cur.execute(
+                "SELECT tag FROM image_tags WHERE path = ? AND source = 'classifier'",
+                (donor,),
+            ).fetchall()
+        ]
+        self.upsert_image_fields(
+            path, {"alt_text": row[0], "subject": None, "tags": row[1]}, cur=cur
+        )
+        self.replace_tags_for_source(path, tags, "classifier", cur)
+        return True
+
     def _split_embeddings_path(self) -> str | None:
         """The sibling database ``do-full-index.sh`` moves the embeddings into.
 
@@ -3172,6 +5448,126 @@ def cli(ctx):
     ctx.ensure_object(dict)
 
 
+def persist_embedding_results(
+    model_id: str,
+    batch_paths: list[str],
+    batch_embeddings: list[list[float] | None],
+    precomputed_embeddings: dict[str, dict[str, list[float]]],
+    persist_batch: typing.Callable[[str, list[tuple[str, list[float]]]], None] | None,
+    collect: bool,
+) -> None:
+    """Hand one embedded batch to ``persist_batch`` and, if ``collect``, the dict."""
+    if len(batch_embeddings) != len(batch_paths):
+        log(
+            f"WARNING: {model_id} returned {len(batch_embeddings)} "
+            f"embedding(s) for {len(batch_paths)} path(s)"
+        )
+    completed_batch = []
+    for position, path in enumerate(batch_paths):
+        embedding = (
+            batch_embeddings[position] if position < len(batch_embeddings) else None
+        )
+        # None ⇒ the image could not be opened (already logged); skip it so a
+        # single corrupt file does not abort or misalign the pass.
+        if embedding is None:
+            continue
+        completed_batch.append((path, embedding))
+        if collect:
+            precomputed_embeddings.setdefault(path, {})[model_id] = embedding
+    if persist_batch and completed_batch:
+        persist_batch(model_id, completed_batch)
+
+
+class EmbeddingPrefetcher:
+    """Decode upcoming embedding batches while the current one is on the device.
+
+    Up to ``depth`` batches are prepared (decoded and preprocessed) ahead on one
+    worker thread, which fans each decode out over the embedder's own open pool,
+    while the caller's thread runs forward passes. ``depth`` 0, or an embedder
+    without a prepare/embed split, embeds each batch serially as before.
+
+    ``stats()`` reports how much decoding the device work hid: ``decodeMs`` is
+    worker time spent preparing, ``waitMs`` is how long the device side sat
+    waiting for a prepared batch, and ``overlap`` is the share of decode time
+    that was not waited on."""
+
+    def __init__(
+        self,
+        embedder: typing.Any,
+        batches: list[list[str]],
+        depth: int = EMBEDDER_PREFETCH_DEPTH,
+    ):
+        self.embedder = embedder
+        self.batches = batches
+        self.depth = max(0, depth)
+        if not hasattr(embedder, "prepare_image_batch"):
+            self.depth = 0
+        self.executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self.futures: dict[int, concurrent.futures.Future] = {}
+        self.decode_ms = 0.0
+        self.wait_ms = 0.0
+        self.device_ms = 0.0
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> typing.Self:
+        if self.depth:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="embedding-prefetch"
+            )
+            for batch_index in range(min(self.depth, len(self.batches))):
+                self._submit(batch_index)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _prepare(self, batch_index: int) -> PreparedImageBatch:
+        started_at = time.perf_counter()
+        try:
+            return self.embedder.prepare_image_batch(self.batches[batch_index])
+        finally:
+            with self.lock:
+                self.decode_ms += (time.perf_counter() - started_at) * 1000
+
+    def _submit(self, batch_index: int) -> None:
+        if self.executor is not None and batch_index < len(self.batches):
+            self.futures[batch_index] = self.executor.submit(self._prepare, batch_index)
+
+    def embed(self, batch_index: int) -> list[list[float] | None]:
+        """Embeddings for ``batches[batch_index]``; call in batch order."""
+        if not self.depth:
+            started_at = time.perf_counter()
+            embeddings = self.embedder.predict_image_embeddings_batch(
+                self.batches[batch_index]
+            )
+            self.device_ms += (time.perf_counter() - started_at) * 1000
+            return embeddings
+        waited_at = time.perf_counter()
+        prepared = self.futures.pop(batch_index).result()
+        self.wait_ms += (time.perf_counter() - waited_at) * 1000
+        self._submit(batch_index + self.depth)
+        started_at = time.perf_counter()
+        embeddings = self.embedder.embed_prepared_batch(prepared)
+        self.device_ms += (time.perf_counter() - started_at) * 1000
+        return embeddings
+
+    def stats(self) -> dict[str, typing.Any]:
+        with self.lock:
+            decode_ms = self.decode_ms
+        return {
+            "depth": self.depth,
+            "decodeMs": round(decode_ms, 2),
+            "waitMs": round(self.wait_ms, 2),
+            "deviceMs": round(self.device_ms, 2),
+            "overlap": (
+                round(max(0.0, 1 - self.wait_ms / decode_ms), 3)
+                if self.depth and decode_ms
+                else 0.0
+            ),
+        }
+
+
 def run_embedding_pass(
     embedder: BaseImageEmbedder,
     paths: list[str],
@@ -3181,72 +5577,97 @@ def run_embedding_pass(
     collect: bool = True,
     batch_size: int = EMBEDDER_BATCH_SIZE,
     timings: dict[str, dict[str, float]] | None = None,
+    prefetch_depth: int = EMBEDDER_PREFETCH_DEPTH,
+    vram_pause_seconds: float | None = None,
+    vram_pauses: list[float] | None = None,
 ) -> float:
     """Load one embedder, embed all ``paths`` in batches, store results, release it.
 
     Holds only this single embedder in VRAM — the caller releases the previous
     model first — so peak stays at one model. Mutates ``precomputed_embeddings``
-    in place (path → {model_id: vector}) and returns the model-load time in ms."""
-    load_started_at = time.perf_counter()
-    embedder.init_model()
-    load_ms = (time.perf_counter() - load_started_at) * 1000
-    log_vram(f"{embedder.model_id} load")
-
-    batch_size = max(1, batch_size)
-    total_emb_batches = math.ceil(len(paths) / batch_size)
-    log(
-        f"Running {embedder.model_id} embeddings in batches of {batch_size} "
-        f"({len(paths)} images, {total_emb_batches} batch(es))..."
+    in place (path → {model_id: vector}) and returns the model-load time in ms.
+    The next ``prefetch_depth`` batches decode while each one is on the device;
+    batches are still persisted one at a time, in order. With
+    ``vram_pause_seconds`` each batch waits out an oversubscribed card."""
+    # The decode lane and torch's intra-op pool share the pass's cores, and the
+    # lane grows into whatever background colour work hands back.
+    apply_torch_threads(
+        claim_cores(
+            "embedding", apply=lambda threads: executor_lane("decode").resize(threads)
+        )
     )
-    emb_started_at = time.perf_counter()
-    for emb_batch_index, batch_start in enumerate(
-        range(0, len(paths), batch_size), start=1
-    ):
-        batch_paths = paths[batch_start : batch_start + batch_size]
+    try:
+        load_started_at = time.perf_counter()
+        embedder.init_model()
+        load_ms = (time.perf_counter() - load_started_at) * 1000
+        log_vram(f"{embedder.model_id} load")
+        draft_gate = None
+        if getattr(embedder, "draft_decode", False):
+            skip_reason = embedder.draft_decode_skip_reason(len(paths))
+            if skip_reason is None:
+                draft_gate = embedder.calibrate_draft_decode(paths)
+            else:
+                log(f"{embedder.model_id} draft decode not calibrated: {skip_reason}")
+                draft_gate = {"enabled": False, "skipped": skip_reason}
+
+        batch_size = max(1, batch_size)
+        total_emb_batches = math.ceil(len(paths) / batch_size)
         log(
-            f"  {embedder.model_id} batch {emb_batch_index}/{total_emb_batches} starting ({len(batch_paths)} images)..."
+            f"Running {embedder.model_id} embeddings in batches of {batch_size} "
+            f"({len(paths)} images, {total_emb_batches} batch(es))..."
         )
-        single_started_at = time.perf_counter()
-        with heartbeat(
-            f"{embedder.model_id} batch {emb_batch_index}/{total_emb_batches}"
-        ):
-            batch_embeddings = embedder.predict_image_embeddings_batch(batch_paths)
-        if len(batch_embeddings) != len(batch_paths):
-            log(
-                f"WARNING: {embedder.model_id} returned {len(batch_embeddings)} "
-                f"embedding(s) for {len(batch_paths)} path(s)"
-            )
-        completed_batch = []
-        for position, path in enumerate(batch_paths):
-            embedding = (
-                batch_embeddings[position] if position < len(batch_embeddings) else None
-            )
-            # None ⇒ the image could not be opened (already logged); skip it so a
-            # single corrupt file does not abort or misalign the pass.
-            if embedding is None:
-                continue
-            completed_batch.append((path, embedding))
-            if collect:
-                precomputed_embeddings.setdefault(path, {})[embedder.model_id] = (
-                    embedding
+        emb_started_at = time.perf_counter()
+        batches = [
+            paths[batch_start : batch_start + batch_size]
+            for batch_start in range(0, len(paths), batch_size)
+        ]
+        prefetcher = EmbeddingPrefetcher(embedder, batches, depth=prefetch_depth)
+        with prefetcher:
+            for emb_batch_index, batch_paths in enumerate(batches, start=1):
+                log(
+                    f"  {embedder.model_id} batch {emb_batch_index}/{total_emb_batches} starting ({len(batch_paths)} images)..."
                 )
-        if persist_batch and completed_batch:
-            persist_batch(embedder.model_id, completed_batch)
-        single_ms = (time.perf_counter() - single_started_at) * 1000
-        done = min(batch_start + batch_size, len(paths))
-        log(
-            f"  {embedder.model_id} batch {emb_batch_index}/{total_emb_batches} done in {single_ms:.0f}ms ({done}/{len(paths)} images)"
-        )
-    emb_ms = (time.perf_counter() - emb_started_at) * 1000
-    if timings is not None:
-        timings[embedder.model_id] = {
-            "loadMs": round(load_ms, 2),
-            "inferenceMs": round(emb_ms, 2),
-        }
-    log(f"{embedder.model_id} embeddings complete in {emb_ms:.0f}ms")
-    log_vram(f"{embedder.model_id} inference")
-    embedder.release()
-    return load_ms
+                single_started_at = time.perf_counter()
+                with heartbeat(
+                    f"{embedder.model_id} batch {emb_batch_index}/{total_emb_batches}"
+                ):
+                    batch_embeddings = prefetcher.embed(emb_batch_index - 1)
+                persist_embedding_results(
+                    embedder.model_id,
+                    batch_paths,
+                    batch_embeddings,
+                    precomputed_embeddings,
+                    persist_batch,
+                    collect,
+                )
+                # Embeddings have never stopped on low headroom; only a run that
+                # asked to pause checks for it, after the batch is persisted.
+                if vram_pause_seconds is not None:
+                    enforce_vram_headroom(
+                        f"{embedder.model_id} batch "
+                        f"{emb_batch_index}/{total_emb_batches}",
+                        vram_pause_seconds,
+                        vram_pauses,
+                    )
+                single_ms = (time.perf_counter() - single_started_at) * 1000
+                done = min(emb_batch_index * batch_size, len(paths))
+                log(
+                    f"  {embedder.model_id} batch {emb_batch_index}/{total_emb_batches} done in {single_ms:.0f}ms ({done}/{len(paths)} images)"
+                )
+        emb_ms = (time.perf_counter() - emb_started_at) * 1000
+        if timings is not None:
+            timings[embedder.model_id] = {
+                "loadMs": round(load_ms, 2),
+                "inferenceMs": round(emb_ms, 2),
+                "draftDecode": draft_gate,
+                "prefetch": prefetcher.stats(),
+            }
+        log(f"{embedder.model_id} embeddings complete in {emb_ms:.0f}ms")
+        log_vram(f"{embedder.model_id} inference")
+        embedder.release()
+        return load_ms
+    finally:
+        release_cores("embedding")
 
 
 @cli.command("index")
@@ -3304,7 +5725,39 @@ def run_embedding_pass(
     "--classifier-batch-size",
     default=None,
     type=click.IntRange(min=1),
-    help="Optional caption batch size override. Defaults to 1.",
+    help="Optional caption batch size override. Defaults to 1. With --classifier-adaptive-batch, the largest batch allowed (default 8).",
+)
+@click.option(
+    "--classifier-adaptive-batch",
+    is_flag=True,
+    default=False,
+    help="gemma4 only: size each caption batch from the VRAM the previous one left free. Changes the caption pipeline version once, to batch=adaptive.",
+)
+@click.option(
+    "--classifier-parallel",
+    default=DEFAULT_GEMMA4_GGUF_PARALLEL,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="gemma4-gguf only: llama-server slots to keep busy at once. Each caption batch is widened to at least this many images.",
+)
+@click.option(
+    "--classifier-prompt-first",
+    is_flag=True,
+    default=False,
+    help="Send the caption prompt before the image so every request shares a cacheable prefix. Changes the caption pipeline version.",
+)
+@click.option(
+    "--classifier-keep-server",
+    is_flag=True,
+    default=False,
+    help="gemma4-gguf only: leave llama-server running after the run and attach to it next time if it serves the same model. Stop it with `caption-server stop`.",
+)
+@click.option(
+    "--classifier-server-idle-minutes",
+    default=CAPTION_SERVER_IDLE_MINUTES,
+    type=click.FloatRange(min=0, min_open=True),
+    show_default=True,
+    help="Stop a kept llama-server after it has gone unused for this long.",
 )
 @click.option(
     "--classifier-max-new-tokens",
@@ -3318,6 +5771,31 @@ def run_embedding_pass(
     type=click.IntRange(min=32),
     help="Optional batched generation-token cap. Defaults to 128; incomplete rows retry singly at the single cap.",
 )
+@click.option(
+    "--classifier-learned-token-budget",
+    is_flag=True,
+    default=False,
+    help=f"gemma4 only: take the batched generation-token cap from the {CAPTION_TOKEN_BUDGET_FILENAME} that `caption-token-budget --apply` wrote beside the DB.",
+)
+@click.option(
+    "--classifier-retry-batch-size",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Batch size for the sweep that retries, after all other captions, the ones that failed to parse or reach EOS. Above 1 changes the caption pipeline version.",
+)
+@click.option(
+    "--classifier-retry-max-new-tokens",
+    default=None,
+    type=click.IntRange(min=32),
+    help="Generation-token cap for caption retries. Defaults to the single cap; a different value changes the caption pipeline version.",
+)
+@click.option(
+    "--classifier-image-tokens",
+    default=None,
+    type=click.Choice([str(tier) for tier in GEMMA4_GGUF_IMAGE_TOKEN_TIERS]),
+    help="gemma4-gguf only: the most vision tokens an image is encoded to. Defaults to the mmproj's own budget; a tier changes the caption pipeline version. Gate it with benchmark-caption-quality --image-tokens first.",
+)
 @click.option(
     "--classifier-gpu-headroom-gb",
     default=None,
@@ -3330,29 +5808,173 @@ def run_embedding_pass(
     default=False,
     help="Low-impact Gemma mode: keep some GPU memory free and prefer CPU offload for background runs.",
 )
+@click.option(
+    "--classifier-static-cache",
+    is_flag=True,
+    default=False,
+    help="gemma4 only: generate with a preallocated static KV cache instead of a growing one.",
+)
+@click.option(
+    "--classifier-reuse-near-duplicates",
+    is_flag=True,
+    default=False,
+    help="Copy the caption of an already-captioned near-duplicate (a burst frame or lightly edited re-export, matched by capture time and perceptual hash) instead of captioning the photo. Reused captions are marked in their pipeline version.",
+)
+@click.option(
+    "--classifier-reuse-window-seconds",
+    default=CAPTION_REUSE_WINDOW_SECONDS,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Largest capture-time gap between a photo and the one whose caption it reuses.",
+)
+@click.option(
+    "--classifier-reuse-max-distance",
+    default=CAPTION_REUSE_MAX_DISTANCE,
+    type=click.IntRange(0, 64),
+    show_default=True,
+    help="Most of the 64 perceptual-hash bits a photo may differ by from the one whose caption it reuses.",
+)
 @click.option(
     "--media-root",
     default=DEFAULT_MEDIA_ROOT,
     show_default=True,
     help="Public album cache holding video poster frames and their sidecars.",
 )
-def index(
-    glob: str,
-    dbpath: str,
-    dry_run: bool,
-    model_profile: str,
-    benchmark_output: str | None,
-    embedding_batch_size: int,
-    classifier_backend: str,
-    classifier_model_id: str | None,
-    classifier_quantization: str | None,
-    classifier_batch_size: int | None,
-    classifier_max_new_tokens: int | None,
+@click.option(
+    "--verify-digests",
+    is_flag=True,
+    default=False,
+    help="Re-hash every source instead of trusting the digest cache for unchanged files.",
+)
+@click.option(
+    "--source-cache-mb",
+    default=SOURCE_BYTE_CACHE_MB,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="Hold up to this many MB of source files in memory so each is read from disk once per run (0 disables).",
+)
+@click.option(
+    "--derivative-cache-mb",
+    default=DERIVATIVE_CACHE_MB,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help=f"Keep up to this many MB of downsized model inputs in {DERIVATIVE_CACHE_FILENAME} beside the DB, so reruns skip full-resolution decodes (0 disables).",
+)
+@click.option(
+    "--embedder-draft-decode",
+    is_flag=True,
+    default=False,
+    help="Decode SigLIP inputs near 224px instead of at full resolution, if a calibration sample keeps mean top-10 neighbour overlap at or above the threshold. Only takes effect with --derivative-cache-mb 0; calibration is skipped while the derivative cache serves the inputs, or for a pass of 10 images or fewer.",
+)
+@click.option(
+    "--embedding-prefetch-depth",
+    default=EMBEDDER_PREFETCH_DEPTH,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="SigLIP batches to decode ahead while the current one is on the device (0 decodes serially).",
+)
+@click.option(
+    "--cpu-cores",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Cores to split between concurrent stages (llama-server and torch threads, decode and colour lanes). Defaults to the cores this process may run on.",
+)
+@click.option(
+    "--embedder-backend",
+    type=click.Choice([EMBEDDER_BACKEND_SIGLIP, EMBEDDER_BACKEND_STUB]),
+    default=EMBEDDER_BACKEND_SIGLIP,
+    hidden=True,
+    help="Embedder implementation; stub is for benchmark-pipeline.",
+)
+@click.option(
+    "--quality-gates-path",
+    default=CAPTION_QUALITY_GATES_PATH,
+    hidden=True,
+    help="The benchmark-caption-quality record an image-token tier must have passed.",
+)
+@click.option(
+    "--stats-path",
+    default=None,
+    hidden=True,
+    help="Where to write the run statistics; defaults to .last-index-stats.json beside index.py, which the publish tooling reads as the last real run.",
+)
+@click.option(
+    "--vram-pause-minutes",
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+    help=f"When another process leaves less than {CAPTION_MIN_FREE_VRAM_GB} GB VRAM free, pause the caption or embedding loop with the model loaded for up to this many minutes, resuming once {VRAM_PAUSE_RESUME_FREE_GB} GB is free, instead of stopping the run.",
+)
+def index(
+    glob: str,
+    dbpath: str,
+    dry_run: bool,
+    model_profile: str,
+    benchmark_output: str | None,
+    embedding_batch_size: int,
+    classifier_backend: str,
+    classifier_model_id: str | None,
+    classifier_quantization: str | None,
+    classifier_batch_size: int | None,
+    classifier_adaptive_batch: bool,
+    classifier_parallel: int,
+    classifier_prompt_first: bool,
+    classifier_keep_server: bool,
+    classifier_server_idle_minutes: float,
+    classifier_max_new_tokens: int | None,
     classifier_batch_max_new_tokens: int | None,
+    classifier_learned_token_budget: bool,
+    classifier_retry_batch_size: int,
+    classifier_retry_max_new_tokens: int | None,
+    classifier_image_tokens: str | None,
     classifier_gpu_headroom_gb: float | None,
     classifier_low_impact: bool,
+    classifier_static_cache: bool,
+    classifier_reuse_near_duplicates: bool,
+    classifier_reuse_window_seconds: float,
+    classifier_reuse_max_distance: int,
     media_root: str,
+    verify_digests: bool,
+    source_cache_mb: int,
+    derivative_cache_mb: int,
+    embedder_draft_decode: bool,
+    embedding_prefetch_depth: int,
+    cpu_cores: int | None,
+    embedder_backend: str,
+    quality_gates_path: str,
+    stats_path: str | None,
+    vram_pause_minutes: float | None,
 ):
+    if classifier_adaptive_batch and classifier_backend != CLASSIFIER_BACKEND_GEMMA4:
+        # llama-server's memory is fixed when it starts; its concurrency is
+        # --classifier-parallel, not the batch size.
+        raise click.ClickException(
+            "--classifier-adaptive-batch requires --classifier-backend gemma4"
+        )
+    if classifier_image_tokens and classifier_backend != CLASSIFIER_BACKEND_GEMMA4_GGUF:
+        raise click.ClickException(
+            "--classifier-image-tokens requires --classifier-backend gemma4-gguf"
+        )
+    image_tokens = int(classifier_image_tokens) if classifier_image_tokens else None
+    if image_tokens is not None:
+        require_caption_quality_gate(
+            quality_gates_path,
+            caption_quality_gate_key(
+                classifier_backend,
+                classifier_model_id,
+                classifier_quantization,
+                image_tokens,
+            ),
+            image_tokens,
+        )
+    image_min_tokens, image_max_tokens = gguf_image_token_bounds(image_tokens)
+    classifier_batch_max_new_tokens = resolve_batch_max_new_tokens(
+        dbpath,
+        classifier_batch_max_new_tokens,
+        classifier_learned_token_budget,
+        classifier_backend,
+    )
+    vram_pause_seconds = vram_pause_minutes * 60 if vram_pause_minutes else None
+    vram_pauses: list[float] = []
     started_at = time.perf_counter()
     setup_started_at = time.perf_counter()
     if dry_run and os.path.exists(dbpath):
@@ -3381,6 +6003,14 @@ def index(
 
     planning_started_at = time.perf_counter()
     set_media_root(media_root)
+    # Replaced unconditionally, so nothing a previous run in this process
+    # cached can be served to this one.
+    source_bytes = (
+        SourceByteCache(source_cache_mb * 1024 * 1024) if source_cache_mb else None
+    )
+    set_source_byte_cache(source_bytes)
+    core_budget = CoreBudget(cpu_cores or available_cores())
+    set_core_budget(core_budget)
     files = find_files(".", glob, media_root=media_root)
     files, missing_posters = partition_indexable(files, media_root)
     if missing_posters:
@@ -3389,12 +6019,40 @@ def index(
             f"(first: {missing_posters[0]}). Run `npm run prepare:posters` from src/ "
             "and index again."
         )
-    current_digests = source_digests_for(files, media_root)
+    digest_counters: dict = {}
+    current_pixel_digests: dict[str, str | None] = {}
+    current_digests = source_digests_for(
+        files,
+        media_root,
+        digest_cache=digest_cache_path_for(dbpath),
+        verify=verify_digests,
+        counters=digest_counters,
+        pixel_digests=current_pixel_digests,
+    )
+    log(
+        f"Fingerprinted {len(current_digests)} source(s): "
+        f"{digest_counters['hashed']} hashed, {digest_counters['cacheHits']} from the digest cache"
+    )
     unreadable = [path for path, digest in current_digests.items() if digest is None]
     if unreadable:
         raise click.ClickException(
             f"Could not fingerprint {len(unreadable)} input file(s), first: {unreadable[0]}"
         )
+    # A dry run decodes nothing, so it leaves the derivative cache untouched.
+    derivatives = (
+        DerivativeCache(
+            derivative_cache_path_for(dbpath), derivative_cache_mb * 1024 * 1024
+        )
+        if derivative_cache_mb and not dry_run
+        else None
+    )
+    if derivatives is not None:
+        derivatives.known_digests.update(
+            (pixel_source_for(path, media_root), digest)
+            for path, digest in current_pixel_digests.items()
+            if digest is not None
+        )
+    set_derivative_cache(derivatives)
     existing_image_paths = db.list_image_paths()
     existing_caption_paths = db.list_caption_paths()
     existing_core_paths = existing_image_paths & db.list_metadata_paths()
@@ -3437,10 +6095,20 @@ def index(
         classifier_batch_size,
         classifier_max_new_tokens,
         classifier_batch_max_new_tokens,
+        gguf_parallel_for(classifier_backend, classifier_parallel),
+        classifier_prompt_first,
+        classifier_adaptive_batch,
+        classifier_retry_batch_size,
+        classifier_retry_max_new_tokens,
+        image_tokens,
     )
     desired_embedding_versions = {
-        SIGLIP_V1_STAGE: embedding_pipeline_version(SiglipEmbedder.MODEL_ID),
-        SIGLIP_V2_STAGE: embedding_pipeline_version(Siglip2Embedder.MODEL_ID),
+        SIGLIP_V1_STAGE: embedding_pipeline_version(
+            SiglipEmbedder.MODEL_ID, embedder_backend
+        ),
+        SIGLIP_V2_STAGE: embedding_pipeline_version(
+            Siglip2Embedder.MODEL_ID, embedder_backend
+        ),
     }
 
     def stage_needs_refresh(
@@ -3478,7 +6146,25 @@ def index(
             rewritten = rewrite_default_caption_provenance(stored_version)
             if rewritten is not None:
                 stored_version = rewritten[0]
-        return digest != current_digests[path] or stored_version != version
+            stored_version = caption_version_source(stored_version)
+        if (
+            stage in PIXEL_PINNED_STAGES
+            and digest == current_digests[path]
+            and digest != current_pixel_digests[path]
+            and stored_version == version
+        ):
+            # Pinned to the whole file before pixel digests existed. The bytes
+            # are unchanged, so move the pin now, while that can still be
+            # proven — after the next metadata edit it no longer can.
+            repins.append((path, stage, state))
+        return (
+            not stage_pin_is_current(
+                stage, digest, current_digests[path], current_pixel_digests[path]
+            )
+            or stored_version != version
+        )
+
+    repins: list[tuple[str, str, tuple]] = []
 
     work_items = []
     for file_path in files:
@@ -3524,6 +6210,7 @@ def index(
                 {
                     "path": file_path,
                     "source_sha256": current_digests[file_path],
+                    "pixel_sha256": current_pixel_digests[file_path],
                     "caption_version": desired_caption_version,
                     "caption_model_id": resolve_classifier_model_id(
                         classifier_backend, classifier_model_id
@@ -3540,8 +6227,18 @@ def index(
         # rows remain unmarked until their selected stage succeeds, so a partial
         # profile cannot make another stale stage look current.
         with db.transaction() as cur:
+            for path, stage, (_digest, version, model_id) in repins:
+                db.upsert_pipeline_state(
+                    path,
+                    stage,
+                    current_pixel_digests[path],
+                    version,
+                    model_id,
+                    cur,
+                )
             for path in files:
                 digest = current_digests[path]
+                pixel_digest = current_pixel_digests[path]
                 if path in existing_core_paths and (path, CORE_STAGE) not in states:
                     db.upsert_pipeline_state(
                         path,
@@ -3554,6 +6251,8 @@ def index(
                     # generation is unknowable, so they are re-captioned instead
                     # and get their provenance from that run. Stamping them here
                     # would claim the current version for v1-shaped output.
+                # Legacy vectors came from the real model whatever this run's
+                # embedder backend, so they are stamped with its version.
                 if (
                     path in existing_embedding_paths_v1
                     and (path, SIGLIP_V1_STAGE) not in states
@@ -3561,8 +6260,8 @@ def index(
                     db.upsert_pipeline_state(
                         path,
                         SIGLIP_V1_STAGE,
-                        digest,
-                        desired_embedding_versions[SIGLIP_V1_STAGE],
+                        pixel_digest,
+                        embedding_pipeline_version(SiglipEmbedder.MODEL_ID),
                         SiglipEmbedder.MODEL_ID,
                         cur=cur,
                     )
@@ -3573,12 +6272,16 @@ def index(
                     db.upsert_pipeline_state(
                         path,
                         SIGLIP_V2_STAGE,
-                        digest,
-                        desired_embedding_versions[SIGLIP_V2_STAGE],
+                        pixel_digest,
+                        embedding_pipeline_version(Siglip2Embedder.MODEL_ID),
                         Siglip2Embedder.MODEL_ID,
                         cur=cur,
                     )
         db.upsert_file_signatures(signatures_to_backfill)
+    if source_bytes is not None:
+        source_bytes.retain(
+            pixel_source_for(item["path"], media_root) for item in work_items
+        )
     planning_ms = (time.perf_counter() - planning_started_at) * 1000
 
     skipped = len(files) - len(work_items)
@@ -3602,7 +6305,7 @@ def index(
         model_init_ms = 0.0
         inference_stage_durations: dict[str, typing.Any] = {}
 
-        # Kick off colour extraction in a background thread pool before GPU work starts.
+        # Kick off colour extraction on the shared cpu lane before GPU work starts.
         # fast_colorthief (Rust) releases the GIL, so it runs truly in parallel with
         # CUDA kernels on the GPU — ~2.7 min of CPU work becomes effectively free.
         #
@@ -3623,15 +6326,28 @@ def index(
             for item in work_items
             if item["needs_core"] and not is_scene_path(item["path"])
         ]
-        colors_executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=COLORTHIEF_WORKERS
-        )
+        colors_lane = executor_lane("cpu")
+        color_futures: dict[str, concurrent.futures.Future] = {}
+        claim_cores("colour", apply=colors_lane.resize)
+        colours_pending = len(all_paths)
+        colours_pending_lock = threading.Lock()
+
+        def colour_finished(_future: concurrent.futures.Future) -> None:
+            # Hand the colour lane's cores back to the model pass as soon as the
+            # last palette lands, not when the run gets round to collecting them.
+            nonlocal colours_pending
+            with colours_pending_lock:
+                colours_pending -= 1
+                finished = colours_pending == 0
+            if finished:
+                release_cores("colour")
 
         def abort_colour_extraction() -> None:
-            colors_executor.shutdown(wait=False, cancel_futures=True)
+            for future in color_futures.values():
+                future.cancel()
+            release_cores("colour")
 
         colors_started_at = time.perf_counter()
-        color_futures: dict[str, concurrent.futures.Future] = {}
         color_failed_paths: set[str] = set()
         for color_index, path in enumerate(all_paths):
             if color_index == 0:
@@ -3647,11 +6363,10 @@ def index(
                     warm_future.set_result([])
                 color_futures[path] = warm_future
             else:
-                color_futures[path] = colors_executor.submit(
-                    extract_colour_palette, path
-                )
+                color_futures[path] = colors_lane.submit(extract_colour_palette, path)
+            color_futures[path].add_done_callback(colour_finished)
         log(
-            f"Colour extraction started in background ({len(all_paths)} images, {COLORTHIEF_WORKERS} threads)"
+            f"Colour extraction started in background ({len(all_paths)} images, {colors_lane.workers} threads)"
         )
 
         # ---- Pass 1: captions ----
@@ -3661,6 +6376,8 @@ def index(
         completed_caption_paths: set[str] = set()
         caption_generation_metrics: list[dict[str, typing.Any]] = []
         minimum_free_vram_gb: float | None = None
+        # Reused path -> the path whose caption it copied.
+        reused_captions: dict[str, str] = {}
         if any(item["needs_classifier"] for item in work_items):
             classifier = create_classifier(
                 backend=classifier_backend,
@@ -3671,6 +6388,13 @@ def index(
                 batch_max_new_tokens=classifier_batch_max_new_tokens,
                 gpu_headroom_gb=classifier_gpu_headroom_gb,
                 low_impact=classifier_low_impact,
+                parallel=classifier_parallel,
+                persistent=classifier_keep_server,
+                idle_timeout_seconds=classifier_server_idle_minutes * 60,
+                prompt_first=classifier_prompt_first,
+                static_cache=classifier_static_cache,
+                image_min_tokens=image_min_tokens,
+                image_max_tokens=image_max_tokens,
             )
             # One guard around the whole caption pass. Every failure inside it —
             # model load, batch inference, the VRAM-headroom check, a single-image
@@ -3680,6 +6404,9 @@ def index(
             # failure alike; the `except` also aborts the background colour pool so
             # nothing is left running when the run unwinds.
             try:
+                # Claimed before init_model: llama-server's --threads is fixed
+                # at launch.
+                apply_torch_threads(claim_cores("caption"))
                 load_started_at = time.perf_counter()
                 classifier.init_model()
                 model_init_ms += (time.perf_counter() - load_started_at) * 1000
@@ -3687,18 +6414,183 @@ def index(
                 classifier_paths = [
                     item["path"] for item in work_items if item["needs_classifier"]
                 ]
-                resolved_batch_size = resolved_classifier_batch_size
-                total_batches = math.ceil(len(classifier_paths) / resolved_batch_size)
+                caption_reuse: CaptionReuseIndex | None = None
+                capture_times: dict[str, datetime | None] = {}
+                if classifier_reuse_near_duplicates:
+                    caption_reuse = CaptionReuseIndex(
+                        classifier_reuse_window_seconds, classifier_reuse_max_distance
+                    )
+                    stored_times = db.list_capture_times()
+                    candidates = set(classifier_paths)
+                    # Only captions generated under the current version donate:
+                    # copying copies would let a long burst drift from its source.
+                    for (path, stage), (digest, version, _model) in states.items():
+                        if (
+                            stage == CAPTION_STAGE
+                            and version == desired_caption_version
+                            and path in current_pixel_digests
+                            and path not in candidates
+                            and not is_media_path(path)
+                            and stage_pin_is_current(
+                                stage,
+                                digest,
+                                current_digests[path],
+                                current_pixel_digests[path],
+                            )
+                        ):
+                            caption_reuse.add(
+                                path, parse_capture_time(stored_times.get(path))
+                            )
+                    capture_times = {
+                        path: parse_capture_time(stored_times.get(path))
+                        for path in classifier_paths
+                        if not is_media_path(path)
+                    }
+                    # New photos have no metadata row until the core pass.
+                    unread = [path for path, at in capture_times.items() if at is None]
+                    read_times = executor_lane("decode").map(exif_capture_time, unread)
+                    capture_times.update(zip(unread, read_times))
+                    # In capture order, a burst's first frame is captioned before
+                    # the rest of it is compared against it. Undated photos
+                    # sort last, by path.
+                    classifier_paths.sort(
+                        key=lambda path: (
+                            (0, capture_times[path], path)
+                            if capture_times.get(path) is not None
+                            else (1, path)
+                        )
+                    )
+
+                def reuse_caption(path: str) -> bool:
+                    if caption_reuse is None:
+                        return False
+                    donor = caption_reuse.find(path, capture_times.get(path))
+                    if donor is None:
+                        return False
+                    with db.transaction() as cur:
+                        if not db.copy_caption(donor, path, cur):
+                            return False
+                        db.upsert_pipeline_state(
+                            path,
+                            CAPTION_STAGE,
+                            current_pixel_digests[path],
+                            f"{desired_caption_version}{CAPTION_REUSE_MARKER}"
+                            f"{current_pixel_digests[donor][:12]}",
+                            resolve_classifier_model_id(
+                                classifier_backend, classifier_model_id
+                            ),
+                            cur,
+                        )
+                        db.rebuild_tag_counts(cur)
+                    completed_caption_paths.add(path)
+                    reused_captions[path] = donor
+                    log(f"  reused caption of {donor} for {path}")
+                    return True
+
+                # A batch narrower than the server's slots leaves some idle.
+                resolved_batch_size = max(
+                    resolved_classifier_batch_size, getattr(classifier, "parallel", 1)
+                )
+                batch_sizer = (
+                    AdaptiveCaptionBatchSize(maximum=classifier_batch_size)
+                    if classifier_adaptive_batch
+                    else None
+                )
+                batch_description = str(resolved_batch_size)
+                if batch_sizer is not None:
+                    resolved_batch_size = batch_sizer.size
+                    batch_description = f"up to {batch_sizer.maximum}"
                 log(
-                    f"Running {classifier.backend} captions in batches of {resolved_batch_size} ({len(classifier_paths)} images, {total_batches} batch(es))..."
+                    f"Running {classifier.backend} captions in batches of {batch_description} ({len(classifier_paths)} images)..."
                 )
-                batch_started_at = time.perf_counter()
-                for batch_index, batch_start in enumerate(
-                    range(0, len(classifier_paths), resolved_batch_size), start=1
-                ):
-                    batch_paths = classifier_paths[
-                        batch_start : batch_start + resolved_batch_size
+
+                def persist_captions(
+                    paths: list[str], attempt_metrics: list[dict[str, typing.Any]]
+                ) -> None:
+                    caption_generation_metrics.extend(attempt_metrics)
+                    successful = [
+                        (path, precomputed_captions[path])
+                        for path in paths
+                        if path in precomputed_captions
                     ]
+                    if successful or attempt_metrics:
+                        with db.transaction() as cur:
+                            db.insert_caption_generation_metrics(
+                                attempt_metrics, cur=cur
+                            )
+                            for path, parsed in successful:
+                                tags = normalise_classifier_tags(parsed)
+                                db.upsert_image_fields(
+                                    path,
+                                    {
+                                        "alt_text": parsed.get("alt_text"),
+                                        # Clear a caption produced by the retired
+                                        # subject field when refreshing this stage.
+                                        "subject": None,
+                                        "tags": ", ".join(tags),
+                                    },
+                                    cur=cur,
+                                )
+                                db.replace_tags_for_source(
+                                    path, tags, "classifier", cur
+                                )
+                                db.upsert_pipeline_state(
+                                    path,
+                                    CAPTION_STAGE,
+                                    current_pixel_digests[path],
+                                    desired_caption_version,
+                                    resolve_classifier_model_id(
+                                        classifier_backend, classifier_model_id
+                                    ),
+                                    cur,
+                                )
+                                completed_caption_paths.add(path)
+                                if caption_reuse is not None:
+                                    caption_reuse.add(path, capture_times.get(path))
+                            if successful:
+                                db.rebuild_tag_counts(cur)
+                    for path in paths:
+                        precomputed_captions.pop(path, None)
+
+                # Rows that failed to parse or reach EOS wait here for the
+                # retry sweep, so one straggler never holds up the batches.
+                deferred_retries: list[tuple[str, Mapping | None]] = []
+                batch_started_at = time.perf_counter()
+                batch_start = 0
+                batch_index = 0
+                # Burst frames that look like a photo in the current batch wait
+                # for its caption to land, then try to reuse it.
+                held_for_donor: list[str] = []
+                while batch_start < len(classifier_paths) or held_for_donor:
+                    batch_paths = []
+                    in_flight: list[tuple[datetime | None, str]] = []
+                    waiting, held_for_donor = held_for_donor, []
+                    while len(batch_paths) < resolved_batch_size and (
+                        waiting or batch_start < len(classifier_paths)
+                    ):
+                        if waiting:
+                            path = waiting.pop(0)
+                        else:
+                            path = classifier_paths[batch_start]
+                            batch_start += 1
+                        if reuse_caption(path):
+                            continue
+                        if caption_reuse is not None and caption_reuse.awaits(
+                            path, capture_times.get(path), in_flight
+                        ):
+                            held_for_donor.append(path)
+                            continue
+                        batch_paths.append(path)
+                        in_flight.append((capture_times.get(path), path))
+                    held_for_donor = waiting + held_for_donor
+                    if not batch_paths:
+                        break
+                    batch_index += 1
+                    # Re-estimated as an adaptive size moves.
+                    total_batches = batch_index + math.ceil(
+                        (len(classifier_paths) - batch_start + len(held_for_donor))
+                        / resolved_batch_size
+                    )
                     log(
                         f"  {classifier.backend} batch {batch_index}/{total_batches} starting ({len(batch_paths)} images)..."
                     )
@@ -3706,6 +6598,8 @@ def index(
                     # Captions are pixel-grounded. Location is indexed separately by
                     # the core stage and must not leak into visual descriptions.
                     batch_geocodes = [None] * len(batch_paths)
+                    if batch_sizer is not None:
+                        batch_sizer.start_batch()
                     with heartbeat(
                         f"{classifier.backend} batch {batch_index}/{total_batches}"
                     ):
@@ -3713,7 +6607,9 @@ def index(
                             classifier, list(zip(batch_paths, batch_geocodes))
                         )
                     free_vram_gb = enforce_vram_headroom(
-                        f"{classifier.backend} batch {batch_index}/{total_batches}"
+                        f"{classifier.backend} batch {batch_index}/{total_batches}",
+                        vram_pause_seconds,
+                        vram_pauses,
                     )
                     if math.isfinite(free_vram_gb):
                         minimum_free_vram_gb = (
@@ -3746,75 +6642,89 @@ def index(
                                 "path": path,
                                 "pipelineVersion": desired_caption_version,
                                 "attempt": metric.get("attempt", "batch"),
+                                "plannedBatchSize": len(batch_paths),
                             }
                         )
-                        retry_metrics: list[dict[str, typing.Any]] = []
-                        parsed = resolve_caption_result(
-                            classifier,
-                            path,
-                            geo,
-                            raw,
-                            metric,
-                            retry_metrics,
-                        )
+                        parsed = accept_caption_result(path, raw, metric)
                         batch_attempt_metrics.append(metric)
-                        for retry_metric in retry_metrics:
-                            retry_metric.update(
-                                {
-                                    "path": path,
-                                    "pipelineVersion": desired_caption_version,
-                                    "attempt": "single-retry",
-                                }
-                            )
-                            batch_attempt_metrics.append(retry_metric)
                         if parsed is not None:
                             precomputed_captions[path] = parsed
-                    caption_generation_metrics.extend(batch_attempt_metrics)
-                    successful = [
-                        (path, precomputed_captions[path])
-                        for path in batch_paths
-                        if path in precomputed_captions
-                    ]
-                    if successful or batch_attempt_metrics:
-                        with db.transaction() as cur:
-                            db.insert_caption_generation_metrics(
-                                batch_attempt_metrics, cur=cur
-                            )
-                            for path, parsed in successful:
-                                tags = normalise_classifier_tags(parsed)
-                                db.upsert_image_fields(
-                                    path,
-                                    {
-                                        "alt_text": parsed.get("alt_text"),
-                                        # Clear a caption produced by the retired
-                                        # subject field when refreshing this stage.
-                                        "subject": None,
-                                        "tags": ", ".join(tags),
-                                    },
-                                    cur=cur,
-                                )
-                                db.replace_tags_for_source(
-                                    path, tags, "classifier", cur
-                                )
-                                db.upsert_pipeline_state(
-                                    path,
-                                    CAPTION_STAGE,
-                                    current_digests[path],
-                                    desired_caption_version,
-                                    resolve_classifier_model_id(
-                                        classifier_backend, classifier_model_id
-                                    ),
-                                    cur,
-                                )
-                                completed_caption_paths.add(path)
-                            if successful:
-                                db.rebuild_tag_counts(cur)
-                    for path in batch_paths:
-                        precomputed_captions.pop(path, None)
-                    done = min(batch_start + resolved_batch_size, len(classifier_paths))
+                        else:
+                            deferred_retries.append((path, geo))
+                    persist_captions(batch_paths, batch_attempt_metrics)
                     single_ms = (time.perf_counter() - single_started_at) * 1000
                     log(
-                        f"  {classifier.backend} batch {batch_index}/{total_batches} done in {single_ms:.0f}ms ({done}/{len(classifier_paths)} images)"
+                        f"  {classifier.backend} batch {batch_index}/{total_batches} done in {single_ms:.0f}ms ({batch_start}/{len(classifier_paths)} images)"
+                    )
+                    if batch_sizer is not None:
+                        next_size = batch_sizer.finish_batch(
+                            len(batch_paths),
+                            free_vram_gb,
+                            any(metric.get("oomFallback") for metric in batch_metrics),
+                        )
+                        if next_size != resolved_batch_size:
+                            log(
+                                f"  adaptive caption batch {resolved_batch_size} -> "
+                                f"{next_size} ({free_vram_gb:.2f} GB VRAM free)"
+                            )
+                        resolved_batch_size = next_size
+                # Read outside caption_token_budget, so an unset retry budget
+                # is the cap the classifier was built with for this backend.
+                retry_tokens = classifier_retry_max_new_tokens or getattr(
+                    classifier,
+                    "max_new_tokens",
+                    default_caption_max_new_tokens(classifier.backend),
+                )
+                if deferred_retries:
+                    log(
+                        f"Retrying {len(deferred_retries)} caption(s) in batches of "
+                        f"{classifier_retry_batch_size} at {retry_tokens} tokens..."
+                    )
+                for retry_start in range(
+                    0, len(deferred_retries), classifier_retry_batch_size
+                ):
+                    retry_items = deferred_retries[
+                        retry_start : retry_start + classifier_retry_batch_size
+                    ]
+                    with (
+                        caption_token_budget(classifier, retry_tokens),
+                        heartbeat(f"{classifier.backend} caption retries"),
+                    ):
+                        retry_results, retry_metrics = predict_caption_batch_resilient(
+                            classifier, retry_items
+                        )
+                    enforce_vram_headroom(
+                        f"{classifier.backend} caption retries",
+                        vram_pause_seconds,
+                        vram_pauses,
+                    )
+                    retry_attempt_metrics: list[dict[str, typing.Any]] = []
+                    for position, (path, _geo) in enumerate(retry_items):
+                        retry_metric = dict(
+                            retry_metrics[position]
+                            if position < len(retry_metrics)
+                            else {}
+                        )
+                        parsed = finish_caption_retry(
+                            path,
+                            retry_results[position]
+                            if position < len(retry_results)
+                            else "",
+                            retry_metric,
+                        )
+                        retry_metric.update(
+                            {
+                                "path": path,
+                                "pipelineVersion": desired_caption_version,
+                                "attempt": "single-retry",
+                                "plannedBatchSize": len(retry_items),
+                            }
+                        )
+                        retry_attempt_metrics.append(retry_metric)
+                        if parsed is not None:
+                            precomputed_captions[path] = parsed
+                    persist_captions(
+                        [path for path, _geo in retry_items], retry_attempt_metrics
                     )
                 batch_ms = (time.perf_counter() - batch_started_at) * 1000
                 inference_stage_durations[f"caption:{classifier.backend}"] = {
@@ -3830,6 +6740,7 @@ def index(
                 raise
             finally:
                 classifier.release()
+                release_cores("caption")
             classifier = None  # free VRAM before the embedding passes load
 
         # ---- Embedding passes: one model resident at a time ----
@@ -3852,8 +6763,8 @@ def index(
                     db.upsert_pipeline_state(
                         path,
                         stage,
-                        current_digests[path],
-                        embedding_pipeline_version(model_id),
+                        current_pixel_digests[path],
+                        desired_embedding_versions[stage],
                         model_id,
                         cur,
                     )
@@ -3865,13 +6776,18 @@ def index(
             ]
             try:
                 model_init_ms += run_embedding_pass(
-                    SiglipEmbedder(),
+                    create_embedder(
+                        SiglipEmbedder, embedder_backend, embedder_draft_decode
+                    ),
                     v1_paths,
                     precomputed_embeddings,
                     persist_batch=persist_embedding_batch,
                     collect=False,
                     batch_size=embedding_batch_size,
                     timings=inference_stage_durations,
+                    prefetch_depth=embedding_prefetch_depth,
+                    vram_pause_seconds=vram_pause_seconds,
+                    vram_pauses=vram_pauses,
                 )
             except BaseException:
                 abort_colour_extraction()
@@ -3882,13 +6798,18 @@ def index(
             ]
             try:
                 model_init_ms += run_embedding_pass(
-                    Siglip2Embedder(),
+                    create_embedder(
+                        Siglip2Embedder, embedder_backend, embedder_draft_decode
+                    ),
                     v2_paths,
                     precomputed_embeddings,
                     persist_batch=persist_embedding_batch,
                     collect=False,
                     batch_size=embedding_batch_size,
                     timings=inference_stage_durations,
+                    prefetch_depth=embedding_prefetch_depth,
+                    vram_pause_seconds=vram_pause_seconds,
+                    vram_pauses=vram_pauses,
                 )
             except BaseException:
                 abort_colour_extraction()
@@ -3896,7 +6817,10 @@ def index(
 
         # Collect colour results (GPU work is done; palettes are likely finished).
         precomputed_colors_by_path: dict[str, list] = {}
-        colors_executor.shutdown(wait=True)
+        colour_wait_started_at = time.perf_counter()
+        concurrent.futures.wait(color_futures.values())
+        colour_wait_ms = (time.perf_counter() - colour_wait_started_at) * 1000
+        release_cores("colour")
         for path, fut in color_futures.items():
             try:
                 precomputed_colors_by_path[path] = fut.result()
@@ -3953,6 +6877,7 @@ def index(
                 item["caption_version"],
                 item["caption_model_id"],
                 item["path"] not in color_failed_paths,
+                item["pixel_sha256"],
             )
             for item_index, item in enumerate(assembly_items)
         ]
@@ -4032,8 +6957,14 @@ def index(
                 f"{caption_failures} caption(s), "
                 f"{embedding_failures} embedding(s); they remain retryable"
             )
+        if vram_pauses:
+            log(
+                f"Paused {len(vram_pauses)} time(s) for VRAM, "
+                f"{sum(vram_pauses):.0f}s in total"
+            )
         log_vram_peak()
 
+        finalise_started_at = time.perf_counter()
         db.optimize()
 
         # The legacy mtime/size signature remains useful for importing old rows,
@@ -4048,7 +6979,6 @@ def index(
         completed_signatures = {}
         for item in work_items:
             path = item["path"]
-            digest = item["source_sha256"]
             required_stages = []
             if path in refreshed_images:
                 required_stages.append(CORE_STAGE)
@@ -4059,15 +6989,23 @@ def index(
             if path in refreshed_v2:
                 required_stages.append(SIGLIP_V2_STAGE)
             if all(
-                refreshed_states.get((path, stage), (None, None, None))[0] == digest
+                stage_pin_is_current(
+                    stage,
+                    refreshed_states.get((path, stage), (None, None, None))[0],
+                    item["source_sha256"],
+                    item["pixel_sha256"],
+                )
                 for stage in required_stages
             ):
                 signature = file_signature(path)
                 if signature is not None:
                     completed_signatures[path] = signature
         db.upsert_file_signatures(completed_signatures)
+        finalise_ms = (time.perf_counter() - finalise_started_at) * 1000
     else:
         model_init_ms = 0.0
+        colour_wait_ms = 0.0
+        finalise_ms = 0.0
         analysis_durations_ms = []
         insert_durations_ms = []
         caption_failures = 0
@@ -4076,6 +7014,7 @@ def index(
         inference_stage_durations = {}
         caption_generation_metrics = []
         minimum_free_vram_gb = None
+        reused_captions = {}
 
     token_counts = [
         metric["tokenCount"]
@@ -4097,10 +7036,35 @@ def index(
         "oomFallbacks": sum(
             bool(metric.get("oomFallback")) for metric in caption_generation_metrics
         ),
+        # Batch rows only, so an image's single retry is not counted twice.
+        "plannedBatchSizes": {
+            str(size): count
+            for size, count in sorted(
+                collections.Counter(
+                    metric["plannedBatchSize"]
+                    for metric in caption_generation_metrics
+                    if metric.get("attempt") == "batch"
+                    and metric.get("plannedBatchSize") is not None
+                ).items()
+            )
+        },
+        "cachedPromptTokens": sum(
+            metric.get("cachedPromptTokens") or 0
+            for metric in caption_generation_metrics
+        ),
+        "promptTokens": sum(
+            metric.get("promptTokens") or 0 for metric in caption_generation_metrics
+        ),
+        "reusedCaptions": len(reused_captions),
         "minimumFreeVramGb": (
             round(minimum_free_vram_gb, 2) if minimum_free_vram_gb is not None else None
         ),
     }
+    # Caption and embedding loops alike, so not part of the generation summary.
+    vram_pause_summary = {
+        "count": len(vram_pauses),
+        "seconds": round(sum(vram_pauses), 2),
+    }
 
     if not dry_run and work_items:
         stats = {
@@ -4112,13 +7076,14 @@ def index(
             "embeddingFailures": embedding_failures,
             "inferenceStages": inference_stage_durations,
             "captionGeneration": generation_summary,
+            "vramPauses": vram_pause_summary,
             "medianAnalysisMs": (
                 round(statistics.median(analysis_durations_ms), 2)
                 if analysis_durations_ms
                 else 0.0
             ),
         }
-        stats_path = os.path.join(
+        stats_path = stats_path or os.path.join(
             os.path.dirname(os.path.abspath(__file__)), ".last-index-stats.json"
         )
         with open(stats_path, "w", encoding="utf-8") as fh:
@@ -4135,6 +7100,12 @@ def index(
             "workItemCount": len(work_items),
             "stageDurationsMs": inference_stage_durations,
             "captionGeneration": generation_summary,
+            "vramPauses": vram_pause_summary,
+            "digests": digest_counters,
+            "sourceByteCache": source_bytes.stats() if source_bytes else None,
+            "derivativeCache": derivatives.stats() if derivatives else None,
+            "executors": shared_executor_stats(),
+            "coreBudget": core_budget.stats(),
             "failures": {
                 "core": core_failures,
                 "caption": caption_failures,
@@ -4157,11 +7128,24 @@ def index(
                     if insert_durations_ms
                     else 0.0
                 ),
+                # Colour extraction left over once the model passes finished,
+                # and the closing optimize and file signature pass.
+                "colourWait": round(colour_wait_ms, 2),
+                "finalise": round(finalise_ms, 2),
             },
         }
         with open(benchmark_output, "w", encoding="utf-8") as fh:
             json.dump(benchmark, fh, indent=2)
         print(f"Benchmark written to {benchmark_output}")
+    if source_bytes is not None:
+        log(f"Source byte cache: {source_bytes.stats()}")
+        set_source_byte_cache(None)
+    if derivatives is not None:
+        log(f"Derivative cache: {derivatives.stats()}")
+        set_derivative_cache(None)
+    log(f"Executor lanes: {shared_executor_stats()}")
+    reset_shared_executors()
+    set_core_budget(None)
     if not dry_run:
         os.close(database_lock_fd)
         os.close(global_lock_fd)
@@ -4331,43 +7315,246 @@ def compare_colour_palettes(
     }
 
 
-@cli.command("benchmark-colours")
-@click.option("--glob", "glob_pattern", default="../albums/**/*.jpg", show_default=True)
+def write_synthetic_library(
+    root: str, images: int, albums: int, long_edge: int
+) -> list[str]:
+    """``images`` distinct JPEGs spread over ``albums`` album directories.
+
+    Each is a smooth field blown up from a tiny random image seeded by its
+    index, so the library is the same on every run and every photo decodes
+    and compresses like a photo rather than like noise."""
+    paths = []
+    size = (long_edge, long_edge * 3 // 4)
+    for image_index in range(images):
+        album = os.path.join(root, f"album-{image_index % albums:02d}")
+        os.makedirs(album, exist_ok=True)
+        cells = np.random.default_rng(image_index).integers(
+            0, 256, (6, 8, 3), dtype=np.uint8
+        )
+        path = os.path.join(album, f"photo-{image_index:05d}.jpg")
+        Image.fromarray(cells).resize(size, resample=Image.Resampling.BICUBIC).save(
+            path, quality=85
+        )
+        paths.append(path)
+    return paths
+
+
+def pipeline_time_breakdown(
+    benchmark: Mapping[str, typing.Any], model_ms: Mapping[str, float]
+) -> dict[str, float]:
+    """Where an index run's time went, with the stub backends' time taken out.
+
+    The caption and embedding stages' own time, less the latency the stubs
+    simulated, is the orchestration around the model: batching, parsing,
+    decoding, per-batch commits. ``other`` is whatever no named phase covers."""
+    durations = benchmark["durationsMs"]
+    stages = benchmark["stageDurationsMs"]
+    caption_ms = sum(
+        stage["inferenceMs"]
+        for name, stage in stages.items()
+        if name.startswith("caption:")
+    )
+    embedding_ms = sum(
+        stage["inferenceMs"]
+        for name, stage in stages.items()
+        if not name.startswith("caption:")
+    )
+    breakdown = {
+        "setupTables": durations["setupTables"],
+        "planning": durations["planning"],
+        "modelInit": durations["modelInit"],
+        "captionOrchestration": max(0.0, caption_ms - model_ms["caption"]),
+        "embeddingOrchestration": max(0.0, embedding_ms - model_ms["embedding"]),
+        "colourWait": durations["colourWait"],
+        # Per-image assembly runs on one worker, so its sum is close to wall time.
+        "assembly": durations["analysisTotal"],
+        "insert": durations["insertTotal"],
+        "finalise": durations["finalise"],
+    }
+    breakdown["other"] = max(
+        0.0, durations["total"] - sum(breakdown.values()) - sum(model_ms.values())
+    )
+    return {name: round(float(ms), 2) for name, ms in breakdown.items()}
+
+
+@cli.command("benchmark-pipeline")
 @click.option(
-    "--sample-size", default=128, type=click.IntRange(min=1), show_default=True
+    "--images",
+    default=64,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Synthetic photos to index.",
 )
-@click.option("--seed", default=29, type=int, show_default=True)
 @click.option(
-    "--max-dimension",
-    default=COLOUR_THUMBNAIL_MAX_DIMENSION,
-    type=click.IntRange(min=64),
+    "--albums",
+    default=4,
+    type=click.IntRange(min=1),
     show_default=True,
+    help="Album directories to spread them over.",
 )
 @click.option(
-    "--quality",
-    default=COLOUR_THUMBNAIL_QUALITY,
-    type=click.IntRange(min=1),
+    "--image-edge",
+    default=1600,
+    type=click.IntRange(min=16),
     show_default=True,
+    help="Long edge of each synthetic photo in pixels.",
 )
-@click.option("--output", default=None, help="Optional JSON result path.")
-def benchmark_colours(
-    glob_pattern: str,
-    sample_size: int,
-    seed: int,
-    max_dimension: int,
-    quality: int,
-    output: str | None,
-):
-    """Compare full-resolution and bounded-thumbnail palette cost and fidelity."""
-    paths = sample_balanced_paths(
-        find_files(".", glob_pattern), sample_size=sample_size, seed=seed
-    )
-
-    def run(function):
-        started_at = time.perf_counter()
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=COLORTHIEF_WORKERS
-        ) as executor:
+@click.option(
+    "--model-profile",
+    type=click.Choice(
+        [MODEL_PROFILE_CAPTIONS, MODEL_PROFILE_SIGLIP2, MODEL_PROFILE_HYBRID],
+        case_sensitive=False,
+    ),
+    default=MODEL_PROFILE_HYBRID,
+    show_default=True,
+    help="Indexing profile to run.",
+)
+@click.option(
+    "--caption-latency-ms",
+    default=0.0,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Simulated caption time per image.",
+)
+@click.option(
+    "--embedding-latency-ms",
+    default=0.0,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Simulated embedding time per image, for each embedder.",
+)
+@click.option(
+    "--caption-batch-size",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Caption batch size (default 1).",
+)
+@click.option(
+    "--embedding-batch-size",
+    default=EMBEDDER_BATCH_SIZE,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Embedding batch size.",
+)
+@click.option(
+    "--output",
+    default=".pipeline-benchmark.json",
+    show_default=True,
+    help="JSON output file for the benchmark summary.",
+)
+@click.pass_context
+def benchmark_pipeline(
+    ctx: click.Context,
+    images: int,
+    albums: int,
+    image_edge: int,
+    model_profile: str,
+    caption_latency_ms: float,
+    embedding_latency_ms: float,
+    caption_batch_size: int | None,
+    embedding_batch_size: int,
+    output: str,
+):
+    """Run the real index over a synthetic library with model-free backends.
+
+    Planning, the colour overlap, per-batch commits, insert chunking and the
+    closing signature pass all run as in production; only the models are
+    stubs. Runs the index twice: once over the new library, and once more with
+    nothing changed, which is planning and bookkeeping alone."""
+    runs = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        library = os.path.join(tmpdir, "albums")
+        write_synthetic_library(library, images, albums, image_edge)
+        for label in ("cold", "rerun"):
+            configure_stub_backends(caption_latency_ms, embedding_latency_ms)
+            benchmark_path = os.path.join(tmpdir, f"{label}.json")
+            ctx.invoke(
+                index,
+                glob=os.path.join(library, "**", "*.jpg"),
+                dbpath=os.path.join(tmpdir, "search.sqlite"),
+                model_profile=model_profile,
+                benchmark_output=benchmark_path,
+                embedding_batch_size=embedding_batch_size,
+                classifier_backend=CLASSIFIER_BACKEND_STUB,
+                classifier_batch_size=caption_batch_size,
+                media_root=os.path.join(tmpdir, "media"),
+                embedder_backend=EMBEDDER_BACKEND_STUB,
+                # Synthetic runs must not pass for the last real index run.
+                stats_path=os.path.join(tmpdir, f"{label}-stats.json"),
+            )
+            with open(benchmark_path, encoding="utf-8") as fh:
+                benchmark = json.load(fh)
+            model_ms = stub_backend_model_ms()
+            runs.append(
+                {
+                    "run": label,
+                    "workItemCount": benchmark["workItemCount"],
+                    "totalMs": benchmark["durationsMs"]["total"],
+                    "stubModelMs": model_ms,
+                    "nonModelMs": round(
+                        benchmark["durationsMs"]["total"] - sum(model_ms.values()), 2
+                    ),
+                    "breakdownMs": pipeline_time_breakdown(benchmark, model_ms),
+                    "stageDurationsMs": benchmark["stageDurationsMs"],
+                    "digests": benchmark["digests"],
+                    "failures": benchmark["failures"],
+                }
+            )
+    configure_stub_backends(0.0, 0.0)
+
+    summary = {
+        "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "images": images,
+        "albums": albums,
+        "imageEdge": image_edge,
+        "modelProfile": model_profile,
+        "captionLatencyMs": caption_latency_ms,
+        "embeddingLatencyMs": embedding_latency_ms,
+        "runs": runs,
+    }
+    pprint.pprint(summary)
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    print(f"Benchmark written to {output}")
+
+
+@cli.command("benchmark-colours")
+@click.option("--glob", "glob_pattern", default="../albums/**/*.jpg", show_default=True)
+@click.option(
+    "--sample-size", default=128, type=click.IntRange(min=1), show_default=True
+)
+@click.option("--seed", default=29, type=int, show_default=True)
+@click.option(
+    "--max-dimension",
+    default=COLOUR_THUMBNAIL_MAX_DIMENSION,
+    type=click.IntRange(min=64),
+    show_default=True,
+)
+@click.option(
+    "--quality",
+    default=COLOUR_THUMBNAIL_QUALITY,
+    type=click.IntRange(min=1),
+    show_default=True,
+)
+@click.option("--output", default=None, help="Optional JSON result path.")
+def benchmark_colours(
+    glob_pattern: str,
+    sample_size: int,
+    seed: int,
+    max_dimension: int,
+    quality: int,
+    output: str | None,
+):
+    """Compare full-resolution and bounded-thumbnail palette cost and fidelity."""
+    paths = sample_balanced_paths(
+        find_files(".", glob_pattern), sample_size=sample_size, seed=seed
+    )
+
+    def run(function):
+        started_at = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=COLORTHIEF_WORKERS
+        ) as executor:
             palettes = list(executor.map(function, paths))
         return dict(zip(paths, palettes)), (time.perf_counter() - started_at) * 1000
 
@@ -4409,6 +7596,53 @@ def benchmark_colours(
         print(f"Benchmark written to {output}")
 
 
+@cli.command("benchmark-embedder-decode")
+@click.option("--glob", "glob_pattern", default="../albums/**/*.jpg", show_default=True)
+@click.option(
+    "--sample-size",
+    default=EMBEDDER_DRAFT_CALIBRATION_SIZE,
+    type=click.IntRange(min=NEIGHBOUR_OVERLAP_K + 1),
+    show_default=True,
+)
+@click.option("--seed", default=29, type=int, show_default=True)
+@click.option(
+    "--model",
+    default="siglip2",
+    type=click.Choice(["siglip2", "siglip1"]),
+    help="Which embedder to measure.",
+)
+@click.option("--output", default=None, help="Optional JSON result path.")
+def benchmark_embedder_decode(
+    glob_pattern: str, sample_size: int, seed: int, model: str, output: str | None
+):
+    """Compare full-resolution and draft SigLIP decoding cost and neighbour fidelity.
+
+    Runs the same gate ``index --embedder-draft-decode`` applies to each pass."""
+    paths = sample_balanced_paths(
+        find_files(".", glob_pattern), sample_size=sample_size, seed=seed
+    )
+    embedder = Siglip2Embedder() if model == "siglip2" else SiglipEmbedder()
+    embedder.init_model()
+    try:
+        gate = embedder.calibrate_draft_decode(paths, sample_size=sample_size)
+    finally:
+        embedder.release()
+    summary = {
+        "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "model": embedder.MODEL_ID,
+        "seed": seed,
+        **gate,
+        "speedup": (
+            round(gate["fullMs"] / gate["draftMs"], 2) if gate["draftMs"] else None
+        ),
+    }
+    pprint.pprint(summary)
+    if output:
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"Benchmark written to {output}")
+
+
 @cli.command("benchmark-cpu")
 @click.option("--glob", "glob_pattern", default="../albums/**/*.jpg", show_default=True)
 @click.option(
@@ -4496,6 +7730,86 @@ def benchmark_cpu(
         print(f"Benchmark written to {output}")
 
 
+class CaptionResultCache:
+    """Candidate captions from the bake-off commands, keyed by what produced them.
+
+    compare-captioners and benchmark-caption-quality used to regenerate every
+    candidate on every invocation, so iterating on a report or a metric cost
+    minutes of GPU time for outputs already in hand. Decoding is greedy, so the
+    same pixels under the same ``caption_pipeline_version`` give the same
+    caption. Entries are keyed on the pixel digest (the file digest where there
+    is none), the version, and ``settings``: the decoding and how the command
+    drove the model, which the version does not record. ``--refresh`` bypasses
+    the reads and overwrites the entries it regenerates."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.con = sqlite3.connect(path, timeout=30)
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS caption_results (
+                source_sha256 TEXT NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (source_sha256, pipeline_version, settings)
+            )
+            """
+        )
+        self.con.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, digest: str | None, pipeline_version: str, settings: str
+    ) -> dict[str, typing.Any] | None:
+        row = (
+            self.con.execute(
+                "SELECT payload FROM caption_results WHERE source_sha256 = ? "
+                "AND pipeline_version = ? AND settings = ?",
+                (digest, pipeline_version, settings),
+            ).fetchone()
+            if digest
+            else None
+        )
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(
+        self,
+        digest: str | None,
+        pipeline_version: str,
+        settings: str,
+        payload: Mapping[str, typing.Any],
+    ) -> None:
+        if not digest:
+            return
+        with self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO caption_results"
+                "(source_sha256, pipeline_version, settings, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (digest, pipeline_version, settings, json.dumps(payload), time.time()),
+            )
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self.con.close()
+
+
+def caption_result_digests(paths: list[str]) -> dict[str, str | None]:
+    """The digest each path's cached candidate caption is keyed on."""
+    pixel_digests: dict[str, str | None] = {}
+    file_digests = source_digests_for(paths, pixel_digests=pixel_digests)
+    return {path: pixel_digests.get(path) or file_digests[path] for path in paths}
+
+
 @cli.command("benchmark-caption-quality")
 @click.option(
     "--fixture",
@@ -4536,21 +7850,75 @@ def benchmark_cpu(
     type=click.IntRange(min=1),
     help="Batch size override; defaults to the selected backend's production batch size.",
 )
+@click.option(
+    "--parallel",
+    default=DEFAULT_GEMMA4_GGUF_PARALLEL,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="gemma4-gguf only: llama-server slots to keep busy at once, to gate --classifier-parallel on caption quality.",
+)
+@click.option(
+    "--prompt-first",
+    is_flag=True,
+    default=False,
+    help="Send the prompt before the image, to gate --classifier-prompt-first on caption quality.",
+)
+@click.option(
+    "--image-tokens",
+    default=None,
+    type=click.Choice([str(tier) for tier in GEMMA4_GGUF_IMAGE_TOKEN_TIERS]),
+    help="gemma4-gguf only: image token budget tier, to gate --classifier-image-tokens on caption quality.",
+)
 @click.option(
     "--output",
     default=".caption-quality-benchmark-result.json",
     show_default=True,
     help="Result artifact written on both pass and failure.",
 )
+@click.option(
+    "--derivative-cache",
+    "derivative_cache",
+    default=None,
+    help="Optional derivative cache file (for example the .derivatives.sqlite beside a DB) to take downsized model inputs from.",
+)
+@click.option(
+    "--result-cache",
+    default=CAPTION_RESULT_CACHE_FILENAME,
+    show_default=True,
+    help="Cache of candidate captions, so a rerun only captions new or changed cases.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Regenerate every caption instead of reading the result cache.",
+)
+@click.option(
+    "--quality-gates-path",
+    default=CAPTION_QUALITY_GATES_PATH,
+    hidden=True,
+    help="Where a pass is recorded for index --classifier-image-tokens.",
+)
 def benchmark_caption_quality(
     fixture: str,
     backend: str,
     model_id: str | None,
     quantization: str | None,
     batch_size: int | None,
+    parallel: int,
+    prompt_first: bool,
+    image_tokens: str | None,
     output: str,
+    derivative_cache: str | None,
+    result_cache: str,
+    refresh: bool,
+    quality_gates_path: str,
 ):
     """Run the frozen semantic caption smoke set with production generation."""
+    if image_tokens and backend != CLASSIFIER_BACKEND_GEMMA4_GGUF:
+        raise click.ClickException("--image-tokens requires --backend gemma4-gguf")
+    image_token_tier = int(image_tokens) if image_tokens else None
+    image_min_tokens, image_max_tokens = gguf_image_token_bounds(image_token_tier)
     with open(fixture, "r", encoding="utf-8") as fh:
         fixture_payload = json.load(fh)
     cases = fixture_payload.get("cases", [])
@@ -4563,43 +7931,104 @@ def benchmark_caption_quality(
         raise click.ClickException(
             f"Caption quality fixture path does not exist: {missing[0]}"
         )
-    lock_fd = acquire_single_instance_lock("caption-quality", global_lock=True)
     classifier = create_classifier(
         backend=backend,
         model_id=model_id,
         quantization=quantization,
         batch_size=batch_size,
+        parallel=parallel,
+        prompt_first=prompt_first,
+        image_min_tokens=image_min_tokens,
+        image_max_tokens=image_max_tokens,
+    )
+    slots = getattr(classifier, "parallel", 1)
+    batch_size = max(classifier.batch_size, slots)
+    pipeline_version = caption_pipeline_version(
+        backend,
+        model_id=model_id,
+        quantization=quantization,
+        batch_size=batch_size,
+        parallel=gguf_parallel_for(backend, parallel),
+        prompt_first=prompt_first,
+        image_tokens=image_token_tier,
     )
-    batch_size = classifier.batch_size
+    # Each case is captioned through the resilient batch path, retries included.
+    # Its raw attempts are cached, not the parse, so a change to parsing or
+    # scoring still applies to cached cases.
+    result_settings = f"{CAPTION_DECODING}:resilient-batch:raw"
     captions: dict[str, Mapping[str, typing.Any]] = {}
-    metrics: list[dict[str, typing.Any]] = []
+    metrics_by_path: dict[str, list[dict[str, typing.Any]]] = {}
     started_at = time.perf_counter()
-    try:
-        classifier.init_model()
-        paths = [str(case["path"]) for case in cases]
-        for batch_start in range(0, len(paths), batch_size):
-            batch_paths = paths[batch_start : batch_start + batch_size]
-            raw_results, batch_metrics = predict_caption_batch_resilient(
-                classifier, [(path, None) for path in batch_paths]
-            )
-            for position, path in enumerate(batch_paths):
-                raw = raw_results[position] if position < len(raw_results) else ""
-                metric = dict(
-                    batch_metrics[position] if position < len(batch_metrics) else {}
-                )
-                retries: list[dict[str, typing.Any]] = []
-                parsed = resolve_caption_result(
-                    classifier, path, None, raw, metric, retries
+    paths = [str(case["path"]) for case in cases]
+    results = CaptionResultCache(result_cache)
+    digests = caption_result_digests(paths)
+    for path in [] if refresh else paths:
+        cached = results.get(digests[path], pipeline_version, result_settings)
+        if cached is None:
+            continue
+        parsed, attempt_metrics = reparse_caption_attempts(path, cached["attempts"])
+        if parsed is not None:
+            captions[path] = parsed
+        metrics_by_path[path] = [
+            {**metric, "path": path, "cached": True} for metric in attempt_metrics
+        ]
+    pending_paths = [path for path in paths if path not in metrics_by_path]
+    log(
+        f"Result cache: {len(paths) - len(pending_paths)} cached, "
+        f"{len(pending_paths)} to caption"
+    )
+    with derivative_cache_at(derivative_cache) as derivatives:
+        # Nothing to caption means nothing to load, and no GPU to lock.
+        lock_fd = (
+            acquire_single_instance_lock("caption-quality", global_lock=True)
+            if pending_paths
+            else None
+        )
+        try:
+            if pending_paths:
+                classifier.init_model()
+            for batch_start in range(0, len(pending_paths), batch_size):
+                batch_paths = pending_paths[batch_start : batch_start + batch_size]
+                raw_results, batch_metrics = predict_caption_batch_resilient(
+                    classifier, [(path, None) for path in batch_paths]
                 )
-                metric["path"] = path
-                metrics.append(metric)
-                metrics.extend({**retry, "path": path} for retry in retries)
-                if parsed is not None:
-                    captions[path] = parsed
-    finally:
-        classifier.release()
-        os.close(lock_fd)
+                for position, path in enumerate(batch_paths):
+                    raw = raw_results[position] if position < len(raw_results) else ""
+                    metric = dict(
+                        batch_metrics[position] if position < len(batch_metrics) else {}
+                    )
+                    # Cached as generated, before parsing marks it up.
+                    attempts = [{"raw": raw, "metric": dict(metric)}]
+                    retries: list[dict[str, typing.Any]] = []
+                    retry_raws: list[str] = []
+                    parsed = resolve_caption_result(
+                        classifier, path, None, raw, metric, retries, retry_raws
+                    )
+                    attempts.extend(
+                        {"raw": retry_raw, "metric": dict(retry_metric)}
+                        for retry_raw, retry_metric in zip(retry_raws, retries)
+                    )
+                    # A failure may be a server timeout rather than the model,
+                    # so, as in the index, only a parsed caption is kept.
+                    if parsed is not None:
+                        results.put(
+                            digests[path],
+                            pipeline_version,
+                            result_settings,
+                            {"attempts": attempts},
+                        )
+                    metrics_by_path[path] = [
+                        {**attempt, "path": path} for attempt in [metric, *retries]
+                    ]
+                    if parsed is not None:
+                        captions[path] = parsed
+        finally:
+            results.close()
+            if lock_fd is not None:
+                classifier.release()
+                os.close(lock_fd)
 
+    metrics = [metric for path in paths for metric in metrics_by_path.get(path, [])]
     evaluation = evaluate_caption_quality_cases(cases, captions)
     payload = {
         "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
@@ -4608,12 +8037,11 @@ def benchmark_caption_quality(
         "modelId": getattr(classifier, "model_id", None),
         "quantization": getattr(classifier, "quantization", None),
         "batchSize": batch_size,
-        "pipelineVersion": caption_pipeline_version(
-            backend,
-            model_id=model_id,
-            quantization=quantization,
-            batch_size=batch_size,
-        ),
+        "parallel": slots,
+        "imageTokens": image_token_tier,
+        "derivativeCache": derivatives.stats() if derivatives else None,
+        "resultCache": results.stats(),
+        "pipelineVersion": pipeline_version,
         "durationMs": round((time.perf_counter() - started_at) * 1000, 2),
         "generationMetrics": metrics,
         # Tags carry the FTS index on their own, so their quality is surfaced as a
@@ -4624,6 +8052,11 @@ def benchmark_caption_quality(
     }
     with open(output, "w", encoding="utf-8") as fh:
         json.dump(payload, fh, indent=2)
+    record_caption_quality_gate(
+        quality_gates_path,
+        caption_quality_gate_key(backend, model_id, quantization, image_token_tier),
+        payload,
+    )
     log(
         f"Caption quality: {evaluation['passedCases']}/{evaluation['totalCases']} passed; "
         f"result written to {output}"
@@ -4638,6 +8071,169 @@ def benchmark_caption_quality(
         )
 
 
+def nearest_rank(ordered: list[float], percent: float) -> float:
+    """The nearest-rank ``percent``th percentile of sorted, non-empty values."""
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def recommend_caption_token_budget(
+    rows: list[Mapping[str, typing.Any]], percentile: float
+) -> dict[str, typing.Any]:
+    """Choose a batch token cap from the lengths batched captions actually took.
+
+    A padded batch decodes until its longest row stops, so the cap is paid by
+    every batch a straggler lands in, and a cap at the worst case is paid far
+    more often than it is needed. A row that hit the cap only says its caption
+    was at least that long, so it counts as longer than any cap this could
+    recommend. Rows are in insertion order, which groups each batch's rows
+    together, and their ``batchSize`` says how many to take per batch. Decode
+    time per step is the median of each batch's generate time over its steps.
+    The saving is then the steps no longer decoded, and the cost is a single
+    retry, at the same step time, for every row the new cap would cut short."""
+    lengths = [
+        math.inf if row.get("hitTokenLimit") else row["tokenCount"] for row in rows
+    ]
+    current_cap = max(
+        (row["maxNewTokens"] for row in rows if row.get("maxNewTokens")),
+        default=CAPTION_BATCH_MAX_NEW_TOKENS,
+    )
+    ordered = sorted(lengths)
+
+    def at(percent: float) -> float:
+        return nearest_rank(ordered, percent)
+
+    target = at(percentile)
+    # Beyond the cap the history cannot say how long captions ran, so it
+    # cannot justify any change.
+    recommended = (
+        current_cap
+        if math.isinf(target)
+        else min(current_cap, max(32, math.ceil(target / 8) * 8))
+    )
+    step_times: list[float] = []
+    batch_steps: list[int] = []
+    position = 0
+    while position < len(rows):
+        size = max(1, rows[position].get("batchSize") or 1)
+        batch = lengths[position : position + size]
+        steps = int(min(current_cap, max(batch)))
+        batch_steps.append(steps)
+        generate_ms = rows[position].get("generateBatchMs")
+        if generate_ms and steps:
+            step_times.append(generate_ms / steps)
+        position += size
+    step_ms = statistics.median(step_times) if step_times else None
+    cut_short = [length for length in lengths if recommended < length < math.inf]
+    return {
+        "samples": len(rows),
+        "currentCap": current_cap,
+        "percentiles": {
+            f"p{percent}": None if math.isinf(at(percent)) else at(percent)
+            for percent in (50, 90, 95, 99)
+        },
+        "targetPercentile": percentile,
+        "recommendedCap": recommended,
+        "currentRetryRate": round(lengths.count(math.inf) / len(rows), 4),
+        "expectedRetryRate": round(
+            (lengths.count(math.inf) + len(cut_short)) / len(rows), 4
+        ),
+        "medianDecodeStepMs": round(step_ms, 3) if step_ms is not None else None,
+        "expectedSavedDecodeMs": (
+            round(
+                sum(steps - min(steps, recommended) for steps in batch_steps) * step_ms,
+                2,
+            )
+            if step_ms is not None
+            else None
+        ),
+        "expectedRetryDecodeMs": (
+            round(sum(cut_short) * step_ms, 2) if step_ms is not None else None
+        ),
+    }
+
+
+@cli.command("caption-token-budget")
+@click.option("--dbpath", required=True, help="Staging SQLite database.")
+@click.option("--pipeline-version", default=None, help="Optional exact version filter.")
+@click.option(
+    "--percentile",
+    default=CAPTION_TOKEN_BUDGET_PERCENTILE,
+    type=click.FloatRange(min=1, max=100),
+    show_default=True,
+    help="Share of batched captions the recommended cap should let finish.",
+)
+@click.option("--output", default=None, help="Optional JSON report path.")
+@click.option(
+    "--apply",
+    is_flag=True,
+    default=False,
+    help=f"Write the recommended cap to {CAPTION_TOKEN_BUDGET_FILENAME} beside the DB, for `index --classifier-learned-token-budget`.",
+)
+def caption_token_budget_report(
+    dbpath: str,
+    pipeline_version: str | None,
+    percentile: float,
+    output: str | None,
+    apply: bool,
+):
+    """Recommend a batch token cap from recorded caption lengths.
+
+    Only the gemma4 (transformers) backend decodes padded batches, so only its
+    rows carry a token count to learn from."""
+    db = Sqlite3Client(dbpath, read_only=True)
+    try:
+        if not db.table_exists("caption_generation_metrics"):
+            raise click.ClickException("Database has no caption generation metrics")
+        version_filter = "AND pipeline_version = ?" if pipeline_version else ""
+        params = (pipeline_version,) if pipeline_version else ()
+        rows = [
+            {
+                "tokenCount": row[0],
+                "hitTokenLimit": row[1] == 1,
+                "maxNewTokens": row[2],
+                "batchSize": row[3],
+                "generateBatchMs": row[4],
+            }
+            for row in db.con.execute(
+                "SELECT token_count, hit_token_limit, max_new_tokens, batch_size, "
+                "generate_batch_ms FROM caption_generation_metrics "
+                f"WHERE attempt = 'batch' AND token_count IS NOT NULL {version_filter} "
+                "ORDER BY id",
+                params,
+            ).fetchall()
+        ]
+    finally:
+        db.con.close()
+    if not rows:
+        raise click.ClickException(
+            "No batched caption token counts matched; only the gemma4 backend "
+            "records them, as llama-server does not decode in padded batches"
+        )
+    report = recommend_caption_token_budget(rows, percentile)
+    pprint.pprint(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if apply:
+        budget_path = caption_token_budget_path_for(dbpath)
+        with open(budget_path, "w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "batchMaxNewTokens": report["recommendedCap"],
+                    "percentile": percentile,
+                    "samples": report["samples"],
+                    "derivedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                },
+                fh,
+                indent=2,
+            )
+        log(
+            f"Wrote a batch cap of {report['recommendedCap']} tokens to {budget_path}. "
+            "`index --classifier-learned-token-budget` uses it, which changes the "
+            "caption pipeline version."
+        )
+
+
 @cli.command("caption-metrics")
 @click.option("--dbpath", required=True, help="Staging SQLite database.")
 @click.option("--pipeline-version", default=None, help="Optional exact version filter.")
@@ -4657,13 +8253,16 @@ def caption_metrics(
             "SELECT path, pipeline_version, attempt, batch_size, max_new_tokens, "
             "token_count, completed_with_eos, completed_with_json, completed_with_schema, "
             "hit_token_limit, parse_success, decode_ms, processor_ms, vision_preparation_ms, "
-            "generate_batch_ms "
-            f"FROM caption_generation_metrics {where}",
+            "generate_batch_ms, prompt_tokens, cached_prompt_tokens, prefill_ms, "
+            f"stream_stop, planned_batch_size FROM caption_generation_metrics {where}",
             params,
         ).fetchall()
         if not rows:
             raise click.ClickException("No caption generation metrics matched")
         generate_times = [row[14] for row in rows if row[14] is not None]
+        prefill_times = [row[17] for row in rows if row[17] is not None]
+        prompt_rows = [row for row in rows if None not in (row[15], row[16])]
+        prompt_tokens = sum(row[15] for row in prompt_rows)
         report = {
             "attempts": len(rows),
             "paths": len({row[0] for row in rows}),
@@ -4671,10 +8270,31 @@ def caption_metrics(
             "completedWithJson": sum(row[7] == 1 for row in rows),
             "completedWithSchema": sum(row[8] == 1 for row in rows),
             "hitTokenLimit": sum(row[9] == 1 for row in rows),
+            "runawayStreamStops": sum(
+                row[18] == CAPTION_STREAM_STOP_RUNAWAY for row in rows
+            ),
             "parseFailures": sum(row[10] == 0 for row in rows),
+            "plannedBatchSizes": {
+                str(size): count
+                for size, count in sorted(
+                    collections.Counter(
+                        row[19]
+                        for row in rows
+                        if row[2] == "batch" and row[19] is not None
+                    ).items()
+                )
+            },
             "medianGenerateBatchMs": (
                 round(statistics.median(generate_times), 2) if generate_times else None
             ),
+            "medianPrefillMs": (
+                round(statistics.median(prefill_times), 2) if prefill_times else None
+            ),
+            "promptCacheHitRate": (
+                round(sum(row[16] for row in prompt_rows) / prompt_tokens, 4)
+                if prompt_tokens
+                else None
+            ),
             "slowest": [
                 {
                     "path": row[0],
@@ -4699,6 +8319,201 @@ def caption_metrics(
             json.dump(report, fh, indent=2)
 
 
+@cli.group("caption-server")
+def caption_server():
+    """Manage the llama-server kept between runs by --classifier-keep-server."""
+
+
+@caption_server.command("status")
+def caption_server_status():
+    """Print the kept server's registry entry, or report that none is running."""
+    with caption_server_registry_lock():
+        entry = read_caption_server_registry()
+        if entry is None:
+            log("No kept caption server is registered.")
+            return
+        idle = caption_server_idle_seconds()
+        status = {
+            **entry,
+            "healthy": caption_server_healthy(entry),
+            "inUse": caption_server_in_use(),
+            "idleSeconds": round(idle) if math.isfinite(idle) else None,
+        }
+    print(json.dumps(status, indent=2))
+
+
+@caption_server.command("stop")
+def caption_server_stop():
+    """Stop the kept server now instead of waiting for its idle timeout."""
+    with caption_server_registry_lock():
+        entry = read_caption_server_registry()
+        if entry is None:
+            log("No kept caption server is registered.")
+            return
+        if caption_server_in_use():
+            raise click.ClickException(
+                f"The kept caption server (PID {entry['pid']}) is in use by a "
+                "running index; stop that run first."
+            )
+        stop_caption_server(entry)
+    log(f"Stopped the kept caption server (PID {entry['pid']}).")
+
+
+@caption_server.command("watch", hidden=True)
+@click.argument("pid", type=int)
+def caption_server_watch(pid: int):
+    """Stop the kept server ``pid`` once it has been idle for its timeout.
+
+    Started detached beside the server, so it outlives the run that started it.
+    It exits without stopping anything once the registry names another server."""
+    while True:
+        time.sleep(CAPTION_SERVER_WATCH_INTERVAL_SECONDS)
+        with caption_server_registry_lock():
+            entry = read_caption_server_registry()
+            if entry is None or int(entry["pid"]) != pid:
+                return
+            if not _pid_alive(pid):
+                write_caption_server_registry(None)
+                return
+            if caption_server_idle_seconds() < float(entry["idleTimeoutSeconds"]):
+                continue
+            if caption_server_in_use():
+                continue
+            stop_caption_server(entry)
+            return
+
+
+def card_vram_used_gb() -> float | None:
+    """GPU memory in use across the whole card, whoever holds it.
+
+    llama-server is a separate process, so this process's allocator sees none
+    of its weights or KV cache."""
+    if not torch.cuda.is_available():
+        return None
+    free, total = torch.cuda.mem_get_info()
+    return (total - free) / 1e9
+
+
+def classifier_sweep_grid(
+    model_id: str | None,
+    quant_tags: typing.Sequence[str],
+    parallels: typing.Sequence[int],
+    threads: typing.Sequence[int],
+    ctx_sizes: typing.Sequence[int],
+    image_min_tokens: typing.Sequence[int],
+    image_max_tokens: typing.Sequence[int],
+) -> list[dict[str, typing.Any]]:
+    """Every combination of the swept llama-server settings, one dict per cell.
+
+    An axis given no values holds the production default (``None``). A quant
+    tag replaces the tag of the model repo, so
+    ``unsloth/gemma-4-E4B-it-GGUF:UD-Q4_K_XL`` swept over ``Q8_0`` becomes
+    ``unsloth/gemma-4-E4B-it-GGUF:Q8_0``."""
+    base_model = model_id or DEFAULT_GEMMA4_GGUF_MODEL_ID
+    if quant_tags and base_model.endswith(".gguf"):
+        raise click.ClickException(
+            "--quant-tag needs a Hugging Face GGUF repo, not a local .gguf file"
+        )
+    models = [f"{base_model.split(':', 1)[0]}:{tag}" for tag in quant_tags] or [
+        base_model
+    ]
+    return [
+        {
+            "modelId": model,
+            "parallel": parallel,
+            "threads": thread_count,
+            "ctxSize": ctx_size,
+            "imageMinTokens": min_tokens,
+            "imageMaxTokens": max_tokens,
+        }
+        for model, parallel, thread_count, ctx_size, min_tokens, max_tokens in (
+            itertools.product(
+                models,
+                parallels or [None],
+                threads or [None],
+                ctx_sizes or [None],
+                image_min_tokens or [None],
+                image_max_tokens or [None],
+            )
+        )
+    ]
+
+
+def run_classifier_sweep_cell(
+    settings: Mapping[str, typing.Any], paths: list[str]
+) -> dict[str, typing.Any]:
+    """Start llama-server with one cell's settings and caption ``paths`` with it.
+
+    The first path is captioned once untimed, to warm the server and its prompt
+    cache, and then every path is timed as the index would send them, with
+    ``parallel`` requests in flight. Latency is per request, and throughput is
+    over the whole timed pass. VRAM is the most the card held beyond what it
+    held before the server started. A cell that fails, for example because its
+    context does not fit, records the error and the sweep moves on."""
+    classifier = create_classifier(
+        backend=CLASSIFIER_BACKEND_GEMMA4_GGUF,
+        model_id=settings["modelId"],
+        parallel=settings["parallel"],
+        threads=settings["threads"],
+        ctx_size=settings["ctxSize"],
+        image_min_tokens=settings["imageMinTokens"],
+        image_max_tokens=settings["imageMaxTokens"],
+    )
+    baseline_gb = card_vram_used_gb()
+    peak_gb = baseline_gb
+    latencies: list[float] = []
+    parsed = 0
+    cell: dict[str, typing.Any] = {**settings, "error": None}
+    try:
+        init_started_at = time.perf_counter()
+        classifier.init_model()
+        cell["initMs"] = round((time.perf_counter() - init_started_at) * 1000, 2)
+        classifier.predict(paths[0], None)
+        batch_size = max(classifier.batch_size, getattr(classifier, "parallel", 1))
+        started_at = time.perf_counter()
+        for batch_start in range(0, len(paths), batch_size):
+            batch_paths = paths[batch_start : batch_start + batch_size]
+            raw_results = classifier.predict_batch(
+                [(path, None) for path in batch_paths]
+            )
+            for raw, metric in zip(raw_results, classifier.last_generation_metrics):
+                if metric.get("durationMs") is not None:
+                    latencies.append(metric["durationMs"])
+                try:
+                    parse_classifier_response(raw)
+                    parsed += 1
+                except (KeyError, TypeError, ValueError):
+                    pass
+            used_gb = card_vram_used_gb()
+            if used_gb is not None and peak_gb is not None:
+                peak_gb = max(peak_gb, used_gb)
+        elapsed = time.perf_counter() - started_at
+        cell["imagesPerSecond"] = round(len(paths) / elapsed, 3) if elapsed else None
+    except Exception as err:  # noqa: BLE001 -- one bad cell must not end the sweep
+        log(f"Sweep cell {settings} failed: {err}")
+        cell["error"] = str(err)
+    finally:
+        classifier.release()
+    ordered = sorted(latencies)
+    cell.update(
+        {
+            "samples": len(paths),
+            "p50LatencyMs": nearest_rank(ordered, 50) if ordered else None,
+            "p95LatencyMs": nearest_rank(ordered, 95) if ordered else None,
+            "vramGb": (
+                round(peak_gb - baseline_gb, 2)
+                if peak_gb is not None and baseline_gb is not None
+                else None
+            ),
+            "parseSuccess": parsed,
+            "parseSuccessRate": round(parsed / len(paths), 4) if paths else None,
+        }
+    )
+    cell.setdefault("imagesPerSecond", None)
+    cell.setdefault("initMs", None)
+    return cell
+
+
 @cli.command("benchmark-classifier")
 @click.option(
     "--path",
@@ -4746,6 +8561,80 @@ def caption_metrics(
     default=None,
     help="Optional JSON output file for the benchmark summary.",
 )
+@click.option(
+    "--derivative-cache",
+    "derivative_cache",
+    default=None,
+    help="Optional derivative cache file (for example the .derivatives.sqlite beside a DB) to take downsized model inputs from.",
+)
+@click.option(
+    "--sweep",
+    is_flag=True,
+    default=False,
+    help="gemma4-gguf only: time every combination of the swept llama-server settings over a balanced sample of --glob.",
+)
+@click.option("--glob", default=None, help="Sweep only: glob of images to sample.")
+@click.option(
+    "--sample-size",
+    default=16,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Sweep only: images to caption per cell.",
+)
+@click.option(
+    "--seed",
+    default=7,
+    type=int,
+    show_default=True,
+    help="Sweep only: random seed for balanced album sampling.",
+)
+@click.option(
+    "--quant-tag",
+    "quant_tags",
+    multiple=True,
+    help="Sweep axis: GGUF quant tag of the model repo, for example Q8_0. Repeatable.",
+)
+@click.option(
+    "--parallel",
+    "parallels",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Sweep axis: llama-server slots. Repeatable.",
+)
+@click.option(
+    "--threads",
+    "thread_counts",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Sweep axis: llama-server CPU threads. Repeatable.",
+)
+@click.option(
+    "--ctx-size",
+    "ctx_sizes",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Sweep axis: llama-server context size. Repeatable.",
+)
+@click.option(
+    "--image-min-tokens",
+    "image_min_tokens",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Sweep axis: fewest tokens an image is encoded to. Repeatable.",
+)
+@click.option(
+    "--image-max-tokens",
+    "image_max_tokens",
+    multiple=True,
+    type=click.IntRange(min=1),
+    help="Sweep axis: most tokens an image is encoded to. Repeatable.",
+)
+@click.option(
+    "--output-md",
+    default=".classifier-sweep.md",
+    show_default=True,
+    help="Sweep only: Markdown report path. The JSON goes to --output (default .classifier-sweep.json).",
+)
 def benchmark_classifier(
     image_path: str,
     backend: str,
@@ -4755,7 +8644,59 @@ def benchmark_classifier(
     low_impact: bool,
     repeat: int,
     output: str | None,
+    derivative_cache: str | None,
+    sweep: bool,
+    glob: str | None,
+    sample_size: int,
+    seed: int,
+    quant_tags: tuple[str, ...],
+    parallels: tuple[int, ...],
+    thread_counts: tuple[int, ...],
+    ctx_sizes: tuple[int, ...],
+    image_min_tokens: tuple[int, ...],
+    image_max_tokens: tuple[int, ...],
+    output_md: str,
 ):
+    if sweep:
+        if backend != CLASSIFIER_BACKEND_GEMMA4_GGUF:
+            raise click.ClickException("--sweep requires --backend gemma4-gguf")
+        if not glob:
+            raise click.ClickException("--sweep requires --glob")
+        paths = sample_balanced_paths(
+            find_files(".", glob), sample_size=sample_size, seed=seed
+        )
+        if not paths:
+            raise click.ClickException(f"No images match {glob}")
+        grid = classifier_sweep_grid(
+            model_id,
+            quant_tags,
+            parallels,
+            thread_counts,
+            ctx_sizes,
+            image_min_tokens,
+            image_max_tokens,
+        )
+        cells = []
+        with derivative_cache_at(derivative_cache) as derivatives:
+            for cell_index, settings in enumerate(grid, start=1):
+                log(f"Sweep cell {cell_index}/{len(grid)}: {settings}")
+                cells.append(run_classifier_sweep_cell(settings, paths))
+        summary = {
+            "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "backend": backend,
+            "glob": glob,
+            "sampleSize": len(paths),
+            "seed": seed,
+            "derivativeCache": derivatives.stats() if derivatives else None,
+        }
+        output = output or ".classifier-sweep.json"
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump({"summary": summary, "cells": cells}, fh, indent=2)
+        with open(output_md, "w", encoding="utf-8") as fh:
+            fh.write(build_classifier_sweep_markdown(summary, cells))
+        print(f"Sweep written to {output} and {output_md}")
+        return
+
     classifier = create_classifier(
         backend=backend,
         model_id=model_id,
@@ -4769,27 +8710,28 @@ def benchmark_classifier(
     # subprocess holding ~5-6GB of VRAM that outlives this command.
     init_started_at = time.perf_counter()
     runs = []
-    try:
-        classifier.init_model()
-        init_ms = (time.perf_counter() - init_started_at) * 1000
-
-        geocode = {"city": "Singapore", "country": "Singapore"}
-        for run_index in range(repeat):
-            started_at = time.perf_counter()
-            raw_output = classifier.predict(image_path, geocode)
-            duration_ms = (time.perf_counter() - started_at) * 1000
-            parsed = parse_classifier_response(raw_output)
-            runs.append(
-                {
-                    "run": run_index + 1,
-                    "durationMs": round(duration_ms, 2),
-                    "outputChars": len(raw_output),
-                    "tagCount": len(parsed.get("tags", [])),
-                    "altTextLength": len(parsed.get("alt_text") or ""),
-                }
-            )
-    finally:
-        classifier.release()
+    with derivative_cache_at(derivative_cache) as derivatives:
+        try:
+            classifier.init_model()
+            init_ms = (time.perf_counter() - init_started_at) * 1000
+
+            geocode = {"city": "Singapore", "country": "Singapore"}
+            for run_index in range(repeat):
+                started_at = time.perf_counter()
+                raw_output = classifier.predict(image_path, geocode)
+                duration_ms = (time.perf_counter() - started_at) * 1000
+                parsed = parse_classifier_response(raw_output)
+                runs.append(
+                    {
+                        "run": run_index + 1,
+                        "durationMs": round(duration_ms, 2),
+                        "outputChars": len(raw_output),
+                        "tagCount": len(parsed.get("tags", [])),
+                        "altTextLength": len(parsed.get("alt_text") or ""),
+                    }
+                )
+        finally:
+            classifier.release()
 
     summary = {
         "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
@@ -4803,6 +8745,7 @@ def benchmark_classifier(
             statistics.median([run["durationMs"] for run in runs]),
             2,
         ),
+        "derivativeCache": derivatives.stats() if derivatives else None,
         "runs": runs,
     }
     pprint.pprint(summary)
@@ -4875,6 +8818,24 @@ def benchmark_classifier(
     default=".caption-comparison.md",
     help="Markdown report path for the side-by-side review summary.",
 )
+@click.option(
+    "--derivative-cache",
+    "derivative_cache",
+    default=None,
+    help="Optional derivative cache file (for example the .derivatives.sqlite beside a DB) to take downsized model inputs from.",
+)
+@click.option(
+    "--result-cache",
+    default=CAPTION_RESULT_CACHE_FILENAME,
+    show_default=True,
+    help="Cache of candidate captions, so a rerun only captions new or changed samples.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Regenerate every candidate caption instead of reading the result cache.",
+)
 def compare_captioners(
     glob: str,
     baseline_dbpath: str | None,
@@ -4887,6 +8848,9 @@ def compare_captioners(
     candidate_low_impact: bool,
     output_json: str,
     output_md: str,
+    derivative_cache: str | None,
+    result_cache: str,
+    refresh: bool,
 ):
     files = find_files(".", glob)
     sampled_paths = sample_balanced_paths(files, sample_size=sample_size, seed=seed)
@@ -4899,54 +8863,88 @@ def compare_captioners(
         gpu_headroom_gb=candidate_gpu_headroom_gb,
         low_impact=candidate_low_impact,
     )
+    # predict() captions one image at a time.
+    pipeline_version = caption_pipeline_version(
+        candidate_backend,
+        model_id=candidate_model_id,
+        quantization=candidate_quantization,
+        batch_size=1,
+    )
+    result_settings = f"{CAPTION_DECODING}:single"
+    results = CaptionResultCache(result_cache)
+    digests = caption_result_digests(sampled_paths)
+    cached_outputs: dict[str, dict[str, typing.Any]] = {}
+    for path in [] if refresh else sampled_paths:
+        cached = results.get(digests[path], pipeline_version, result_settings)
+        if cached is not None:
+            cached_outputs[path] = cached
     rows = []
     verdict_counts = {"candidate_better": 0, "neutral": 0, "baseline_better": 0}
     parse_success = 0
 
     # A mid-comparison failure must still release the candidate, or a GGUF
     # backend leaves its llama-server subprocess (~5-6GB VRAM) resident after
-    # this command exits. getattr on the released classifier below still works —
-    # release frees the server, not the recorded model id/quantisation.
-    try:
-        candidate.init_model()
-        for index_value, path in enumerate(sampled_paths, start=1):
-            print(
-                f"[{index_value}/{len(sampled_paths)}] comparing {os.path.basename(path)}"
-            )
-            baseline = baseline_db.get_image_row(path) if baseline_db else None
-            started_at = time.perf_counter()
-            candidate_raw = candidate.predict(path, None)
-            duration_ms = (time.perf_counter() - started_at) * 1000
-            try:
-                candidate_parsed = parse_classifier_response(candidate_raw)
-                parse_success += 1
-                parse_error = None
-            except (KeyError, TypeError, ValueError) as err:
-                candidate_parsed = {
-                    "tags": [],
-                    "alt_text": "",
-                }
-                parse_error = str(err)
-            comparison = compare_caption_payloads(baseline, candidate_parsed)
-            verdict_counts[comparison["verdict"]] += 1
-            rows.append(
-                {
-                    "path": path,
-                    "baseline": baseline,
-                    "candidate": {
-                        "backend": candidate_backend,
-                        "modelId": getattr(candidate, "model_id", None),
-                        "quantization": getattr(candidate, "quantization", None),
-                        "raw": candidate_raw,
-                        "parsed": candidate_parsed,
-                        "parseError": parse_error,
-                        "durationMs": round(duration_ms, 2),
-                    },
-                    "comparison": comparison,
-                }
-            )
-    finally:
-        candidate.release()
+    # this command exits. getattr on the released classifier below still works —
+    # release frees the server, not the recorded model id/quantisation.
+    with derivative_cache_at(derivative_cache) as derivatives:
+        try:
+            # A fully cached sample is re-scored without loading the candidate.
+            if len(cached_outputs) < len(sampled_paths):
+                candidate.init_model()
+            for index_value, path in enumerate(sampled_paths, start=1):
+                print(
+                    f"[{index_value}/{len(sampled_paths)}] "
+                    f"comparing {os.path.basename(path)}"
+                )
+                baseline = baseline_db.get_image_row(path) if baseline_db else None
+                # The raw output is cached, not the parse, so a change to parsing
+                # or scoring still applies to cached samples.
+                cached = cached_outputs.get(path)
+                if cached is not None:
+                    candidate_raw = cached["raw"]
+                    duration_ms = cached["durationMs"]
+                else:
+                    started_at = time.perf_counter()
+                    candidate_raw = candidate.predict(path, None)
+                    duration_ms = (time.perf_counter() - started_at) * 1000
+                    results.put(
+                        digests[path],
+                        pipeline_version,
+                        result_settings,
+                        {"raw": candidate_raw, "durationMs": duration_ms},
+                    )
+                try:
+                    candidate_parsed = parse_classifier_response(candidate_raw)
+                    parse_success += 1
+                    parse_error = None
+                except (KeyError, TypeError, ValueError) as err:
+                    candidate_parsed = {
+                        "tags": [],
+                        "alt_text": "",
+                    }
+                    parse_error = str(err)
+                comparison = compare_caption_payloads(baseline, candidate_parsed)
+                verdict_counts[comparison["verdict"]] += 1
+                rows.append(
+                    {
+                        "path": path,
+                        "baseline": baseline,
+                        "candidate": {
+                            "backend": candidate_backend,
+                            "modelId": getattr(candidate, "model_id", None),
+                            "quantization": getattr(candidate, "quantization", None),
+                            "raw": candidate_raw,
+                            "parsed": candidate_parsed,
+                            "parseError": parse_error,
+                            "durationMs": round(duration_ms, 2),
+                            "cached": cached is not None,
+                        },
+                        "comparison": comparison,
+                    }
+                )
+        finally:
+            results.close()
+            candidate.release()
 
     candidate_durations = [row["candidate"]["durationMs"] for row in rows]
     summary = {
@@ -4962,6 +8960,9 @@ def compare_captioners(
         ),
         "candidateParseSuccess": parse_success,
         "verdictCounts": verdict_counts,
+        "derivativeCache": derivatives.stats() if derivatives else None,
+        "pipelineVersion": pipeline_version,
+        "resultCache": results.stats(),
     }
 
     report = {
@@ -4998,10 +8999,44 @@ def compare_captioners(
 )
 @click.option("--repeat", default=3, help="Runs per batch size.")
 @click.option("--output", default=None, help="Optional JSON output file.")
+@click.option(
+    "--derivative-cache",
+    "derivative_cache",
+    default=None,
+    help="Optional derivative cache file (for example the .derivatives.sqlite beside a DB) to take downsized model inputs from.",
+)
+@click.option(
+    "--prefetch-depth",
+    default=EMBEDDER_PREFETCH_DEPTH,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Batches decoded ahead in the prefetched run.",
+)
 def benchmark_embedder_batch(
-    image_path: str, model: str, batch_sizes: str, repeat: int, output: str | None
+    image_path: str,
+    model: str,
+    batch_sizes: str,
+    repeat: int,
+    output: str | None,
+    derivative_cache: str | None,
+    prefetch_depth: int,
 ):
-    """Compare single-image vs batched SigLIP embedding throughput."""
+    """Compare single-image, batched and prefetched SigLIP embedding throughput."""
+    with derivative_cache_at(derivative_cache) as derivatives:
+        summary = _benchmark_embedder_batch(
+            image_path, model, batch_sizes, repeat, prefetch_depth
+        )
+    summary["derivativeCache"] = derivatives.stats() if derivatives else None
+    pprint.pprint(summary)
+    if output:
+        with open(output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"Benchmark written to {output}")
+
+
+def _benchmark_embedder_batch(
+    image_path: str, model: str, batch_sizes: str, repeat: int, prefetch_depth: int
+) -> dict[str, typing.Any]:
     embedder = Siglip2Embedder() if model == "siglip2" else SiglipEmbedder()
 
     init_started_at = time.perf_counter()
@@ -5032,6 +9067,17 @@ def benchmark_embedder_batch(
             batch_ms = (time.perf_counter() - started_at) * 1000
             batch_runs.append(round(batch_ms / batch_size, 2))
 
+        # Prefetched: the same batch `repeat` times back to back, as
+        # run_embedding_pass walks a pass, decoding ahead of the device.
+        started_at = time.perf_counter()
+        with EmbeddingPrefetcher(
+            embedder, [paths] * repeat, depth=prefetch_depth
+        ) as prefetcher:
+            for batch_index in range(repeat):
+                prefetcher.embed(batch_index)
+        prefetched_ms = (time.perf_counter() - started_at) * 1000
+        prefetch = prefetcher.stats()
+
         seq_median = statistics.median(seq_runs)
         batch_median = statistics.median(batch_runs)
         speedup = round(seq_median / batch_median, 2) if batch_median else None
@@ -5039,9 +9085,13 @@ def benchmark_embedder_batch(
             "sequentialMsPerImage": round(seq_median, 2),
             "batchedMsPerImage": round(batch_median, 2),
             "speedup": speedup,
+            "prefetchedMsPerImage": round(prefetched_ms / (batch_size * repeat), 2),
+            "prefetch": prefetch,
         }
         print(
-            f"batch={batch_size:2d}: seq {seq_median:.1f}ms  batched {batch_median:.1f}ms  speedup {speedup}x"
+            f"batch={batch_size:2d}: seq {seq_median:.1f}ms  batched {batch_median:.1f}ms  speedup {speedup}x  "
+            f"prefetched {results_by_size[batch_size]['prefetchedMsPerImage']:.1f}ms  "
+            f"overlap {prefetch['overlap']:.0%}"
         )
 
     summary = {
@@ -5049,14 +9099,11 @@ def benchmark_embedder_batch(
         "model": embedder.MODEL_ID,
         "path": image_path,
         "repeat": repeat,
+        "prefetchDepth": prefetch_depth,
         "initMs": round(init_ms, 2),
         "resultsByBatchSize": results_by_size,
     }
-    pprint.pprint(summary)
-    if output:
-        with open(output, "w", encoding="utf-8") as fh:
-            json.dump(summary, fh, indent=2)
-        print(f"Benchmark written to {output}")
+    return summary
 
 
 def sqlite_quick_check(dbpath: Path) -> str:
@@ -5239,6 +9286,13 @@ def validate_index_database(
     classifier_max_new_tokens: int | None = None,
     classifier_batch_max_new_tokens: int | None = None,
     media_root: str = DEFAULT_MEDIA_ROOT,
+    verify_digests: bool = False,
+    classifier_parallel: int | None = None,
+    classifier_prompt_first: bool = False,
+    classifier_adaptive_batch: bool = False,
+    classifier_retry_batch_size: int | None = None,
+    classifier_retry_max_new_tokens: int | None = None,
+    classifier_image_tokens: int | None = None,
 ) -> dict:
     """Validate exact source coverage and all published cross-table contracts."""
     set_media_root(media_root)
@@ -5346,6 +9400,12 @@ def validate_index_database(
                             classifier_batch_size,
                             classifier_max_new_tokens,
                             classifier_batch_max_new_tokens,
+                            gguf_parallel_for(classifier_backend, classifier_parallel),
+                            classifier_prompt_first,
+                            classifier_adaptive_batch,
+                            classifier_retry_batch_size,
+                            classifier_retry_max_new_tokens,
+                            classifier_image_tokens,
                         ),
                         resolve_classifier_model_id(
                             classifier_backend, classifier_model_id
@@ -5395,7 +9455,14 @@ def validate_index_database(
         }
         # Provenance is pinned to the pixels the models saw, which for a video
         # is its poster frame — the same rule the index run applies.
-        digests = source_digests_for(sorted(expected), media_root)
+        pixel_digests: dict[str, str | None] = {}
+        digests = source_digests_for(
+            sorted(expected),
+            media_root,
+            digest_cache=digest_cache_path_for(dbpath),
+            verify=verify_digests,
+            pixel_digests=pixel_digests,
+        )
         for stage, version, model_id in stages:
             for path in expected:
                 # Scenes are embedding-only by design, so a caption stage they
@@ -5403,7 +9470,9 @@ def validate_index_database(
                 if stage == CAPTION_STAGE and not needs_caption_for(path):
                     continue
                 state = state_rows.get((path, stage))
-                if state is None or state[0] != digests[path]:
+                if state is None or not stage_pin_is_current(
+                    stage, state[0], digests[path], pixel_digests[path]
+                ):
                     raise click.ClickException(
                         f"validate: stale or missing {stage} provenance for {path}"
                     )
@@ -5419,6 +9488,7 @@ def validate_index_database(
                     rewritten = rewrite_default_caption_provenance(stored_version)
                     if rewritten is not None:
                         stored_version, stored_model_id = rewritten
+                    stored_version = caption_version_source(stored_version)
                 if version and stored_version != version:
                     raise click.ClickException(
                         f"validate: unexpected {stage} pipeline version for {path}"
@@ -5459,16 +9529,40 @@ def validate_index_database(
 @click.option("--classifier-model-id", default=None)
 @click.option("--classifier-quantization", default=None)
 @click.option("--classifier-batch-size", default=None, type=click.IntRange(min=1))
+@click.option("--classifier-adaptive-batch", is_flag=True, default=False)
 @click.option("--classifier-max-new-tokens", default=None, type=click.IntRange(min=32))
 @click.option(
     "--classifier-batch-max-new-tokens", default=None, type=click.IntRange(min=32)
 )
+@click.option("--classifier-learned-token-budget", is_flag=True, default=False)
+@click.option(
+    "--classifier-parallel",
+    default=DEFAULT_GEMMA4_GGUF_PARALLEL,
+    type=click.IntRange(min=1),
+    show_default=True,
+)
+@click.option("--classifier-prompt-first", is_flag=True, default=False)
+@click.option("--classifier-retry-batch-size", default=1, type=click.IntRange(min=1))
+@click.option(
+    "--classifier-retry-max-new-tokens", default=None, type=click.IntRange(min=32)
+)
+@click.option(
+    "--classifier-image-tokens",
+    default=None,
+    type=click.Choice([str(tier) for tier in GEMMA4_GGUF_IMAGE_TOKEN_TIERS]),
+)
 @click.option(
     "--media-root",
     default=DEFAULT_MEDIA_ROOT,
     show_default=True,
     help="Public album cache holding video poster frames and their sidecars.",
 )
+@click.option(
+    "--verify-digests",
+    is_flag=True,
+    default=False,
+    help="Re-hash every source instead of trusting the digest cache for unchanged files.",
+)
 def validate_command(
     glob_pattern: str,
     dbpath: str,
@@ -5477,9 +9571,17 @@ def validate_command(
     classifier_model_id: str | None,
     classifier_quantization: str | None,
     classifier_batch_size: int | None,
+    classifier_adaptive_batch: bool,
     classifier_max_new_tokens: int | None,
     classifier_batch_max_new_tokens: int | None,
+    classifier_learned_token_budget: bool,
+    classifier_parallel: int,
+    classifier_prompt_first: bool,
+    classifier_retry_batch_size: int,
+    classifier_retry_max_new_tokens: int | None,
+    classifier_image_tokens: str | None,
     media_root: str,
+    verify_digests: bool,
 ):
     summary = validate_index_database(
         dbpath,
@@ -5490,8 +9592,20 @@ def validate_command(
         classifier_quantization,
         classifier_batch_size,
         classifier_max_new_tokens,
-        classifier_batch_max_new_tokens,
+        resolve_batch_max_new_tokens(
+            dbpath,
+            classifier_batch_max_new_tokens,
+            classifier_learned_token_budget,
+            classifier_backend,
+        ),
         media_root,
+        verify_digests,
+        classifier_parallel,
+        classifier_prompt_first,
+        classifier_adaptive_batch,
+        classifier_retry_batch_size,
+        classifier_retry_max_new_tokens,
+        int(classifier_image_tokens) if classifier_image_tokens else None,
     )
     log(f"Validated {summary['paths']} path(s) across {summary['stages']} stage(s)")
 
@@ -5999,7 +10113,10 @@ def update_gps(dbpath: str, match: str | None, dry_run: bool):
                 cur,
             )
             tags_changed = True
-            digest = file_content_sha256(path)
+            # The geotag tool rewrote EXIF, not pixels: core follows the new
+            # file digest, while the model stages are re-pinned to the pixel
+            # digest they are keyed on.
+            digest, pixel_digest = file_content_digests(path)
             if digest is not None:
                 db.upsert_pipeline_state(
                     path,
@@ -6016,7 +10133,7 @@ def update_gps(dbpath: str, match: str | None, dry_run: bool):
                     db.upsert_pipeline_state(
                         path,
                         CAPTION_STAGE,
-                        digest,
+                        pixel_digest,
                         caption_version,
                         caption_model,
                         cur,
@@ -6029,7 +10146,7 @@ def update_gps(dbpath: str, match: str | None, dry_run: bool):
                         db.upsert_pipeline_state(
                             path,
                             stage,
-                            digest,
+                            pixel_digest,
                             embedding_pipeline_version(model_id),
                             model_id,
                             cur,
@@ -6276,15 +10393,384 @@ def file_content_sha256(path: str) -> str | None:
 def file_content_sha256_many(
     paths: typing.Iterable[str], workers: int = FILE_HASH_WORKERS
 ) -> dict[str, str | None]:
-    """Fingerprint paths concurrently while preserving deterministic path mapping."""
+    """Fingerprint paths concurrently while preserving deterministic path mapping.
+
+    Concurrency is the shared io lane's; ``workers`` of 1 hashes serially."""
     resolved_paths = list(paths)
     if workers <= 1 or len(resolved_paths) <= 1:
         return {path: file_content_sha256(path) for path in resolved_paths}
-    with concurrent.futures.ThreadPoolExecutor(
-        max_workers=min(workers, len(resolved_paths))
-    ) as executor:
-        digests = executor.map(file_content_sha256, resolved_paths)
-        return dict(zip(resolved_paths, digests))
+    digests = executor_lane("io").map(file_content_sha256, resolved_paths)
+    return dict(zip(resolved_paths, digests))
+
+
+JPEG_PIXEL_DIGEST_VERSION = b"jpeg-pixels-v1"
+# Markers carrying no length field: TEM and the restart markers RST0-7.
+JPEG_STANDALONE_MARKERS = frozenset([0x01, *range(0xD0, 0xD8)])
+JPEG_EXIF_ORIENTATION_TAG = 0x0112
+
+
+def jpeg_pixel_sha256(data: bytes) -> str | None:
+    """Digest of what a JPEG decodes to, ignoring its metadata segments.
+
+    Hashes every marker segment except APPn and COM — so the frame header,
+    quantisation and Huffman tables stay in — plus the entropy-coded scan data,
+    up to EOI. Anything after EOI (camera-embedded previews) is ignored too.
+    APP1 is skipped except for its EXIF orientation, which ``exif_transpose``
+    applies before the captioner sees the photo and so is part of its input.
+
+    Returns ``None`` for anything that is not a well-formed baseline or
+    progressive JPEG; callers fall back to the whole-file digest, which is
+    always safe, just less forgiving of metadata edits."""
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    digest = hashlib.sha256(JPEG_PIXEL_DIGEST_VERSION)
+    orientation = None
+    position = 2
+    size = len(data)
+    saw_scan = False
+    while position + 1 < size:
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker == 0xD9:
+            break
+        if position + 4 > size:
+            return None
+        (length,) = struct.unpack(">H", data[position + 2 : position + 4])
+        end = position + 2 + length
+        if length < 2 or end > size:
+            return None
+        if (
+            marker == 0xE1
+            and orientation is None
+            and data.startswith(b"Exif\x00\x00", position + 4)
+        ):
+            # Only the first EXIF block counts, as it does for PIL's decoder.
+            try:
+                exif = Image.Exif()
+                exif.load(data[position + 4 : end])
+                orientation = int(exif.get(JPEG_EXIF_ORIENTATION_TAG, 1))
+            except (OSError, SyntaxError, ValueError, TypeError, struct.error):
+                return None
+        if not (0xE0 <= marker <= 0xEF or marker == 0xFE):
+            digest.update(data[position:end])
+        position = end
+        if marker == 0xDA:
+            # Entropy-coded data runs to the next marker that is neither a
+            # stuffed 0xFF00 nor a restart marker.
+            saw_scan = True
+            scan_end = position
+            while True:
+                scan_end = data.find(b"\xff", scan_end)
+                if scan_end < 0 or scan_end + 1 >= size:
+                    scan_end = size
+                    break
+                following = data[scan_end + 1]
+                if following == 0x00 or 0xD0 <= following <= 0xD7:
+                    scan_end += 2
+                    continue
+                break
+            digest.update(data[position:scan_end])
+            position = scan_end
+    if not saw_scan:
+        return None
+    digest.update(f"orientation={orientation or 1}".encode())
+    return digest.hexdigest()
+
+
+def pixel_digest_of(data: bytes) -> str:
+    """The pixel digest of a source's bytes, or their whole-file digest."""
+    return jpeg_pixel_sha256(data) or hashlib.sha256(data).hexdigest()
+
+
+def file_content_digests(path: str) -> tuple[str | None, str | None]:
+    """(file digest, pixel digest) from one read, or ``(None, None)``.
+
+    The pixel digest is the whole-file digest again for a source that is not a
+    parseable JPEG, so pixel-pinned stages degrade to today's behaviour rather
+    than to no provenance."""
+    try:
+        data = read_source_bytes(path)
+    except OSError:
+        return None, None
+    file_digest = hashlib.sha256(data).hexdigest()
+    return file_digest, jpeg_pixel_sha256(data) or file_digest
+
+
+def file_content_digests_many(
+    paths: typing.Iterable[str], workers: int = FILE_HASH_WORKERS
+) -> dict[str, tuple[str | None, str | None]]:
+    """``file_content_digests`` for many paths, on the io lane and in path order."""
+    resolved_paths = list(paths)
+    if workers <= 1 or len(resolved_paths) <= 1:
+        return {path: file_content_digests(path) for path in resolved_paths}
+    digests = executor_lane("io").map(file_content_digests, resolved_paths)
+    return dict(zip(resolved_paths, digests))
+
+
+def digest_cache_path_for(dbpath: str) -> str:
+    """The digest cache sidecar that serves ``dbpath``."""
+    return os.path.join(os.path.dirname(os.path.abspath(dbpath)), DIGEST_CACHE_FILENAME)
+
+
+def caption_token_budget_path_for(dbpath: str) -> str:
+    """The learned caption token budget sidecar that serves ``dbpath``."""
+    return os.path.join(
+        os.path.dirname(os.path.abspath(dbpath)), CAPTION_TOKEN_BUDGET_FILENAME
+    )
+
+
+def resolve_batch_max_new_tokens(
+    dbpath: str, explicit: int | None, learned: bool, backend: str
+) -> int | None:
+    if not learned:
+        return explicit
+    if backend != CLASSIFIER_BACKEND_GEMMA4:
+        # llama-server decodes each caption alone, at its single cap, so a
+        # learned batch cap would only restamp the version.
+        raise click.ClickException(
+            "--classifier-learned-token-budget requires --classifier-backend gemma4"
+        )
+    if explicit is not None:
+        raise click.ClickException(
+            "--classifier-learned-token-budget and "
+            "--classifier-batch-max-new-tokens are mutually exclusive"
+        )
+    return read_learned_batch_max_new_tokens(dbpath)
+
+
+def read_learned_batch_max_new_tokens(dbpath: str) -> int:
+    path = caption_token_budget_path_for(dbpath)
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return int(json.load(fh)["batchMaxNewTokens"])
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        raise click.ClickException(
+            f"No usable learned token budget at {path} ({err}); "
+            "run `caption-token-budget --apply` first"
+        ) from err
+
+
+def caption_quality_gate_key(
+    backend: str,
+    model_id: str | None,
+    quantization: str | None,
+    image_tokens: int | None,
+) -> str:
+    """The caption pipeline version a quality gate is recorded under.
+
+    Only the model and the image budget: batching and token caps change how a
+    caption is scheduled, not how much of the photo the model sees."""
+    return caption_pipeline_version(
+        backend, model_id, quantization, image_tokens=image_tokens
+    )
+
+
+def read_caption_quality_gates(path: str) -> dict[str, dict[str, typing.Any]]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def record_caption_quality_gate(
+    path: str, key: str, payload: Mapping[str, typing.Any]
+) -> None:
+    """Record a benchmark-caption-quality pass under ``key``, or drop a
+    previous pass that this run failed."""
+    gates = read_caption_quality_gates(path)
+    if payload["passed"]:
+        gates[key] = {
+            "pipelineVersion": payload["pipelineVersion"],
+            "passed": True,
+            "fixtureVersion": payload["fixtureVersion"],
+            "passedCases": payload["passedCases"],
+            "totalCases": payload["totalCases"],
+            "generatedAt": payload["generatedAt"],
+        }
+    elif gates.pop(key, None) is None:
+        return
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(gates, fh, indent=2)
+
+
+def require_caption_quality_gate(path: str, key: str, image_tokens: int) -> None:
+    try:
+        gate = read_caption_quality_gates(path).get(key)
+    except (OSError, ValueError) as err:
+        raise click.ClickException(
+            f"Caption quality gates at {path} are unreadable ({err})"
+        ) from err
+    if not gate or gate.get("passed") is not True:
+        raise click.ClickException(
+            f"--classifier-image-tokens {image_tokens} has no passing "
+            f"benchmark-caption-quality result for this model in {path}; run "
+            f"`benchmark-caption-quality --backend gemma4-gguf --image-tokens "
+            f"{image_tokens}` with the same model first"
+        )
+
+
+def digest_cache_key(stat: os.stat_result) -> tuple[int, int, int, int, int]:
+    """(device, inode, mtime_ns, ctime_ns, size) identifying one version of a file.
+
+    mtime and size alone are not enough — ``file_content_sha256`` exists because
+    photo-management tools can preserve both while replacing an image. Such a
+    replacement either lands as a new inode (write-and-rename) or rewrites in
+    place and then restores mtime, which the kernel records as a ctime change.
+    Neither is something a user can set, so the tuple moves whenever the bytes
+    can have. A chmod moves it too, which costs one re-hash and nothing else."""
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+
+
+def _stat_or_none(path: str) -> os.stat_result | None:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+class ContentDigestCache:
+    """SHA-256 per file version, so planning re-reads only files that changed.
+
+    ``index``, ``index --dry-run`` and ``validate`` all fingerprint every source
+    to compare against stage provenance, which over the full library is a
+    sequential read of hundreds of GB even when nothing changed. A ``stat`` per
+    file is cheap by comparison, so digests are remembered against the
+    ``digest_cache_key`` tuple and a file is hashed again only once it moves.
+
+    The cache lives in a sidecar rather than the index database: the database is
+    published to the site and opened read-only by ``validate`` and dry runs, and
+    a stale or deleted cache only ever costs re-hashing. Rows are keyed on
+    (device, inode), so a file rewritten in place replaces its own row rather
+    than accumulating one per version."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.con = sqlite3.connect(path, timeout=30)
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS content_digests (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                ctime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                source_sha256 TEXT NOT NULL,
+                PRIMARY KEY (device, inode)
+            )
+            """
+        )
+        columns = {
+            row[1] for row in self.con.execute("PRAGMA table_info(content_digests)")
+        }
+        if "pixel_sha256" not in columns:
+            # Rows from before pixel digests read as misses and are re-hashed.
+            self.con.execute("ALTER TABLE content_digests ADD COLUMN pixel_sha256 TEXT")
+        self.con.commit()
+
+    def lookup(
+        self, keys: typing.Iterable[tuple[int, int, int, int, int]]
+    ) -> dict[tuple[int, int, int, int, int], tuple[str, str]]:
+        wanted = set(keys)
+        found = {}
+        for row in self.con.execute(
+            "SELECT device, inode, mtime_ns, ctime_ns, size, source_sha256, "
+            "pixel_sha256 FROM content_digests WHERE pixel_sha256 IS NOT NULL"
+        ):
+            key = row[:5]
+            if key in wanted:
+                found[key] = (row[5], row[6])
+        return found
+
+    def store(self, digests: Mapping[tuple[int, int, int, int, int], tuple[str, str]]):
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO content_digests "
+                "(device, inode, mtime_ns, ctime_ns, size, source_sha256, pixel_sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, *pair) for key, pair in digests.items()],
+            )
+
+    def close(self):
+        self.con.close()
+
+
+def cached_content_digests_many(
+    paths: list[str],
+    cache_path: str,
+    verify: bool = False,
+    workers: int = FILE_HASH_WORKERS,
+    counters: dict | None = None,
+) -> dict[str, tuple[str | None, str | None]]:
+    """``file_content_digests_many``, reading only files the cache cannot vouch for.
+
+    A file is re-statted after hashing and its digest remembered only if the
+    tuple did not move meanwhile, so a file written during the run is hashed
+    again next time rather than pinned to bytes it no longer has."""
+    # On network storage each stat is a round trip, so they overlap too.
+    if workers <= 1:
+        stats = {path: _stat_or_none(path) for path in paths}
+    else:
+        stats = dict(zip(paths, executor_lane("io").map(_stat_or_none, paths)))
+    keys = {
+        path: digest_cache_key(stat) for path, stat in stats.items() if stat is not None
+    }
+
+    try:
+        cache = ContentDigestCache(cache_path)
+    except sqlite3.Error as exc:
+        log(f"Digest cache {cache_path} unavailable ({exc}); hashing every file.")
+        cache = None
+    try:
+        cached = cache.lookup(keys.values()) if cache is not None else {}
+        hits = {path: cached[key] for path, key in keys.items() if key in cached}
+        to_hash = paths if verify else [path for path in paths if path not in hits]
+        digests = dict(hits)
+        digests.update(file_content_digests_many(to_hash, workers=workers))
+
+        mismatches = [
+            path for path in to_hash if path in hits and digests[path] != hits[path]
+        ]
+        if mismatches:
+            log(
+                f"Digest cache held a stale digest for {len(mismatches)} file(s), "
+                f"first: {mismatches[0]}"
+            )
+
+        fresh = {}
+        for path in to_hash:
+            after = _stat_or_none(path)
+            if (
+                digests[path][0] is not None
+                and after is not None
+                and keys.get(path) == digest_cache_key(after)
+            ):
+                fresh[keys[path]] = digests[path]
+        if cache is not None and fresh:
+            try:
+                cache.store(fresh)
+            except sqlite3.Error as exc:
+                log(f"Could not update digest cache {cache_path}: {exc}")
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if counters is not None:
+        counters.update(
+            {
+                "cacheHits": len(hits) if not verify else 0,
+                "hashed": len(to_hash),
+                "staleCacheEntries": len(mismatches),
+            }
+        )
+    return {path: digests.get(path, (None, None)) for path in paths}
 
 
 def resolve_classifier_model_id(
@@ -6304,6 +10790,8 @@ def resolve_classifier_model_id(
         return DEFAULT_GEMMA4_MODEL_ID
     if backend == CLASSIFIER_BACKEND_GEMMA4_GGUF:
         return DEFAULT_GEMMA4_GGUF_MODEL_ID
+    if backend == CLASSIFIER_BACKEND_STUB:
+        return StubCaptionClassifier.model_id
     return None
 
 
@@ -6350,6 +10838,12 @@ def caption_pipeline_version(
     batch_size: int | None = None,
     max_new_tokens: int | None = None,
     batch_max_new_tokens: int | None = None,
+    parallel: int | None = None,
+    prompt_first: bool = False,
+    adaptive_batch: bool = False,
+    retry_batch_size: int | None = None,
+    retry_max_new_tokens: int | None = None,
+    image_tokens: int | None = None,
 ) -> str:
     resolved_model = resolve_classifier_model_id(backend, model_id) or "default"
     revision = "external"
@@ -6357,14 +10851,41 @@ def caption_pipeline_version(
         (build_classifier_prompt(None)).encode("utf-8")
     ).hexdigest()[:12]
     non_default_generation = ""
-    if batch_size is not None and batch_size != CAPTION_VERSION_BASELINE_BATCH_SIZE:
+    # An adaptive run's size moves batch to batch, so the version records the
+    # policy and caption_generation_metrics records each batch's size. Stamping
+    # the sizes themselves would restamp captions every time the card got busier.
+    if adaptive_batch:
+        non_default_generation += ":batch=adaptive"
+    elif batch_size is not None and batch_size != CAPTION_VERSION_BASELINE_BATCH_SIZE:
         non_default_generation += f":batch={batch_size}"
+    # llama.cpp's batched decode is not bit-identical to decoding one sequence
+    # alone, so captions from concurrent slots are recorded as such, like batch=.
+    if parallel is not None and parallel > 1:
+        non_default_generation += f":parallel={parallel}"
+    if prompt_first:
+        non_default_generation += ":layout=prompt-first"
     resolved_single_tokens = max_new_tokens or CAPTION_MAX_NEW_TOKENS
     resolved_batch_tokens = batch_max_new_tokens or CAPTION_BATCH_MAX_NEW_TOKENS
+    # v3 is the transformers backend's schema-constrained decoding. llama-server
+    # has enforced the schema through response_format all along, so GGUF
+    # captions stay on v2 rather than being restamped for identical output.
+    json_stop = "v3" if backend == CLASSIFIER_BACKEND_GEMMA4 else "v2"
     non_default_generation += (
         f":batchTokens={resolved_batch_tokens}:singleTokens={resolved_single_tokens}"
-        ":jsonStop=v2"
+        f":jsonStop={json_stop}"
     )
+    # Retries used to run one at a time at the single cap; deferring them to a
+    # sweep changes nothing unless they are batched or given another budget.
+    if retry_batch_size is not None and retry_batch_size > 1:
+        non_default_generation += f":retryBatch={retry_batch_size}"
+    # singleTokens keeps its historical default so existing captions are not
+    # restamped; a retry only differs from the backend's real single cap.
+    backend_single_tokens = max_new_tokens or default_caption_max_new_tokens(backend)
+    if retry_max_new_tokens and retry_max_new_tokens != backend_single_tokens:
+        non_default_generation += f":retryTokens={retry_max_new_tokens}"
+    # The vision encoder sees a different image at another budget.
+    if image_tokens is not None:
+        non_default_generation += f":imageTokens={image_tokens}"
     return (
         f"{CAPTION_PROMPT_VERSION}-{prompt_digest}:{backend}:"
         f"{resolved_model}@{revision}:"
@@ -6372,12 +10893,156 @@ def caption_pipeline_version(
     )
 
 
-def embedding_pipeline_version(model_id: str) -> str:
+def gguf_parallel_for(backend: str, parallel: int | None) -> int | None:
+    """Slots only exist on llama-server; other backends ignore --classifier-parallel
+    and must not have it stamped into their version."""
+    return parallel if backend == CLASSIFIER_BACKEND_GEMMA4_GGUF else None
+
+
+def gguf_image_token_bounds(
+    image_tokens: int | None,
+) -> tuple[int | None, int | None]:
+    """llama-server's (--image-min-tokens, --image-max-tokens) for a tier.
+
+    A tier below the default minimum lowers the minimum with it, so the bounds
+    never cross. No tier leaves both to the mmproj."""
+    if image_tokens is None:
+        return None, None
+    return min(DEFAULT_GEMMA4_GGUF_IMAGE_MIN_TOKENS, image_tokens), image_tokens
+
+
+def caption_version_source(version: str) -> str:
+    """The caption version a stored version was generated under.
+
+    A reused caption is stamped with its donor's version plus the reuse marker.
+    It is as current as that version, and is recaptioned when that goes stale."""
+    return version.split(CAPTION_REUSE_MARKER, 1)[0]
+
+
+def perceptual_hash(path: str) -> int:
+    """A 64-bit difference hash of the photo's pixels.
+
+    Each bit compares neighbouring cells of a 9x8 greyscale thumbnail, so it
+    survives re-encoding, small exposure changes and slight crops, and costs a
+    draft decode rather than a full one."""
+    with Image.open(source_image_input(pixel_source_for(path))) as image:
+        image.draft("L", (64, 64))
+        grey = ImageOps.exif_transpose(image).convert("L")
+        cells = np.asarray(
+            grey.resize((9, 8), resample=Image.Resampling.BOX), dtype=np.int16
+        )
+    bits = np.packbits((cells[:, 1:] > cells[:, :-1]).flatten())
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def parse_capture_time(value: str | None) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def exif_capture_time(path: str) -> datetime | None:
+    """The photo's EXIF DateTimeOriginal, read the way analyse_image reads it."""
+    try:
+        with open_source(pixel_source_for(path)) as fh:
+            original = str(get_exif(fh).get("EXIF DateTimeOriginal", ""))
+    except OSError:
+        return None
+    return parse_capture_time(original.replace(":", "-", 2).replace(" ", "T", 1))
+
+
+class CaptionReuseIndex:
+    """Captioned photos by capture time, for finding an uncaptioned one's twin.
+
+    Capture time is the cheap filter: only donors taken within
+    ``window_seconds`` are hashed and compared, so a library of thousands costs
+    a handful of thumbnail decodes per candidate. A donor must also be within
+    ``max_distance`` bits of the candidate's ``perceptual_hash``; the nearest
+    one wins. Photos without a capture time are never matched."""
+
+    def __init__(
+        self,
+        window_seconds: float = CAPTION_REUSE_WINDOW_SECONDS,
+        max_distance: int = CAPTION_REUSE_MAX_DISTANCE,
+        hasher: typing.Callable[[str], int] = perceptual_hash,
+    ):
+        self.window = timedelta(seconds=window_seconds)
+        self.max_distance = max_distance
+        self.hasher = hasher
+        self.donors: list[tuple[datetime, str]] = []
+        self.hashes: dict[str, int | None] = {}
+
+    def add(self, path: str, captured_at: datetime | None) -> None:
+        if captured_at is not None:
+            bisect.insort(self.donors, (captured_at, path))
+
+    def _hash(self, path: str) -> int | None:
+        if path not in self.hashes:
+            try:
+                self.hashes[path] = self.hasher(path)
+            except (OSError, ValueError) as err:
+                log(f"WARNING: could not hash {path} for caption reuse: {err}")
+                self.hashes[path] = None
+        return self.hashes[path]
+
+    def find(self, path: str, captured_at: datetime | None) -> str | None:
+        if captured_at is None:
+            return None
+        start = bisect.bisect_left(self.donors, (captured_at - self.window, ""))
+        nearby = []
+        for donor_time, donor in self.donors[start:]:
+            if donor_time > captured_at + self.window:
+                break
+            nearby.append(donor)
+        return self._nearest(path, nearby)
+
+    def awaits(
+        self,
+        path: str,
+        captured_at: datetime | None,
+        in_flight: list[tuple[datetime | None, str]],
+    ) -> bool:
+        """Whether ``path`` would reuse a caption still being generated.
+
+        A burst gathered into one batch has no donor yet, so every frame would
+        be captioned. Holding such a frame back a batch lets it find one."""
+        if captured_at is None:
+            return False
+        nearby = [
+            other
+            for other_time, other in in_flight
+            if other_time is not None and abs(other_time - captured_at) <= self.window
+        ]
+        return self._nearest(path, nearby) is not None
+
+    def _nearest(self, path: str, nearby: list[str]) -> str | None:
+        if not nearby or (candidate_hash := self._hash(path)) is None:
+            return None
+        best = None
+        for donor in nearby:
+            donor_hash = self._hash(donor)
+            if donor_hash is None:
+                continue
+            distance = (candidate_hash ^ donor_hash).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, donor)
+        return best[1] if best else None
+
+
+def embedding_pipeline_version(
+    model_id: str, backend: str = EMBEDDER_BACKEND_SIGLIP
+) -> str:
     revisions = {
         SiglipEmbedder.MODEL_ID: SIGLIP_V1_MODEL_REVISION,
         Siglip2Embedder.MODEL_ID: SIGLIP_V2_MODEL_REVISION,
     }
-    return f"image-embedding-v1:{model_id}@{revisions.get(model_id, 'external')}"
+    revision = revisions.get(model_id, "external")
+    # Stub vectors share the real model's id so the stage plans as it would,
+    # but are stamped apart so the next real run replaces them.
+    if backend == EMBEDDER_BACKEND_STUB:
+        revision = StubImageEmbedder.MODEL_REVISION
+    return f"image-embedding-v1:{model_id}@{revision}"
 
 
 def file_signature(path: str) -> tuple[float, int] | None:
@@ -6423,6 +11088,120 @@ def compute_reindex_plan(
     return changed, backfill
 
 
+GLOB_DOUBLE_STAR = "**"
+
+
+def is_test_album_path(path: str) -> bool:
+    """Whether ``path`` sits in a ``test-`` album under its first ``albums`` dir."""
+    parts = Path(path).parts
+    for index, part in enumerate(parts[:-1]):
+        if part == "albums" and index + 1 < len(parts):
+            return parts[index + 1].startswith("test-")
+    return False
+
+
+def _compile_glob_segment(segments: list[str]) -> re.Pattern[str]:
+    """One case-insensitive matcher for a path segment and its alternatives."""
+    return re.compile(
+        "|".join(f"(?:{fnmatch.translate(segment)})" for segment in segments),
+        re.IGNORECASE,
+    )
+
+
+def walk_glob(
+    directory: str,
+    pattern: str,
+    final_segments: list[str],
+    include_test_albums: bool,
+) -> list[str]:
+    """Every path under ``directory`` matching ``pattern``, in one tree walk.
+
+    Behaves like ``Path(directory).glob(os.path.join(directory, pattern),
+    case_sensitive=False)`` run once for each entry of ``final_segments`` (the
+    alternatives for the last path segment) and merged: ``**`` matches zero or
+    more directories without following symlinks, ``*`` matches dotfiles, and
+    literal segments match case-insensitively and report the on-disk name.
+
+    The difference is cost. Running one glob per extension walked the whole
+    albums tree eight times per call — painful on a NAS-mounted library, where
+    every ``readdir`` is a network round trip. Here each directory is listed
+    once with ``os.scandir``, whose ``DirEntry`` type bits avoid a ``stat`` per
+    entry, and every directory segment pattern in flight is matched against
+    that one listing. Test albums are pruned as they are reached instead of
+    being walked and filtered afterwards."""
+    joined = os.path.join(directory, pattern)
+    parts = [part for part in joined.split(os.sep) if part not in ("", ".")]
+    # ``..`` and the filesystem root are literal in pathlib too; everything
+    # after them is matched against directory listings.
+    root = os.sep if os.path.isabs(joined) else ""
+    while parts and parts[0] == "..":
+        root = os.path.join(root, parts.pop(0))
+    if not parts:
+        return []
+
+    matchers: list[re.Pattern[str] | None] = [
+        None if part == GLOB_DOUBLE_STAR else _compile_glob_segment([part])
+        for part in parts[:-1]
+    ]
+    matchers.append(_compile_glob_segment(final_segments))
+    last = len(matchers) - 1
+
+    def closure(states: set[int]) -> frozenset[int]:
+        # ``**`` may match zero directories, so it also stands for whatever
+        # segment follows it.
+        expanded = set(states)
+        for state in sorted(states):
+            while matchers[state] is None and state < last:
+                state += 1
+                expanded.add(state)
+        return frozenset(expanded)
+
+    found: list[str] = []
+    # (path, segment indexes its entries must match, test-album scope decided)
+    stack: list[tuple[str, frozenset[int], bool]] = [
+        (root, closure({0}), include_test_albums)
+    ]
+    while stack:
+        dirpath, states, scope_decided = stack.pop()
+        try:
+            with os.scandir(dirpath or ".") as entries:
+                listing = list(entries)
+        except OSError:
+            continue
+
+        for entry in listing:
+            child = os.path.join(dirpath, entry.name)
+            child_states: set[int] = set()
+            matched = False
+            for state in states:
+                matcher = matchers[state]
+                if matcher is None:
+                    if entry.is_dir(follow_symlinks=False):
+                        child_states.add(state)
+                elif matcher.match(entry.name):
+                    if state == last:
+                        matched = True
+                    elif entry.is_dir():
+                        child_states.add(state + 1)
+
+            if not matched and not child_states:
+                continue
+
+            child_decided = scope_decided
+            if not scope_decided:
+                # Only the first ``albums`` segment decides, so once it has
+                # been passed the rest of the subtree needs no more checks.
+                if is_test_album_path(os.path.join(child, "_")):
+                    continue
+                child_decided = "albums" in Path(child).parts[:-1]
+
+            if matched:
+                found.append(child)
+            if child_states:
+                stack.append((child, closure(child_states), child_decided))
+    return found
+
+
 def find_files(
     directory: str, pattern: str, media_root: str | None = None
 ) -> list[str]:
@@ -6442,7 +11221,10 @@ def find_files(
     file in the album directory at all, so the sidecar written beside its
     downloaded thumbnail is the only evidence it exists. They are reported under
     the synthetic album path ``<album>/<video id>.youtube`` that the rest of the
-    pipeline — and the site's own URLs — key off."""
+    pipeline — and the site's own URLs — key off.
+
+    The album tree is walked once (see ``walk_glob``) however many extensions
+    the glob expands to."""
     patterns = [pattern]
     lowered = pattern.lower()
     if lowered.endswith(".jpg"):
@@ -6458,28 +11240,19 @@ def find_files(
     if extension and extension.lower() not in VIDEO_EXTENSIONS:
         patterns.extend(stem + video_extension for video_extension in VIDEO_EXTENSIONS)
 
-    paths: list[str] = []
-    seen: set[str] = set()
     include_test_albums = (
         os.environ.get("ALBUM_INCLUDE_TEST_ALBUMS") == "1" or "test-" in pattern
     )
 
-    def is_test_album_path(path: Path) -> bool:
-        parts = path.parts
-        for index, part in enumerate(parts[:-1]):
-            if part == "albums" and index + 1 < len(parts):
-                return parts[index + 1].startswith("test-")
-        return False
-
-    for pat in patterns:
-        path_pattern = os.path.join(directory, pat)
-        for p in Path(directory).glob(path_pattern, case_sensitive=False):
-            if not include_test_albums and is_test_album_path(p):
-                continue
-            resolved = str(p)
-            if resolved not in seen:
-                seen.add(resolved)
-                paths.append(resolved)
+    # Every derived pattern differs from the photo glob only in its last
+    # segment, so one walk over the shared directory part serves them all.
+    paths = walk_glob(
+        directory,
+        pattern,
+        [os.path.basename(pat) for pat in patterns],
+        include_test_albums,
+    )
+    seen: set[str] = set(paths)
 
     if media_root is not None:
         # Scenes exist only where the poster prepass extracted them, and the
@@ -6493,7 +11266,7 @@ def find_files(
                     paths.append(scene)
 
         for external in find_external_media(media_root, pattern):
-            if not include_test_albums and is_test_album_path(Path(external)):
+            if not include_test_albums and is_test_album_path(external):
                 continue
             if external not in seen:
                 seen.add(external)
@@ -6756,6 +11529,56 @@ def evaluate_tag_quality(
     }
 
 
+def build_classifier_sweep_markdown(
+    summary: Mapping[str, typing.Any], cells: list[Mapping[str, typing.Any]]
+) -> str:
+    """The sweep as one table, fastest working cell first."""
+
+    def shown(value: typing.Any) -> str:
+        return "default" if value is None else str(value)
+
+    def failure_summary(error: str) -> str:
+        # A startup failure carries the server's log tail; one line fits a row.
+        first_line = (error.splitlines() or [""])[0]
+        return first_line.replace("|", "/")
+
+    lines = [
+        "# Classifier Sweep Report",
+        "",
+        f"- Generated: {summary['generatedAt']}",
+        f"- Backend: {summary['backend']}",
+        (
+            f"- Sample: {summary['sampleSize']} images from {summary['glob']} "
+            f"(seed {summary['seed']})"
+        ),
+        "",
+        (
+            "| Model | Parallel | Threads | Ctx | Image tokens | Images/s | p50 ms "
+            "| p95 ms | VRAM GB | Parsed |"
+        ),
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    ranked = sorted(
+        cells,
+        key=lambda cell: (cell["error"] is not None, -(cell["imagesPerSecond"] or 0)),
+    )
+    for cell in ranked:
+        lines.append(
+            f"| {cell['modelId']} | {shown(cell['parallel'])} "
+            f"| {shown(cell['threads'])} | {shown(cell['ctxSize'])} "
+            f"| {shown(cell['imageMinTokens'])}-{shown(cell['imageMaxTokens'])} "
+            + (
+                f"| failed: {failure_summary(cell['error'])} | | | | |"
+                if cell["error"] is not None
+                else f"| {cell['imagesPerSecond']} | {shown(cell['p50LatencyMs'])} "
+                f"| {shown(cell['p95LatencyMs'])} | {shown(cell['vramGb'])} "
+                f"| {cell['parseSuccess']}/{cell['samples']} |"
+            )
+        )
+    lines.append("")
+    return "\n".join(lines)
+
+
 def build_ab_report_markdown(
     summary: Mapping[str, typing.Any], rows: list[Mapping[str, typing.Any]]
 ) -> str:
@@ -7003,11 +11826,12 @@ def analyse_image_worker(
     caption_version = input[8] if len(input) > 8 else ""
     caption_model_id = input[9] if len(input) > 9 else None
     core_complete = input[10] if len(input) > 10 else True
+    pixel_sha256 = input[11] if len(input) > 11 else source_sha256
 
     print(f"[{idx + 1}] {os.path.basename(path)}...")
     # A video is opened through its poster frame; a photo resolves to itself.
     pixels = pixel_source_for(path)
-    with open(pixels, "rb") as fh:
+    with open_source(pixels) as fh:
         analysed = analyse_image(
             fh,
             path=path,
@@ -7039,6 +11863,7 @@ def analyse_image_worker(
             "write_caption": caption_fallback is not None,
             "caption_failed": False,
             "source_sha256": source_sha256,
+            "pixel_sha256": pixel_sha256,
             "caption_version": caption_version,
             "caption_model_id": caption_model_id,
             "core_complete": core_complete,
@@ -7061,6 +11886,7 @@ def insert_analysed_images_batch(db, results: list[Mapping]):
                 "write_caption", item.get("used_classifier", False)
             )
             source_sha256 = item.get("source_sha256") or ""
+            pixel_sha256 = item.get("pixel_sha256") or source_sha256
 
             geocode = analysed.get("geocode")
             geocode_blob, geocode_structured = build_geocode_fields(geocode)
@@ -7108,11 +11934,11 @@ def insert_analysed_images_batch(db, results: list[Mapping]):
                     cur,
                 )
                 tags_changed = True
-                if source_sha256:
+                if pixel_sha256:
                     db.upsert_pipeline_state(
                         path,
                         CAPTION_STAGE,
-                        source_sha256,
+                        pixel_sha256,
                         # Falls back to the backend actually in use; naming a
                         # fixed one here is what made every row read as stale.
                         item.get("caption_version")
@@ -7165,7 +11991,7 @@ def insert_analysed_images_batch(db, results: list[Mapping]):
                     embedding=emb["embedding"],
                     cur=cur,
                 )
-                if source_sha256:
+                if pixel_sha256:
                     stage = (
                         SIGLIP_V1_STAGE
                         if emb["model_id"] == SiglipEmbedder.MODEL_ID
@@ -7174,7 +12000,7 @@ def insert_analysed_images_batch(db, results: list[Mapping]):
                     db.upsert_pipeline_state(
                         path,
                         stage,
-                        source_sha256,
+                        pixel_sha256,
                         embedding_pipeline_version(emb["model_id"]),
                         emb["model_id"],
                         cur,
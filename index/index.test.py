@@ -1,40 +1,81 @@
+import concurrent.futures
+import fcntl
+import glob
+import hashlib
+import http.server
+import importlib.util
+import io
 import json
 import math
 import os
 import shutil
 import sqlite3
+import struct
+import subprocess
+import sys
 import tempfile
 import threading
+import time
+import types
 import unittest
+from datetime import timedelta
 from pathlib import Path
 from unittest import mock
 
 import click
+import numpy as np
 from click.testing import CliRunner
+from PIL import Image
 
 from index import (
+    CAPTION_DERIVATIVE_SPEC,
     CAPTION_STAGE,
+    CLASSIFIER_BACKEND_GEMMA4,
     CLASSIFIER_BACKEND_GEMMA4_GGUF,
     CORE_PIPELINE_VERSION,
     CORE_STAGE,
+    DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS,
     DEFAULT_GEMMA4_GGUF_MODEL_ID,
     DEFAULT_LLAMA_SERVER_PATHS,
+    DIGEST_CACHE_FILENAME,
     MODEL_PROFILE_CAPTIONS,
     SIGLIP_V1_STAGE,
+    VIDEO_EXTENSIONS,
+    AdaptiveCaptionBatchSize,
+    BaseImageEmbedder,
+    CaptionReuseIndex,
+    CaptionSchemaLogitsProcessor,
+    CoreBudget,
+    DerivativeCache,
+    ExecutorLane,
     Gemma4Classifier,
     Gemma4GgufClassifier,
+    ImageBatchPreprocessor,
     JsonCompletionLogitsProcessor,
     SiglipEmbedder,
+    SourceByteCache,
     Sqlite3Client,
     acquire_single_instance_lock,
     analyse_image,
     analyse_image_worker,
     benchmark_caption_quality,
+    benchmark_classifier,
+    benchmark_pipeline,
     build_classifier_prompt,
     build_geocode_fields,
     build_metadata_fallback_caption,
     cache_tokenizer_vocab,
+    cached_content_digests_many,
+    caption_json_forced_continuation,
     caption_pipeline_version,
+    caption_quality_gate_key,
+    caption_server,
+    caption_server_in_use,
+    caption_server_state_path,
+    caption_stream_stop,
+    caption_token_budget_report,
+    claim_cores,
+    classifier_sweep_grid,
     cli,
     compare_caption_payloads,
     complete_classifier_json_prefix,
@@ -43,32 +84,44 @@ from index import (
     configured_media_root,
     create_classifier,
     decode_embedding,
+    decode_near_size,
+    derivative_cache_at,
     derive_zone,
     effective_free_vram_gb,
+    encode_caption_jpeg,
     encode_embedding,
     enforce_vram_headroom,
     evaluate_caption_quality_cases,
     evaluate_tag_quality,
+    executor_lane,
     extract_colour_palette,
+    file_content_digests,
+    file_content_digests_many,
     file_content_sha256,
     file_content_sha256_many,
     filter_exif_for_search,
     find_files,
     format_mapping,
     format_mapping_values,
+    generation_row_metrics,
     geocode_columns,
     get_album_relative_path,
     get_exif,
+    gguf_image_token_bounds,
     has_repeated_open_classifier_tags,
     heartbeat,
     index,
     insert_analysed_images_batch,
+    jpeg_pixel_sha256,
+    load_derivative,
     log_vram,
     log_vram_peak,
+    mean_top_k_neighbour_overlap,
     media_kind_for,
     needs_caption_for,
     normalise_classifier_tags,
     parse_caption_with_retry,
+    parse_capture_time,
     parse_classifier_response,
     pixel_source_for,
     predict_caption_batch_resilient,
@@ -76,8 +129,12 @@ from index import (
     prepare_staging_database,
     prune,
     publish_index_databases,
+    read_caption_server_registry,
+    record_caption_quality_gate,
     repair_classifier_json_syntax,
+    reset_shared_executors,
     reset_timezone_finder_for_testing,
+    resolve_batch_max_new_tokens,
     resolve_caption_result,
     resolve_classifier_model_id,
     resolve_llama_server_command,
@@ -88,11 +145,14 @@ from index import (
     search,
     search_similar_path,
     search_tags,
+    set_core_budget,
+    shared_executor_stats,
     source_digests_for,
     split_scene_path,
     update_gps,
     validate_command,
     validate_index_database,
+    write_caption_server_registry,
     write_publish_journal,
 )
 from index import (
@@ -102,6 +162,27 @@ from index import (
 RUN_MODEL_INFERENCE = os.environ.get("INDEX_RUN_MODEL_INFERENCE") == "1"
 
 
+def torch_array_stub():
+    """numpy stand-ins for the torch constructors a stubbed model is probed with."""
+    return mock.patch(
+        "index.torch",
+        types.SimpleNamespace(
+            zeros=np.zeros, ones=np.ones, tensor=np.array, long=np.int64
+        ),
+    )
+
+
+HAS_TRANSFORMERS = importlib.util.find_spec("transformers") is not None
+
+
+def sse_reply(events: list[dict], usage: dict | None = None) -> bytes:
+    """A complete llama-server event stream, as a single response body."""
+    if usage is not None:
+        events = [*events, {"choices": [], "usage": usage}]
+    lines = [f"data: {json.dumps(event)}\n\n" for event in events]
+    return ("".join(lines) + "data: [DONE]\n\n").encode("utf-8")
+
+
 class FakeTensor:
     """Small mutable tensor-shaped test double for model-free logic tests."""
 
@@ -295,6 +376,56 @@ class TestMain(unittest.TestCase):
             ["fixture.jpg", "real.jpg"],
         )
 
+    def test_find_files_walks_each_directory_once_and_matches_per_pattern_globs(self):
+        # The single walk must return exactly what one case-insensitive glob per
+        # derived pattern used to, while listing every directory only once.
+        with tempfile.TemporaryDirectory(dir=".") as root:
+            albums = os.path.join(root, "albums")
+            for album in ["trip", "trip/day-2", "test-fixture", ".hidden"]:
+                os.makedirs(os.path.join(albums, album))
+            for name in [
+                "trip/a.JPG",
+                "trip/b.jpeg",
+                "trip/day-2/c.Mp4",
+                "trip/day-2/notes.txt",
+                "test-fixture/t.jpg",
+                ".hidden/h.jpg",
+            ]:
+                open(os.path.join(albums, name), "w").close()
+            os.symlink(os.path.abspath(albums), os.path.join(albums, "loop"))
+            pattern = f"./{os.path.basename(root)}/Albums/**/*.jpg"
+
+            expected = set()
+            stem = pattern[: -len(".jpg")]
+            for pat in [pattern, stem + ".jpeg"] + [
+                stem + extension for extension in VIDEO_EXTENSIONS
+            ]:
+                expected.update(
+                    str(p)
+                    for p in Path(".").glob(
+                        os.path.join(".", pat), case_sensitive=False
+                    )
+                    if "test-fixture" not in p.parts
+                )
+
+            real_scandir = os.scandir
+            listed = []
+
+            def counting_scandir(path="."):
+                listed.append(os.path.normpath(path))
+                return real_scandir(path)
+
+            with mock.patch("index.os.scandir", side_effect=counting_scandir):
+                found = find_files(".", pattern)
+
+        self.assertEqual(found, sorted(expected))
+        self.assertEqual(
+            sorted(os.path.basename(p) for p in found),
+            ["a.JPG", "b.jpeg", "c.Mp4", "h.jpg"],
+        )
+        self.assertEqual(len(listed), len(set(listed)))
+        self.assertNotIn(os.path.normpath(os.path.join(albums, "test-fixture")), listed)
+
     def _make_media_album(self, root, album="trip"):
         """Album directory plus the public poster cache the prepass writes."""
         album_dir = os.path.join(root, "albums", album)
@@ -917,6 +1048,290 @@ class TestMain(unittest.TestCase):
         self.assertIn("good.jpg", precomputed)
         self.assertNotIn("bad.jpg", precomputed)
 
+    def test_decode_near_size_never_drops_below_twice_the_target(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (4000, 3000), (200, 40, 40)).save(buffer, "JPEG")
+        buffer.seek(0)
+        with Image.open(buffer) as image:
+            decoded = decode_near_size(image, 224, 224)
+            # 1/4 scale; 1/8 would fall below 448px on the short edge.
+            self.assertEqual(decoded.size, (1000, 750))
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (4000, 3000)).save(buffer, "PNG")
+        buffer.seek(0)
+        with Image.open(buffer) as image:
+            self.assertEqual(decode_near_size(image, 224, 224).size, (667, 500))
+
+    def test_batch_preprocessor_matches_the_processor_pipeline_per_image(self):
+        class Processor:
+            do_resize = True
+            resample = Image.Resampling.BICUBIC
+            do_rescale = True
+            rescale_factor = 1 / 255
+            do_normalize = True
+
+            def __init__(self):
+                self.size = {"height": 8, "width": 6}
+                self.image_mean = [0.5, 0.4, 0.3]
+                self.image_std = [0.5, 0.25, 0.2]
+
+        images = [
+            Image.new("RGB", (40, 30), (10, 200, 90)),
+            Image.open("../src/test/fixtures/monkey.jpg"),
+        ]
+        preprocessor = ImageBatchPreprocessor.for_processor(Processor())
+        values = preprocessor.pixel_values(images)
+
+        self.assertEqual(values.shape, (2, 3, 8, 6))
+        self.assertEqual(values.dtype, np.float32)
+        for image, actual in zip(images, values):
+            resized = np.asarray(
+                image.convert("RGB").resize((6, 8), Image.Resampling.BICUBIC)
+            )
+            expected = (resized.astype(np.float64) * (1 / 255)).astype(np.float32)
+            expected = (expected - np.float32([0.5, 0.4, 0.3])) / np.float32(
+                [0.5, 0.25, 0.2]
+            )
+            np.testing.assert_array_equal(actual, expected.transpose(2, 0, 1))
+
+        Processor.do_center_crop = True
+        self.assertIsNone(ImageBatchPreprocessor.for_processor(Processor()))
+
+    @unittest.skipUnless(HAS_TRANSFORMERS, "transformers is not installed")
+    def test_batch_preprocessor_is_bit_identical_to_the_siglip_processor(self):
+        from transformers import SiglipImageProcessor
+
+        processor = SiglipImageProcessor()
+        images = [
+            Image.new("RGB", (640, 480), (10, 200, 90)),
+            Image.open("../src/test/fixtures/monkey.jpg").convert("RGB"),
+        ]
+        expected = processor(images=images, return_tensors="np")["pixel_values"]
+        actual = ImageBatchPreprocessor.for_processor(processor).pixel_values(images)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_mean_top_k_neighbour_overlap(self):
+        vectors = [[math.cos(i / 7), math.sin(i / 7), 0.1 * i] for i in range(16)]
+        self.assertEqual(mean_top_k_neighbour_overlap(vectors, vectors), 1.0)
+        shuffled = vectors[8:] + vectors[:8]
+        self.assertLess(mean_top_k_neighbour_overlap(vectors, shuffled), 1.0)
+        self.assertEqual(mean_top_k_neighbour_overlap(vectors[:1], vectors[:1]), 1.0)
+
+    def test_draft_decode_is_enabled_only_when_neighbours_survive(self):
+        class StubEmbedder(BaseImageEmbedder):
+            model_id = "stub-model"
+
+            def __init__(self, draft_noise):
+                super().__init__(draft_decode=True)
+                self.draft_noise = draft_noise
+
+            def _open_images(self, paths, draft, derivatives=True):
+                self.assertions.append(derivatives)
+                return [(int(path), draft) for path in paths]
+
+            def _embed_images(self, opened):
+                return [
+                    [
+                        math.cos(index / 5),
+                        math.sin(index / 5),
+                        (self.draft_noise * (index % 3) if draft else 0.0),
+                    ]
+                    for index, draft in opened
+                ]
+
+        paths = [str(i) for i in range(24)]
+        with mock.patch("index.log"):
+            faithful = StubEmbedder(draft_noise=0.0)
+            faithful.assertions = []
+            gate = faithful.calibrate_draft_decode(paths)
+            self.assertTrue(gate["enabled"])
+            self.assertTrue(faithful.draft_decode_active)
+            self.assertEqual(faithful.assertions, [False, False])
+
+            lossy = StubEmbedder(draft_noise=5.0)
+            lossy.assertions = []
+            gate = lossy.calibrate_draft_decode(paths)
+            self.assertFalse(gate["enabled"])
+            self.assertLess(gate["meanTopKNeighbourOverlap"], 0.98)
+
+            # Too few readable images to measure: stay on full decodes.
+            tiny = StubEmbedder(draft_noise=0.0)
+            tiny.assertions = []
+            gate = tiny.calibrate_draft_decode(paths[:5])
+            self.assertFalse(gate["enabled"])
+            self.assertIsNone(gate["meanTopKNeighbourOverlap"])
+
+        # A pass skips the calibration when it could not matter.
+        self.assertIsNone(faithful.draft_decode_skip_reason(len(paths)))
+        self.assertIn("too few", faithful.draft_decode_skip_reason(5))
+        faithful.derivative_spec = "siglip-224x224"
+        with mock.patch("index._DERIVATIVES", object()):
+            self.assertIn(
+                "derivative cache", faithful.draft_decode_skip_reason(len(paths))
+            )
+        self.assertIsNone(faithful.draft_decode_skip_reason(len(paths)))
+
+    def test_run_embedding_pass_decodes_the_next_batch_during_the_current(self):
+        class StubEmbedder:
+            model_id = "stub-model"
+
+            def __init__(self):
+                self.second_batch_decoding = threading.Event()
+                self.overlapped = False
+
+            def init_model(self):
+                pass
+
+            def prepare_image_batch(self, paths):
+                if paths[0] == "c.jpg":
+                    self.second_batch_decoding.set()
+                return paths
+
+            def embed_prepared_batch(self, paths):
+                if paths[0] == "a.jpg":
+                    # Batch 2 must be decoding while batch 1 is on the device.
+                    self.overlapped = self.second_batch_decoding.wait(timeout=5)
+                return [None if p == "bad.jpg" else [float(len(p))] for p in paths]
+
+            def release(self):
+                pass
+
+        stub = StubEmbedder()
+        persisted = []
+        timings = {}
+        with mock.patch("index.log_vram"), mock.patch("index.log"):
+            run_embedding_pass(
+                stub,
+                ["a.jpg", "bad.jpg", "c.jpg", "dd.jpg", "e.jpg"],
+                {},
+                persist_batch=lambda model_id, batch: persisted.append(batch),
+                collect=False,
+                batch_size=2,
+                timings=timings,
+            )
+        self.assertTrue(stub.overlapped)
+        self.assertEqual(
+            persisted,
+            [
+                [("a.jpg", [5.0])],
+                [("c.jpg", [5.0]), ("dd.jpg", [6.0])],
+                [("e.jpg", [5.0])],
+            ],
+        )
+        self.assertEqual(timings["stub-model"]["prefetch"]["depth"], 2)
+
+    def test_executor_lane_maps_in_order_and_counts_its_work(self):
+        lane = ExecutorLane("test", workers=2)
+        release = threading.Event()
+        try:
+            self.assertEqual(lane.map(lambda value: value * 2, [3, 1, 2]), [6, 2, 4])
+
+            started = threading.Semaphore(0)
+
+            def block():
+                started.release()
+                release.wait(timeout=5)
+
+            blockers = [lane.submit(block) for _ in range(2)]
+            for _ in blockers:
+                self.assertTrue(started.acquire(timeout=5))
+            queued = lane.submit(lambda: None)
+            stats = lane.stats()
+            self.assertEqual((stats["running"], stats["queued"]), (2, 1))
+            self.assertGreaterEqual(stats["peakQueued"], 1)
+            self.assertTrue(queued.cancel())
+            release.set()
+            for blocker in blockers:
+                blocker.result()
+
+            def fail(value):
+                if value == 0:
+                    raise ValueError("unreadable")
+                return value
+
+            with self.assertRaises(ValueError):
+                lane.map(fail, [0, 1])
+        finally:
+            release.set()
+            lane.shutdown()
+        stats = lane.stats()
+        self.assertGreaterEqual(stats["cancelled"], 1)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["running"], 0)
+        self.assertEqual(stats["submitted"], stats["completed"] + stats["cancelled"])
+
+    def test_executor_lane_resize_bounds_running_work(self):
+        lane = ExecutorLane("test", workers=4)
+        release = threading.Event()
+        try:
+            lane.resize(1)
+            futures = [lane.submit(release.wait, 5) for _ in range(3)]
+
+            def settle(running):
+                for _ in range(200):
+                    if lane.stats()["running"] == running:
+                        break
+                    threading.Event().wait(0.01)
+                threading.Event().wait(0.05)
+                return lane.stats()
+
+            stats = settle(1)
+            self.assertEqual((stats["running"], stats["queued"]), (1, 2))
+            lane.resize(3)
+            self.assertEqual(settle(3)["running"], 3)
+            release.set()
+            for future in futures:
+                future.result()
+        finally:
+            release.set()
+            lane.shutdown()
+
+    def test_core_budget_rebalances_when_a_stage_finishes(self):
+        applied = {}
+        budget = CoreBudget(8)
+        self.assertEqual(
+            budget.claim("colour", 1, apply=lambda n: applied.update(colour=n)), 8
+        )
+        self.assertEqual(budget.claim("caption", 3), 6)
+        self.assertEqual(applied, {"colour": 2})
+        budget.release("caption")
+        self.assertEqual(applied, {"colour": 8})
+        self.assertIsNone(budget.share("caption"))
+        budget.release("caption")  # idempotent
+
+        crowded = CoreBudget(2)
+        crowded.claim("caption", 3)
+        crowded.claim("colour", 1)
+        # Never starve a stage outright.
+        self.assertEqual(crowded.share("colour"), 1)
+        self.assertEqual(
+            [event["event"] for event in crowded.stats()["history"]],
+            ["claim caption", "claim colour"],
+        )
+
+    def test_gguf_server_threads_cap_the_caption_share(self):
+        try:
+            set_core_budget(CoreBudget(32))
+            claim_cores("caption")
+            self.assertEqual(Gemma4GgufClassifier()._server_threads(), 8)
+            self.assertEqual(Gemma4GgufClassifier(threads=12)._server_threads(), 12)
+            set_core_budget(CoreBudget(4))
+            claim_cores("caption")
+            self.assertEqual(Gemma4GgufClassifier()._server_threads(), 4)
+        finally:
+            set_core_budget(None)
+
+    def test_shared_executors_live_until_reset(self):
+        reset_shared_executors()
+        lane = executor_lane("io")
+        self.assertIs(executor_lane("io"), lane)
+        self.assertEqual(set(shared_executor_stats()), {"io", "decode", "cpu"})
+        reset_shared_executors()
+        self.assertEqual(shared_executor_stats(), {})
+        self.assertIsNot(executor_lane("io"), lane)
+        reset_shared_executors()
+
     def test_caption_batch_oom_falls_back_to_smaller_batches(self):
         class StubClassifier:
             def __init__(self):
@@ -1020,6 +1435,44 @@ class TestMain(unittest.TestCase):
         self.assertEqual(actual[0][4], 0.0)
         self.assertTrue(math.isinf(actual[0][0]) and actual[0][0] < 0)
 
+    def test_caption_json_forced_continuation_follows_the_schema_skeleton(self):
+        cases = {
+            "": '{"tags": [',
+            '{"ta': 'gs": [',
+            '{"tags": ["ramen", "bo': None,
+            '{"tags": ["ramen", "bowl"': None,
+            '{"tags": ["a]b"]': ', "alt_text": "',
+            '{"tags": [], "alt': '_text": "',
+            '{"tags": ["ramen"], "alt_text": "A bowl of \\"ramen': None,
+            '{"tags": ["ramen"], "alt_text": "A bowl."': "}",
+            '{"tags": ["ramen"], "alt_text": "A bowl."}': None,
+            "```json": None,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(caption_json_forced_continuation(text), expected)
+
+    def test_caption_schema_logits_processor_forces_literals_then_eos(self):
+        tokenizer = mock.Mock()
+        tokenizer.encode.side_effect = lambda text, add_special_tokens: {
+            "]": [4],
+            '{"tags": [': [5, 6],
+            "}": [3],
+        }[text]
+        tokenizer.decode.side_effect = [
+            "",
+            '{"tags": ["a"], "alt_text": "b"',
+            '{"tags": ["a"], "alt_text": "b"}',
+        ]
+        processor = CaptionSchemaLogitsProcessor(tokenizer, 2, prompt_length=1)
+
+        rows = FakeTensor([[9], [9, 1], [9, 1, 2]])
+        actual = processor(rows, FakeTensor([[0.0] * 7 for _ in range(3)])).tolist()
+
+        # Row 0 opens the object, row 1 closes it, row 2 ends generation.
+        self.assertEqual([row.index(0.0) for row in actual], [5, 3, 2])
+        self.assertEqual(tokenizer.decode.call_args_list[0].args, ([],))
+
     def test_filter_exif_for_search_keeps_only_useful_fields(self):
         actual = filter_exif_for_search(
             {
@@ -1195,6 +1648,169 @@ class TestMain(unittest.TestCase):
         )
         self.assertEqual(content[1]["text"], "a prompt")
 
+    def test_prompt_first_caption_request_shares_a_cacheable_prefix(self):
+        classifier = Gemma4GgufClassifier(prompt_first=True)
+        body = classifier._build_request_body("a prompt", "BASE64DATA")
+        content = body["messages"][0]["content"]
+
+        self.assertTrue(body["cache_prompt"])
+        self.assertEqual([part["type"] for part in content], ["text", "image_url"])
+        self.assertIn(
+            ":layout=prompt-first",
+            caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF, prompt_first=True),
+        )
+        payload = {
+            "choices": [{"message": {"content": '{"tags": [], "alt_text": "b"}'}}],
+            "usage": {"prompt_tokens": 420, "completion_tokens": 30},
+            "timings": {"prompt_n": 150, "prompt_ms": 61.5},
+        }
+        _text, metric = classifier._completion_result(payload, time.perf_counter())
+        self.assertEqual(metric["cachedPromptTokens"], 270)
+        self.assertEqual(metric["prefillMs"], 61.5)
+
+    def test_gemma_batch_generates_once_with_per_row_eos_metrics(self):
+        class DeviceArray(np.ndarray):
+            def to(self, _device):
+                return self
+
+        calls = []
+
+        class StubProcessor:
+            tokenizer = types.SimpleNamespace(eos_token_id=1)
+
+            def apply_chat_template(self, conversations, **kwargs):
+                calls.append(("template", len(conversations), kwargs["padding"]))
+                return {"input_ids": np.zeros((3, 5), dtype=int).view(DeviceArray)}
+
+            def batch_decode(self, rows, **_kwargs):
+                return ['{"tags": []}' if 7 in row else "{" for row in rows]
+
+        class StubModel:
+            device = "cpu"
+            generation_config = types.SimpleNamespace(eos_token_id=[1, 106])
+
+            def generate(self, input_ids, **kwargs):
+                calls.append(("generate", kwargs["max_new_tokens"]))
+                completions = np.array(
+                    [[7, 8, 106, 0], [9, 9, 9, 9], [1, 0, 0, 0]], dtype=int
+                )
+                return np.concatenate([input_ids, completions], axis=1)
+
+        classifier = Gemma4Classifier(batch_max_new_tokens=4)
+        classifier.processor = StubProcessor()
+        classifier.model = StubModel()
+        classifier._load_image = lambda path: Image.new("RGB", (4, 4))
+        transformers_stub = types.SimpleNamespace(LogitsProcessorList=list)
+        with mock.patch.dict(sys.modules, {"transformers": transformers_stub}):
+            texts = classifier.predict_batch(
+                [("a.jpg", None), ("b.jpg", None), ("c.jpg", None)]
+            )
+
+        self.assertEqual(calls, [("template", 3, True), ("generate", 4)])
+        self.assertEqual(texts, ['{"tags": []}', "{", "{"])
+        metrics = classifier.last_generation_metrics
+        self.assertEqual([m["tokenCount"] for m in metrics], [2, 4, 0])
+        self.assertEqual([m["completedWithEos"] for m in metrics], [True, False, True])
+        self.assertEqual([m["hitTokenLimit"] for m in metrics], [False, True, False])
+        self.assertTrue(metrics[0]["completedWithJson"])
+        self.assertTrue(all(m["batchSize"] == 3 for m in metrics))
+
+    def test_generation_row_metrics_stops_counting_at_the_first_eos(self):
+        metric = generation_row_metrics([5, 6, 2, 2, 2], '{"a": 1}', {2}, 5)
+
+        self.assertEqual(metric["tokenCount"], 2)
+        self.assertTrue(metric["completedWithEos"])
+        self.assertFalse(metric["hitTokenLimit"])
+
+    def test_gemma_prompt_prefix_cache_is_built_once_per_prompt(self):
+        built = []
+        probes = []
+
+        class StubCache(dict):
+            def crop(self, length):
+                self["cropped"] = length
+
+        class StubModel:
+            def __call__(self, input_ids, past_key_values, use_cache):
+                built.append(input_ids.tolist())
+                return types.SimpleNamespace(past_key_values=StubCache())
+
+            def prepare_inputs_for_generation(self, input_ids, **kwargs):
+                probes.append(kwargs["cache_position"].tolist())
+                return {"input_ids": input_ids, "pixel_values": kwargs["pixel_values"]}
+
+        classifier = Gemma4Classifier(prompt_first=True)
+        classifier.model = StubModel()
+        classifier.processor = types.SimpleNamespace(image_token_id=99)
+        transformers_stub = types.SimpleNamespace(DynamicCache=dict)
+        with (
+            mock.patch.dict(sys.modules, {"transformers": transformers_stub}),
+            torch_array_stub(),
+            mock.patch("index.log"),
+        ):
+            first = classifier._prompt_prefix_cache(np.array([[1, 2, 3, 99, 99, 7]]))
+            second = classifier._prompt_prefix_cache(np.array([[1, 2, 3, 99, 8]]))
+            changed = classifier._prompt_prefix_cache(np.array([[1, 5, 99, 7]]))
+
+        self.assertEqual(built, [[[1, 2, 3]], [[1, 5]]])
+        # Asked once, whether the image survives a cache that starts past 0.
+        self.assertEqual(probes, [[1]])
+        self.assertEqual(first, (second[0], 3))
+        self.assertEqual(changed[1], 2)
+        # Shared rather than deep-copied, and cut back to the prompt after use.
+        self.assertIs(changed[0], classifier._prefix_cache)
+        classifier._trim_prefix_cache(changed[1])
+        self.assertEqual(classifier._prefix_cache["cropped"], 2)
+        # A cache that cannot be cropped is rebuilt instead of reused extended.
+        classifier._prefix_cache = {}
+        classifier._trim_prefix_cache(2)
+        self.assertIsNone(classifier._prefix_cache)
+
+    def test_gemma_prompt_prefix_cache_is_off_when_the_image_would_be_dropped(self):
+        class StubModel:
+            def __call__(self, **_kwargs):
+                raise AssertionError("the prefix must not be prefilled")
+
+            def prepare_inputs_for_generation(self, input_ids, **kwargs):
+                # Gemma 3 style: pixel_values only on the step at position 0.
+                first_step = kwargs["cache_position"][0] == 0
+                return {"pixel_values": kwargs["pixel_values"] if first_step else None}
+
+        classifier = Gemma4Classifier(prompt_first=True)
+        classifier.model = StubModel()
+        classifier.processor = types.SimpleNamespace(image_token_id=99)
+        transformers_stub = types.SimpleNamespace(DynamicCache=dict)
+        with (
+            mock.patch.dict(sys.modules, {"transformers": transformers_stub}),
+            torch_array_stub(),
+            mock.patch("index.log"),
+        ):
+            self.assertEqual(
+                classifier._prompt_prefix_cache(np.array([[1, 2, 99, 7]])), (None, 0)
+            )
+
+    @unittest.skipUnless(
+        RUN_MODEL_INFERENCE,
+        "Set INDEX_RUN_MODEL_INFERENCE=1 to run live model inference tests",
+    )
+    def test_gemma_prompt_prefix_cache_matches_uncached_greedy_captions(self):
+        classifier = Gemma4Classifier(prompt_first=True, quantization=None)
+        classifier.init_model()
+        try:
+            paths = sorted(glob.glob("../albums/test-simple/*.jpg"))[:3]
+            cached = [classifier.predict(path, None) for path in paths]
+            self.assertTrue(classifier._prefix_cache_reaches_image)
+            self.assertGreater(
+                classifier.last_generation_metrics[0]["cachedPromptTokens"], 0
+            )
+            with mock.patch.object(
+                classifier, "_prompt_prefix_cache", return_value=(None, 0)
+            ):
+                uncached = [classifier.predict(path, None) for path in paths]
+        finally:
+            classifier.release()
+        self.assertEqual(cached, uncached)
+
     def test_gemma_gguf_reads_content_and_rejects_an_empty_thinking_only_reply(self):
         classifier = Gemma4GgufClassifier()
         good = {
@@ -1217,6 +1833,303 @@ class TestMain(unittest.TestCase):
             classifier._read_completion(empty)
         self.assertIn("reasoning", str(raised.exception).lower())
 
+    def test_gemma_gguf_parallel_batch_keeps_slots_busy_and_input_order(self):
+        state = {"inFlight": 0, "peak": 0, "connections": 0}
+        lock = threading.Lock()
+
+        class SlotHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    state["connections"] += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    state["inFlight"] += 1
+                    state["peak"] = max(state["peak"], state["inFlight"])
+                prompt = body["messages"][0]["content"][1]["text"]
+                # Later requests finish first, so order must come from the caller.
+                time.sleep(0.1 if prompt.endswith("0") else 0.03)
+                with lock:
+                    state["inFlight"] -= 1
+                reply = sse_reply(
+                    [{"choices": [{"delta": {"content": prompt}}]}],
+                    usage={"prompt_tokens": 5, "completion_tokens": 3},
+                )
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, *_args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlotHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        classifier = Gemma4GgufClassifier(parallel=3)
+        classifier._server = mock.Mock()
+        classifier.port = server.server_address[1]
+        classifier._base_url = f"http://127.0.0.1:{classifier.port}"
+        classifier._slots = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+        classifier._encode_image = lambda path: "BASE64"
+        classifier._build_prompt = lambda geocode: geocode["prompt"]
+        items = [(f"{i}.jpg", {"prompt": f"caption {i}"}) for i in range(9)]
+        try:
+            results = classifier.predict_batch(items)
+        finally:
+            classifier._server = None
+            classifier.release()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(results, [f"caption {i}" for i in range(9)])
+        self.assertEqual(state["peak"], 3)
+        # Three slot threads, each reusing one kept-alive connection.
+        self.assertEqual(state["connections"], 3)
+        self.assertEqual(len(classifier.last_generation_metrics), 9)
+        self.assertTrue(
+            all(m["parallelSlots"] == 3 for m in classifier.last_generation_metrics)
+        )
+        self.assertEqual(classifier.last_generation_metrics[0]["outputTokens"], 3)
+
+    def test_gguf_stream_stops_at_object_close_and_on_runaway_tags(self):
+        replies = {
+            "closed": [
+                '{"tags": ["cat"], ',
+                '"alt_text": "A cat."}',
+                "\n\nTrailing chatter that should never be read.",
+                # llama-server's tail: the EOS chunk, then usage and timings.
+                {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+                {
+                    "choices": [],
+                    "usage": {"prompt_tokens": 420, "completion_tokens": 3},
+                    "timings": {"prompt_n": 150, "prompt_ms": 61.5},
+                },
+            ],
+            "runaway": ['{"tags": ["folding"']
+            + [f', "folding{" table" * n}"' for n in range(1, 40)],
+            "duplicate": [
+                '{"tags": ["temple", "lantern", "tree", ',
+                '"shrine", "temple"',
+                ', "gate"], "alt_text": "A temple at dusk."}',
+            ],
+        }
+        sent = {}
+        clients = []
+
+        class StreamHandler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                assert body["stream"]
+                kind = body["messages"][0]["content"][1]["text"]
+                clients.append(self.client_address)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent[kind] = 0
+                try:
+                    for piece in replies[kind]:
+                        if isinstance(piece, str):
+                            piece = {"choices": [{"delta": {"content": piece}}]}
+                        data = f"data: {json.dumps(piece)}\n\n".encode()
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                        sent[kind] += 1
+                        time.sleep(0.01)
+                    done = b"data: [DONE]\n\n"
+                    self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *_args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        classifier = Gemma4GgufClassifier()
+        classifier._server = mock.Mock()
+        classifier.port = server.server_address[1]
+        classifier._base_url = f"http://127.0.0.1:{classifier.port}"
+        classifier._encode_image = lambda path: "BASE64"
+        classifier._build_prompt = lambda kind: kind
+        try:
+            closed = classifier.predict("a.jpg", "closed")
+            closed_metric = classifier.last_generation_metrics[0]
+            runaway = classifier.predict("b.jpg", "runaway")
+            runaway_metric = classifier.last_generation_metrics[0]
+            duplicate = classifier.predict("c.jpg", "duplicate")
+            duplicate_metric = classifier.last_generation_metrics[0]
+        finally:
+            classifier._server = None
+            classifier.release()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(closed, '{"tags": ["cat"], "alt_text": "A cat."}')
+        self.assertEqual(closed_metric["streamStop"], "object-closed")
+        self.assertTrue(closed_metric["completedWithSchema"])
+        # A closed stream is read to its end, so the prefix-cache metrics survive.
+        self.assertEqual(closed_metric["outputTokens"], 3)
+        self.assertEqual(closed_metric["promptTokens"], 420)
+        self.assertEqual(closed_metric["cachedPromptTokens"], 270)
+        self.assertEqual(closed_metric["prefillMs"], 61.5)
+        # Only the runaway dropped the kept-alive connection.
+        self.assertEqual(clients[0], clients[1])
+        self.assertNotEqual(clients[1], clients[2])
+        # The loop is caught within a few tags, not left to spend the budget.
+        self.assertEqual(runaway_metric["streamStop"], "runaway")
+        self.assertFalse(runaway_metric["completedWithEos"])
+        self.assertLess(runaway_metric["outputTokens"], 10)
+        self.assertLess(sent["runaway"], len(replies["runaway"]))
+        self.assertEqual(caption_stream_stop(runaway), "runaway")
+        # One repeated tag is a slip the parser dedupes, not a loop.
+        self.assertEqual(duplicate_metric["streamStop"], "object-closed")
+        self.assertEqual(
+            parse_classifier_response(duplicate)["tags"],
+            ["temple", "lantern", "tree", "shrine", "gate"],
+        )
+        self.assertIsNone(
+            caption_stream_stop(
+                '{"tags": ["temple", "lantern", "tree", "shrine", "temple"'
+            )
+        )
+        self.assertEqual(
+            caption_stream_stop('{"tags": ["temple", "tree", "temple", "temple"'),
+            "runaway",
+        )
+
+    def test_gguf_parallel_sizes_context_and_caption_version(self):
+        self.assertEqual(Gemma4GgufClassifier()._ctx_size(), 32768)
+        self.assertEqual(Gemma4GgufClassifier(parallel=4)._ctx_size(), 4 * 4096)
+        single = caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF)
+        self.assertEqual(
+            caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF, parallel=1),
+            single,
+        )
+        self.assertIn(
+            ":parallel=4:",
+            caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF, parallel=4),
+        )
+
+    def test_kept_caption_server_is_attached_and_survives_release(self):
+        class HealthHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *_args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HealthHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            mock.patch("index.tempfile.gettempdir", return_value=tmpdir),
+            mock.patch(
+                "index.resolve_llama_server_command", return_value="/opt/llama-server"
+            ),
+            mock.patch("index.subprocess.Popen") as popen,
+            mock.patch("index.log"),
+        ):
+            classifier = Gemma4GgufClassifier(persistent=True)
+            classifier.command = "/opt/llama-server"
+            write_caption_server_registry(
+                {
+                    "pid": os.getpid(),
+                    "port": server.server_address[1],
+                    "signature": classifier._server_signature(),
+                    "idleTimeoutSeconds": 60,
+                }
+            )
+            try:
+                classifier.init_model()
+                self.assertTrue(caption_server_in_use())
+                self.assertEqual(classifier.port, server.server_address[1])
+                classifier.release()
+            finally:
+                server.shutdown()
+                server.server_close()
+
+            popen.assert_not_called()
+            self.assertFalse(caption_server_in_use())
+            self.assertIsNotNone(read_caption_server_registry())
+
+    def test_unhealthy_kept_caption_server_is_stopped_not_orphaned(self):
+        # Alive, but nothing answers /health on port 1.
+        sleeper = subprocess.Popen(["sleep", "60"])
+        started = []
+
+        def start_server(classifier, detached=False):
+            started.append(detached)
+            classifier._server = mock.Mock(pid=os.getpid())
+
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            mock.patch("index.tempfile.gettempdir", return_value=tmpdir),
+            mock.patch(
+                "index.resolve_llama_server_command", return_value="/opt/llama-server"
+            ),
+            mock.patch.object(Gemma4GgufClassifier, "_start_server", start_server),
+            mock.patch("index.subprocess.Popen"),
+            mock.patch("index.log"),
+        ):
+            classifier = Gemma4GgufClassifier(persistent=True)
+            classifier.command = "/opt/llama-server"
+            stale = {
+                "pid": sleeper.pid,
+                "port": 1,
+                "signature": classifier._server_signature(),
+            }
+            write_caption_server_registry(stale)
+            lease = os.open(caption_server_state_path("lease"), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(lease, fcntl.LOCK_SH)
+                # Another run may still be using it, so it is left alone.
+                with self.assertRaisesRegex(RuntimeError, "not answering"):
+                    classifier.init_model()
+            finally:
+                os.close(lease)
+            self.assertEqual(read_caption_server_registry()["pid"], sleeper.pid)
+            self.assertIsNone(sleeper.poll())
+            self.assertEqual(started, [])
+
+            classifier.init_model()
+            classifier.release()
+
+            self.assertIsNotNone(sleeper.poll())
+            self.assertEqual(started, [True])
+            self.assertEqual(read_caption_server_registry()["pid"], os.getpid())
+
+    def test_caption_server_stop_refuses_while_a_run_holds_a_lease(self):
+        sleeper = subprocess.Popen(["sleep", "60"])
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            mock.patch("index.tempfile.gettempdir", return_value=tmpdir),
+            mock.patch("index.log"),
+        ):
+            write_caption_server_registry({"pid": sleeper.pid, "port": 1})
+            lease = os.open(caption_server_state_path("lease"), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(lease, fcntl.LOCK_SH)
+                refused = CliRunner().invoke(caption_server, ["stop"])
+            finally:
+                os.close(lease)
+            stopped = CliRunner().invoke(caption_server, ["stop"])
+
+            self.assertNotEqual(refused.exit_code, 0)
+            self.assertIn("in use", refused.output)
+            self.assertEqual(stopped.exit_code, 0, stopped.output)
+            self.assertIsNone(read_caption_server_registry())
+        self.assertIsNotNone(sleeper.poll())
+
     def test_resolve_llama_server_command_does_not_fall_back_to_tmp(self):
         with (
             mock.patch.dict(os.environ, {}, clear=True),
@@ -1284,6 +2197,7 @@ class TestMain(unittest.TestCase):
             Path(image_path).write_bytes(b"")
             fixture_path = os.path.join(tmpdir, "fixture.json")
             output_path = os.path.join(tmpdir, "result.json")
+            gates_path = os.path.join(tmpdir, "gates.json")
             with open(fixture_path, "w", encoding="utf-8") as fh:
                 json.dump(
                     {
@@ -1321,25 +2235,246 @@ class TestMain(unittest.TestCase):
                         "gemma4-gguf",
                         "--output",
                         output_path,
+                        "--result-cache",
+                        os.path.join(tmpdir, "results.sqlite"),
+                        "--image-tokens",
+                        "280",
+                        "--quality-gates-path",
+                        gates_path,
                     ],
                 )
 
             self.assertEqual(result.exit_code, 0, result.output)
             self.assertEqual(create.call_args.kwargs["backend"], "gemma4-gguf")
+            self.assertEqual(create.call_args.kwargs["image_min_tokens"], 70)
+            self.assertEqual(create.call_args.kwargs["image_max_tokens"], 280)
 
             with open(output_path, encoding="utf-8") as fh:
                 payload = json.load(fh)
+            with open(gates_path, encoding="utf-8") as fh:
+                gates = json.load(fh)
 
+        # The pass is recorded for index --classifier-image-tokens 280.
+        gate_key = caption_quality_gate_key(
+            CLASSIFIER_BACKEND_GEMMA4_GGUF, None, None, 280
+        )
+        self.assertEqual(gates[gate_key]["pipelineVersion"], payload["pipelineVersion"])
+        self.assertTrue(gates[gate_key]["passed"])
         self.assertTrue(payload["passed"])
         self.assertEqual(payload["backend"], "gemma4-gguf")
         self.assertEqual(payload["modelId"], "unsloth/gemma-4-E4B-it-GGUF:Q8_0")
         self.assertIn("gemma4-gguf", payload["pipelineVersion"])
+        self.assertIn(":imageTokens=280", payload["pipelineVersion"])
+        self.assertEqual(payload["imageTokens"], 280)
         # The tag-only quality metric is surfaced alongside the joined score so a
         # good alt sentence cannot hide unusable tags.
         self.assertIn("tagQuality", payload)
         self.assertIn("junkTagRate", payload["tagQuality"])
         self.assertIn("conceptCoverage", payload["tagQuality"])
 
+    def test_benchmark_caption_quality_reuses_cached_candidate_captions(self):
+        class StubClassifier:
+            model_id = "unsloth/gemma-4-E4B-it-GGUF:Q8_0"
+            quantization = None
+            batch_size = 1
+
+            def __init__(self):
+                self.last_generation_metrics = []
+                self.loads = 0
+                self.captioned = []
+
+            def init_model(self):
+                self.loads += 1
+
+            def release(self):
+                pass
+
+            def predict_batch(self, items):
+                self.captioned.extend(path for path, _geo in items)
+                self.last_generation_metrics = [
+                    {"completedWithEos": True} for _ in items
+                ]
+                return [
+                    json.dumps({"tags": ["mountain"], "alt_text": "A peak."})
+                    for _ in items
+                ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = os.path.join(tmpdir, "first.jpg")
+            second = os.path.join(tmpdir, "second.jpg")
+            Path(first).write_bytes(b"first")
+            Path(second).write_bytes(b"second")
+            fixture_path = os.path.join(tmpdir, "fixture.json")
+            output_path = os.path.join(tmpdir, "result.json")
+
+            def run(paths, *extra):
+                with open(fixture_path, "w", encoding="utf-8") as fh:
+                    json.dump(
+                        {
+                            "version": 1,
+                            "cases": [
+                                {"path": path, "requiredAny": ["mountain"]}
+                                for path in paths
+                            ],
+                        },
+                        fh,
+                    )
+                stub = StubClassifier()
+                with (
+                    mock.patch("index.create_classifier", return_value=stub),
+                    mock.patch(
+                        "index.acquire_single_instance_lock",
+                        side_effect=lambda *a, **k: os.open(os.devnull, os.O_RDONLY),
+                    ),
+                    mock.patch("index.log"),
+                ):
+                    result = CliRunner().invoke(
+                        benchmark_caption_quality,
+                        [
+                            "--fixture",
+                            fixture_path,
+                            "--output",
+                            output_path,
+                            "--result-cache",
+                            os.path.join(tmpdir, "results.sqlite"),
+                            "--quality-gates-path",
+                            os.path.join(tmpdir, "gates.json"),
+                            *extra,
+                        ],
+                    )
+                self.assertEqual(result.exit_code, 0, result.output)
+                with open(output_path, encoding="utf-8") as fh:
+                    return stub, json.load(fh)
+
+            run([first])
+            # Only the new case is captioned; the cached one is still scored.
+            stub, payload = run([first, second])
+            self.assertEqual(stub.captioned, [second])
+            self.assertEqual(payload["passedCases"], 2)
+            self.assertEqual(
+                [metric.get("cached") for metric in payload["generationMetrics"]],
+                [True, None],
+            )
+
+            # Fully cached: the model is never loaded.
+            stub, payload = run([first, second])
+            self.assertEqual(stub.loads, 0)
+            self.assertEqual(payload["resultCache"], {"hits": 2, "misses": 0})
+
+            # The raw output is cached, not the parse, so a parsing change
+            # still reaches cached cases.
+            with mock.patch(
+                "index.parse_classifier_response",
+                return_value={"tags": ["mountain"], "alt_text": "Reparsed."},
+            ):
+                stub, payload = run([first, second])
+            self.assertEqual(stub.loads, 0)
+            self.assertEqual(
+                [case["caption"]["alt_text"] for case in payload["cases"]],
+                ["Reparsed.", "Reparsed."],
+            )
+
+            # A changed source is a new key, and --refresh ignores the cache.
+            Path(first).write_bytes(b"edited")
+            stub, _payload = run([first, second])
+            self.assertEqual(stub.captioned, [first])
+            stub, _payload = run([first, second], "--refresh")
+            self.assertEqual(stub.captioned, [first, second])
+
+    def test_benchmark_classifier_sweeps_llama_server_settings(self):
+        grid = classifier_sweep_grid(None, ("Q8_0", "Q4_K_M"), (1, 2), (), (), (), ())
+        self.assertEqual(len(grid), 4)
+        self.assertEqual(grid[0]["modelId"], "unsloth/gemma-4-E4B-it-GGUF:Q8_0")
+        self.assertIsNone(grid[0]["ctxSize"])
+
+        class StubClassifier:
+            batch_size = 1
+
+            def __init__(self, **kwargs):
+                self.settings = kwargs
+                self.parallel = kwargs["parallel"] or 1
+                self.last_generation_metrics = []
+
+            def init_model(self):
+                if self.settings["ctx_size"] == 1024:
+                    raise RuntimeError("llama-server exited during startup\nOOM")
+
+            def release(self):
+                pass
+
+            def predict(self, _path, _geocode):
+                return json.dumps({"tags": ["monkey"], "alt_text": "A monkey."})
+
+            def predict_batch(self, items):
+                self.last_generation_metrics = [
+                    {"durationMs": 100.0 * (position + 1)}
+                    for position, _item in enumerate(items)
+                ]
+                return [self.predict(path, geo) for path, geo in items]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_json = os.path.join(tmpdir, "sweep.json")
+            output_md = os.path.join(tmpdir, "sweep.md")
+            with (
+                mock.patch("index.create_classifier", StubClassifier),
+                mock.patch("index.log"),
+            ):
+                result = CliRunner().invoke(
+                    benchmark_classifier,
+                    [
+                        "--sweep",
+                        "--glob",
+                        "../albums/test-simple/*.jpg",
+                        "--sample-size",
+                        "2",
+                        "--parallel",
+                        "2",
+                        "--ctx-size",
+                        "8192",
+                        "--ctx-size",
+                        "1024",
+                        "--image-max-tokens",
+                        "70",
+                        "--output",
+                        output_json,
+                        "--output-md",
+                        output_md,
+                    ],
+                )
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(output_json, encoding="utf-8") as fh:
+                cells = json.load(fh)["cells"]
+            with open(output_md, encoding="utf-8") as fh:
+                report = fh.read()
+
+        working, failed = cells
+        self.assertEqual(working["ctxSize"], 8192)
+        self.assertEqual(working["imageMaxTokens"], 70)
+        # Both requests went out together on two slots.
+        self.assertEqual(working["p50LatencyMs"], 100.0)
+        self.assertEqual(working["p95LatencyMs"], 200.0)
+        self.assertEqual(working["parseSuccess"], 2)
+        self.assertIsNotNone(working["imagesPerSecond"])
+        # A cell that cannot start is reported rather than ending the sweep.
+        self.assertIn("exited during startup", failed["error"])
+        self.assertIsNone(failed["imagesPerSecond"])
+        self.assertIn("| 2/2 |", report)
+        self.assertIn("failed: llama-server exited during startup |", report)
+
+    def test_gguf_server_takes_image_token_bounds_only_when_set(self):
+        default = Gemma4GgufClassifier()
+        bounded = Gemma4GgufClassifier(image_min_tokens=35, image_max_tokens=70)
+        for classifier in (default, bounded):
+            classifier.command = "llama-server"
+
+        self.assertEqual(default._image_token_args(), [])
+        self.assertNotIn("imageTokens", default._server_signature())
+        self.assertEqual(
+            bounded._image_token_args(),
+            ["--image-min-tokens", "35", "--image-max-tokens", "70"],
+        )
+        self.assertEqual(bounded._server_signature()["imageTokens"], [35, 70])
+
     def test_sample_balanced_paths_spreads_across_groups(self):
         paths = [
             "albums/a/1.jpg",
@@ -1458,6 +2593,185 @@ class TestMain(unittest.TestCase):
             pass
         self.assertEqual(mock_log.call_args_list, [])
 
+    def test_adaptive_caption_batch_grows_with_headroom_and_backs_off(self):
+        sizer = AdaptiveCaptionBatchSize(maximum=6, target_free_gb=2.0)
+        with (
+            mock.patch("index.torch.cuda.is_available", return_value=True),
+            mock.patch("index.reset_batch_vram_peak"),
+            mock.patch("index.torch.cuda.memory_allocated", return_value=5_000_000_000),
+            mock.patch(
+                # One image's working memory above the resident model: 0.5 GB.
+                "index.torch.cuda.max_memory_allocated",
+                create=True,
+                return_value=5_500_000_000,
+            ),
+        ):
+            sizer.start_batch()
+            self.assertEqual(sizer.finish_batch(1, 10.0, oom=False), 2)
+        self.assertEqual(sizer.per_image_gb, 0.5)
+        # One image at a time while there is room, never past the ceiling.
+        for size in range(2, 6):
+            sizer.observe(size, 10.0, oom=False)
+        self.assertEqual(sizer.size, 6)
+        sizer.observe(6, 10.0, oom=False)
+        self.assertEqual(sizer.size, 6)
+        # A busier card shrinks it at once, to what leaves the target free.
+        sizer.observe(6, 3.2, oom=False)
+        self.assertEqual(sizer.size, 2)
+        # An OOM anyway halves it and never retries the size that failed.
+        sizer.observe(4, 10.0, oom=True)
+        self.assertEqual((sizer.size, sizer.maximum), (2, 3))
+
+        # Without CUDA there is nothing to steer by, so the size holds.
+        steady = AdaptiveCaptionBatchSize(maximum=6, initial=3)
+        with mock.patch("index.torch.cuda.is_available", return_value=False):
+            steady.start_batch()
+            self.assertEqual(steady.finish_batch(3, math.inf, oom=False), 3)
+
+    def test_adaptive_caption_batch_stamps_policy_not_size(self):
+        adaptive = caption_pipeline_version(
+            CLASSIFIER_BACKEND_GEMMA4, batch_size=6, adaptive_batch=True
+        )
+        self.assertIn(":batch=adaptive:", adaptive)
+        self.assertEqual(
+            adaptive,
+            caption_pipeline_version(
+                CLASSIFIER_BACKEND_GEMMA4, batch_size=2, adaptive_batch=True
+            ),
+        )
+        result = CliRunner().invoke(
+            cli,
+            [
+                "index",
+                "--glob",
+                "*.jpg",
+                "--dbpath",
+                "unused.sqlite",
+                "--classifier-adaptive-batch",
+            ],
+        )
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("requires --classifier-backend gemma4", result.output)
+
+    def test_image_token_tier_sets_bounds_and_stamps_version(self):
+        # Unset keeps the mmproj's budget and the existing version string.
+        self.assertEqual(gguf_image_token_bounds(None), (None, None))
+        self.assertEqual(gguf_image_token_bounds(280), (70, 280))
+        self.assertNotIn(
+            "imageTokens", caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF)
+        )
+        self.assertIn(
+            ":imageTokens=70",
+            caption_pipeline_version(CLASSIFIER_BACKEND_GEMMA4_GGUF, image_tokens=70),
+        )
+        result = CliRunner().invoke(
+            cli,
+            [
+                "index",
+                "--glob",
+                "*.jpg",
+                "--dbpath",
+                "unused.sqlite",
+                "--classifier-backend",
+                "gemma4",
+                "--classifier-image-tokens",
+                "280",
+            ],
+        )
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("requires --classifier-backend gemma4-gguf", result.output)
+
+    def test_image_token_tier_requires_a_passing_quality_gate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gates_path = os.path.join(tmpdir, "gates.json")
+            args = [
+                "index",
+                "--glob",
+                "../src/test/fixtures/monkey.jpg",
+                "--dbpath",
+                os.path.join(tmpdir, "index.sqlite"),
+                "--dry-run",
+                "--model-profile",
+                "captions",
+                "--classifier-backend",
+                "gemma4-gguf",
+                "--classifier-image-tokens",
+                "140",
+                "--quality-gates-path",
+                gates_path,
+            ]
+            result = CliRunner().invoke(cli, args)
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("no passing benchmark-caption-quality", result.output)
+
+            key = caption_quality_gate_key(
+                CLASSIFIER_BACKEND_GEMMA4_GGUF, None, None, 140
+            )
+            payload = {
+                "pipelineVersion": caption_pipeline_version(
+                    CLASSIFIER_BACKEND_GEMMA4_GGUF, batch_size=4, image_tokens=140
+                ),
+                "fixtureVersion": 1,
+                "passedCases": 3,
+                "totalCases": 3,
+                "generatedAt": "2026-10-18T00:00:00Z",
+            }
+            # Another tier's pass does not gate this one.
+            record_caption_quality_gate(
+                gates_path,
+                caption_quality_gate_key(
+                    CLASSIFIER_BACKEND_GEMMA4_GGUF, None, None, 70
+                ),
+                {**payload, "passed": True},
+            )
+            self.assertNotEqual(CliRunner().invoke(cli, args).exit_code, 0)
+
+            record_caption_quality_gate(gates_path, key, {**payload, "passed": True})
+            result = CliRunner().invoke(cli, args)
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            # A later failing run withdraws the pass.
+            record_caption_quality_gate(gates_path, key, {**payload, "passed": False})
+            self.assertNotEqual(CliRunner().invoke(cli, args).exit_code, 0)
+
+    def test_caption_reuse_matches_by_capture_time_then_hash_distance(self):
+        hashes = {"burst": 0b1011, "near": 0b1010, "far": 0b0100, "late": 0b1011}
+        hashed = []
+
+        def hasher(path):
+            hashed.append(path)
+            return hashes[path]
+
+        reuse = CaptionReuseIndex(window_seconds=5, max_distance=1, hasher=hasher)
+        # EXIF capture times are naive local times, as parse_capture_time reads them.
+        start = parse_capture_time("2024-05-01T12:00:00")
+        reuse.add("near", start + timedelta(seconds=2))
+        reuse.add("far", start + timedelta(seconds=3))
+        reuse.add("late", start + timedelta(minutes=5))
+
+        self.assertEqual(reuse.find("burst", start), "near")
+        # Photos outside the window are never decoded.
+        self.assertNotIn("late", hashed)
+        self.assertIsNone(reuse.find("burst", start + timedelta(minutes=1)))
+        self.assertIsNone(reuse.find("burst", None))
+
+    def test_caption_reuse_holds_a_burst_frame_back_from_its_twins_batch(self):
+        hashes = {"first": 0b1011, "second": 0b1010, "other": 0b0100}
+        reuse = CaptionReuseIndex(
+            window_seconds=5, max_distance=1, hasher=lambda path: hashes[path]
+        )
+        start = parse_capture_time("2024-05-01T12:00:00")
+        in_flight = [(start, "first")]
+
+        # Batched together, neither frame would have a donor yet.
+        self.assertTrue(reuse.awaits("second", start + timedelta(seconds=1), in_flight))
+        # A different shot, or one outside the window, joins the batch.
+        self.assertFalse(reuse.awaits("other", start + timedelta(seconds=1), in_flight))
+        self.assertFalse(
+            reuse.awaits("second", start + timedelta(minutes=1), in_flight)
+        )
+        self.assertFalse(reuse.awaits("second", None, in_flight))
+
     def test_log_vram_is_noop_without_cuda(self):
         with (
             mock.patch("index.torch.cuda.is_available", return_value=False),
@@ -2033,9 +3347,105 @@ class TestCli(UsesTestexistsFixture, unittest.TestCase):
                     "--classifier-backend gemma4-gguf --dry-run"
                 ).split(),
             )
-            self.assertEqual(0, result.exit_code)
+            self.assertEqual(0, result.exit_code)
+            self.assertIn("(0 to index, 1 already indexed)", result.output)
+
+    def _seed_captioned_copy(self, tmpdir, caption_digest):
+        """A monkey photo under cwd with a core row and a current caption."""
+        path = os.path.relpath(os.path.join(tmpdir, "monkey.jpg"))
+        shutil.copyfile("../src/test/fixtures/monkey.jpg", path)
+        dbpath = os.path.join(tmpdir, "pixels.sqlite")
+        file_digest, pixel_digest = file_content_digests(path)
+        db = Sqlite3Client(dbpath)
+        db.setup_tables()
+        insert_analysed_images_batch(
+            db,
+            [
+                {
+                    "path": path,
+                    "analysed": {
+                        "exif": {},
+                        "geocode": {},
+                        "lat_deg": None,
+                        "lng_deg": None,
+                        "iso8601": None,
+                        "colors": [],
+                        "tags": ["monkey"],
+                        "alt_text": "A monkey",
+                        "subject": None,
+                        "embeddings": [],
+                    },
+                    "write_core": True,
+                    "write_caption": True,
+                    "source_sha256": file_digest,
+                    "pixel_sha256": (
+                        pixel_digest if caption_digest == "pixel" else file_digest
+                    ),
+                    "caption_version": caption_pipeline_version("gemma4-gguf"),
+                    "caption_model_id": DEFAULT_GEMMA4_GGUF_MODEL_ID,
+                }
+            ],
+        )
+        db.con.close()
+        return path, dbpath, pixel_digest
+
+    def _index_captions_without_a_model(self, path, dbpath):
+        with (
+            mock.patch("index.create_classifier", side_effect=AssertionError),
+            mock.patch(
+                "index.acquire_single_instance_lock", side_effect=self._lock_stub
+            ),
+        ):
+            return CliRunner().invoke(
+                index,
+                (
+                    f"--glob {path} --dbpath {dbpath} --model-profile captions "
+                    "--classifier-backend gemma4-gguf"
+                ).split(),
+            )
+
+    def test_metadata_only_edit_reruns_only_the_core_stage(self):
+        # The geotag tool rewrites EXIF in place. The caption is pinned to the
+        # pixels, so the run must refresh core without loading a captioner.
+        with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+            path, dbpath, pixel_digest = self._seed_captioned_copy(tmpdir, "pixel")
+            with open(path, "rb") as fh:
+                data = fh.read()
+            comment = b"geotagged"
+            with open(path, "wb") as fh:
+                fh.write(
+                    data[:2]
+                    + b"\xff\xfe"
+                    + struct.pack(">H", len(comment) + 2)
+                    + comment
+                    + data[2:]
+                )
+
+            result = self._index_captions_without_a_model(path, dbpath)
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertIn("(1 to index, 0 already indexed)", result.output)
+
+            states = Sqlite3Client(dbpath, read_only=True).get_pipeline_states()
+            self.assertEqual(states[(path, CORE_STAGE)][0], file_content_sha256(path))
+            self.assertEqual(states[(path, CAPTION_STAGE)][0], pixel_digest)
+            summary = validate_index_database(
+                dbpath, path, "captions", classifier_backend="gemma4-gguf"
+            )
+            self.assertEqual(summary["paths"], 1)
+
+    def test_whole_file_caption_pin_moves_to_the_pixel_digest(self):
+        # Provenance written before pixel digests is current while the file is
+        # unchanged, and is re-pinned so a later metadata edit cannot stale it.
+        with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+            path, dbpath, pixel_digest = self._seed_captioned_copy(tmpdir, "file")
+
+            result = self._index_captions_without_a_model(path, dbpath)
+            self.assertEqual(0, result.exit_code, result.output)
             self.assertIn("(0 to index, 1 already indexed)", result.output)
 
+            states = Sqlite3Client(dbpath, read_only=True).get_pipeline_states()
+            self.assertEqual(states[(path, CAPTION_STAGE)][0], pixel_digest)
+
     class _StubGgufClassifier:
         """Model-free stand-in for the GGUF caption backend used by full `index`
         runs. Subclasses decide what predict_batch/predict return."""
@@ -2059,6 +3469,97 @@ class TestCli(UsesTestexistsFixture, unittest.TestCase):
     def _lock_stub(*_args, **_kwargs):
         return os.open(os.devnull, os.O_RDONLY)
 
+    def test_benchmark_pipeline_runs_the_index_with_stub_backends(self):
+        def last_index_stats():
+            try:
+                return Path(".last-index-stats.json").read_bytes()
+            except FileNotFoundError:
+                return None
+
+        stats_before = last_index_stats()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "pipeline.json")
+            with (
+                mock.patch(
+                    "index.acquire_single_instance_lock", side_effect=self._lock_stub
+                ),
+                mock.patch("index.log"),
+            ):
+                result = CliRunner().invoke(
+                    benchmark_pipeline,
+                    [
+                        "--images",
+                        "6",
+                        "--albums",
+                        "2",
+                        "--image-edge",
+                        "64",
+                        "--caption-latency-ms",
+                        "5",
+                        "--output",
+                        output,
+                    ],
+                )
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(output, encoding="utf-8") as fh:
+                cold, rerun = json.load(fh)["runs"]
+
+        self.assertEqual(cold["workItemCount"], 6)
+        self.assertEqual(cold["failures"], {"core": 0, "caption": 0, "embedding": 0})
+        # Both embedders ran under their real model ids, as stubs.
+        self.assertIn("google/siglip-base-patch16-224", cold["stageDurationsMs"])
+        self.assertIn("google/siglip2-base-patch16-224", cold["stageDurationsMs"])
+        self.assertGreaterEqual(cold["stubModelMs"]["caption"], 30)
+        self.assertAlmostEqual(
+            cold["nonModelMs"],
+            cold["totalMs"] - sum(cold["stubModelMs"].values()),
+            places=1,
+        )
+        self.assertIn("captionOrchestration", cold["breakdownMs"])
+        # Nothing changed, so the rerun plans no work and runs no model.
+        self.assertEqual(rerun["workItemCount"], 0)
+        self.assertEqual(rerun["stubModelMs"], {"caption": 0.0, "embedding": 0.0})
+        # The publish tooling's record of the last real run is left alone.
+        self.assertEqual(last_index_stats(), stats_before)
+
+    def test_stub_embeddings_are_stamped_apart_from_the_real_model(self):
+        with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+            album = os.path.join(tmpdir, "nagano")
+            os.makedirs(album)
+            shutil.copyfile(
+                "../src/test/fixtures/monkey.jpg", os.path.join(album, "a.jpg")
+            )
+            dbpath = os.path.join(tmpdir, "index.sqlite")
+            glob = os.path.relpath(os.path.join(album, "*.jpg"))
+            args = ["--glob", glob, "--dbpath", dbpath, "--model-profile", "siglip2"]
+
+            def run(*extra):
+                with mock.patch(
+                    "index.acquire_single_instance_lock", side_effect=self._lock_stub
+                ):
+                    result = CliRunner().invoke(index, [*args, *extra])
+                self.assertEqual(0, result.exit_code, result.output)
+                return result.output
+
+            run("--embedder-backend", "stub")
+            con = sqlite3.connect(dbpath)
+            versions = dict(
+                con.execute(
+                    "SELECT stage, pipeline_version FROM pipeline_state "
+                    "WHERE stage LIKE 'embedding:%'"
+                )
+            )
+            con.close()
+            self.assertEqual(
+                versions[SIGLIP_V1_STAGE],
+                f"image-embedding-v1:{SiglipEmbedder.MODEL_ID}@stub",
+            )
+            self.assertTrue(versions["embedding:siglip-v2"].endswith("@stub"))
+
+            # The stub is current for itself, but a real run replaces its vectors.
+            self.assertIn("(0 to index", run("--embedder-backend", "stub", "--dry-run"))
+            self.assertIn("(1 to index", run("--dry-run"))
+
     def test_index_falls_back_to_metadata_caption_when_model_rejects(self):
         """A caption the model cannot produce must not block the whole index:
         the assembly pass writes a metadata-only fallback so every photo has a
@@ -2201,6 +3702,247 @@ class TestCli(UsesTestexistsFixture, unittest.TestCase):
             self.assertNotEqual(0, result.exit_code)
             self.assertTrue(stub.released)
 
+    def test_source_byte_cache_reads_each_photo_from_disk_once(self):
+        # Digest, EXIF and palette all read the same source; with the cache on,
+        # only the first of them may touch the disk.
+        with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+            album = os.path.join(tmpdir, "nagano")
+            os.makedirs(album)
+            shutil.copyfile(
+                "../src/test/fixtures/monkey.jpg", os.path.join(album, "good.jpg")
+            )
+            dbpath = os.path.join(tmpdir, "index.sqlite")
+            benchmark = os.path.join(tmpdir, "benchmark.json")
+            glob = os.path.relpath(os.path.join(album, "*.jpg"))
+
+            class WorkingClassifier(self._StubGgufClassifier):
+                def predict_batch(inner, items):
+                    inner.last_generation_metrics = [
+                        {"completedWithEos": True} for _ in items
+                    ]
+                    return [
+                        json.dumps({"tags": ["monkey"], "alt_text": "A monkey."})
+                        for _ in items
+                    ]
+
+            with (
+                mock.patch("index.create_classifier", return_value=WorkingClassifier()),
+                mock.patch(
+                    "index.acquire_single_instance_lock", side_effect=self._lock_stub
+                ),
+            ):
+                result = CliRunner().invoke(
+                    index,
+                    [
+                        "--glob",
+                        glob,
+                        "--dbpath",
+                        dbpath,
+                        "--model-profile",
+                        "captions",
+                        "--classifier-backend",
+                        "gemma4-gguf",
+                        "--source-cache-mb",
+                        "64",
+                        "--benchmark-output",
+                        benchmark,
+                    ],
+                )
+            self.assertEqual(0, result.exit_code, result.output)
+            with open(benchmark, encoding="utf-8") as fh:
+                stats = json.load(fh)["sourceByteCache"]
+
+        self.assertEqual(stats["misses"], 1)
+        self.assertGreaterEqual(stats["hits"], 2)
+
+    def test_index_defers_caption_retries_until_after_the_sweep(self):
+        def run_with_straggler(single_tokens, extra_args):
+            with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+                album = os.path.join(tmpdir, "nagano")
+                os.makedirs(album)
+                for name in ("a.jpg", "b.jpg", "c.jpg"):
+                    shutil.copyfile(
+                        "../src/test/fixtures/monkey.jpg", os.path.join(album, name)
+                    )
+                dbpath = os.path.join(tmpdir, "index.sqlite")
+                glob = os.path.relpath(os.path.join(album, "*.jpg"))
+                calls = []
+
+                class StragglerClassifier(self._StubGgufClassifier):
+                    max_new_tokens = single_tokens
+
+                    def predict_batch(inner, items):
+                        names = [os.path.basename(path) for path, _geo in items]
+                        calls.append((names, inner.max_new_tokens))
+                        first_sight = len(calls) == 1
+                        inner.last_generation_metrics = [
+                            {"completedWithEos": not first_sight} for _ in items
+                        ]
+                        return [
+                            "truncated"
+                            if first_sight
+                            else json.dumps(
+                                {"tags": ["monkey"], "alt_text": "A monkey."}
+                            )
+                            for _ in items
+                        ]
+
+                stub = StragglerClassifier()
+                with (
+                    mock.patch("index.create_classifier", return_value=stub),
+                    mock.patch(
+                        "index.acquire_single_instance_lock",
+                        side_effect=self._lock_stub,
+                    ),
+                ):
+                    result = CliRunner().invoke(
+                        index,
+                        [
+                            "--glob",
+                            glob,
+                            "--dbpath",
+                            dbpath,
+                            "--model-profile",
+                            "captions",
+                            "--classifier-backend",
+                            "gemma4-gguf",
+                            *extra_args,
+                        ],
+                    )
+                self.assertEqual(0, result.exit_code, result.output)
+                self.assertEqual(stub.max_new_tokens, single_tokens)
+                con = sqlite3.connect(dbpath)
+                attempts = con.execute(
+                    "SELECT path, attempt, parse_success "
+                    "FROM caption_generation_metrics ORDER BY id"
+                ).fetchall()
+                versions = {
+                    row[0]
+                    for row in con.execute(
+                        "SELECT pipeline_version FROM pipeline_state WHERE stage = ?",
+                        (CAPTION_STAGE,),
+                    )
+                }
+                con.close()
+            return calls, attempts, versions
+
+        calls, attempts, versions = run_with_straggler(
+            192, ["--classifier-retry-max-new-tokens", "320"]
+        )
+        # The straggler waits for the sweep, then retries at its own budget.
+        self.assertEqual(
+            calls,
+            [
+                (["a.jpg"], 192),
+                (["b.jpg"], 192),
+                (["c.jpg"], 192),
+                (["a.jpg"], 320),
+            ],
+        )
+        self.assertEqual(
+            [(os.path.basename(path), attempt, ok) for path, attempt, ok in attempts],
+            [
+                ("a.jpg", "batch", 0),
+                ("b.jpg", "batch", 1),
+                ("c.jpg", "batch", 1),
+                ("a.jpg", "single-retry", 1),
+            ],
+        )
+        self.assertEqual(len(versions), 1)
+        self.assertIn(":retryTokens=320", versions.pop())
+
+        # By default a GGUF retry keeps the server's own single cap, as the
+        # single retry always did, and the version is not restamped.
+        calls, _attempts, versions = run_with_straggler(
+            DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS, []
+        )
+        self.assertEqual(calls[-1], (["a.jpg"], DEFAULT_GEMMA4_GGUF_MAX_NEW_TOKENS))
+        self.assertEqual(len(versions), 1)
+        self.assertNotIn(":retryTokens=", versions.pop())
+
+    def test_index_reuses_near_duplicate_captions_with_provenance(self):
+        with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+            album = os.path.join(tmpdir, "nagano")
+            os.makedirs(album)
+            # Same capture time and pixels: a burst frame and a re-export.
+            shutil.copyfile(
+                "../src/test/fixtures/monkey.jpg", os.path.join(album, "a.jpg")
+            )
+            shutil.copyfile(
+                "../src/test/fixtures/monkey.jpg", os.path.join(album, "b.jpg")
+            )
+            shutil.copyfile(
+                "../src/test/fixtures/monkey-for-unoptimised.jpg",
+                os.path.join(album, "c.jpg"),
+            )
+            # No capture time, so never matched.
+            Image.new("RGB", (64, 48), (20, 120, 200)).save(
+                os.path.join(album, "d.jpg")
+            )
+            dbpath = os.path.join(tmpdir, "index.sqlite")
+            glob = os.path.relpath(os.path.join(album, "*.jpg"))
+            captioned = []
+
+            class WorkingClassifier(self._StubGgufClassifier):
+                def predict_batch(inner, items):
+                    captioned.extend(os.path.basename(path) for path, _geo in items)
+                    inner.last_generation_metrics = [
+                        {"completedWithEos": True} for _ in items
+                    ]
+                    return [
+                        json.dumps({"tags": ["monkey"], "alt_text": "A monkey."})
+                        for _ in items
+                    ]
+
+            args = [
+                "--glob",
+                glob,
+                "--dbpath",
+                dbpath,
+                "--model-profile",
+                "captions",
+                "--classifier-backend",
+                "gemma4-gguf",
+                "--classifier-reuse-near-duplicates",
+            ]
+            with (
+                mock.patch("index.create_classifier", return_value=WorkingClassifier()),
+                mock.patch(
+                    "index.acquire_single_instance_lock", side_effect=self._lock_stub
+                ),
+            ):
+                result = CliRunner().invoke(index, args)
+                self.assertEqual(0, result.exit_code, result.output)
+                rerun = CliRunner().invoke(index, args)
+                self.assertEqual(0, rerun.exit_code, rerun.output)
+
+            self.assertEqual(sorted(captioned), ["a.jpg", "d.jpg"])
+            db = Sqlite3Client(dbpath, read_only=True)
+            states = db.get_pipeline_states()
+            versions = {
+                os.path.basename(path): version
+                for (path, stage), (_digest, version, _model) in states.items()
+                if stage == CAPTION_STAGE
+            }
+            tags = dict(
+                db.con.execute(
+                    "SELECT path, tag FROM image_tags WHERE source = 'classifier'"
+                ).fetchall()
+            )
+            db.con.close()
+            self.assertNotIn(":reusedFrom=", versions["a.jpg"])
+            self.assertIn(f"{versions['a.jpg']}:reusedFrom=", versions["b.jpg"])
+            self.assertIn(":reusedFrom=", versions["c.jpg"])
+            self.assertEqual(set(tags.values()), {"monkey"})
+            self.assertEqual(len(tags), 4)
+            # Reused captions are current: the rerun captioned nothing, and
+            # validation accepts them.
+            self.assertIn("(0 to index, 4 already indexed)", rerun.output)
+            summary = validate_index_database(
+                dbpath, glob, "captions", classifier_backend="gemma4-gguf"
+            )
+            self.assertEqual(summary["paths"], 4)
+
     def test_search(self):
         runner = CliRunner()
         dbpath = self.testexists_db
@@ -2510,6 +4252,58 @@ class TestCli(UsesTestexistsFixture, unittest.TestCase):
         ):
             enforce_vram_headroom("caption batch 1/281")
 
+    def test_vram_guard_pauses_until_the_card_is_given_back(self):
+        cuda = self._fake_cuda(free_gb=0.05, reserved_gb=4.40, allocated_gb=4.35)
+        # Still held at the first poll; a 1 GB device-free second poll resumes.
+        cuda.mem_get_info.side_effect = [
+            (int(0.05e9), int(10.7e9)),
+            (int(0.05e9), int(10.7e9)),
+            (int(0.05e9), int(10.7e9)),
+            (int(1.0e9), int(10.7e9)),
+        ]
+        clock = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        pauses = []
+        with (
+            mock.patch("index.torch.cuda", cuda),
+            mock.patch("index.log"),
+            mock.patch("index.time.monotonic", lambda: clock[0]),
+            mock.patch("index.time.sleep", sleep),
+        ):
+            headroom = enforce_vram_headroom("caption batch 1/281", 600.0, pauses)
+
+        self.assertAlmostEqual(headroom, 1.05, places=2)
+        # Polling backs off rather than hammering the card.
+        self.assertEqual(sleeps, [5.0, 10.0])
+        self.assertEqual(pauses, [15.0])
+
+    def test_vram_pause_stops_once_its_deadline_passes(self):
+        cuda = self._fake_cuda(free_gb=0.05, reserved_gb=4.40, allocated_gb=4.35)
+        clock = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        pauses = []
+        with (
+            mock.patch("index.torch.cuda", cuda),
+            mock.patch("index.log"),
+            mock.patch("index.time.monotonic", lambda: clock[0]),
+            mock.patch("index.time.sleep", sleep),
+            self.assertRaises(click.ClickException),
+        ):
+            enforce_vram_headroom("caption batch 1/281", 150.0, pauses)
+
+        self.assertEqual(sleeps, [5.0, 10.0, 20.0, 40.0, 60.0, 15.0])
+        self.assertEqual(pauses, [150.0])
+
     def test_prepare_staging_copies_from_the_working_db_when_absent(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             source = os.path.join(tmpdir, "search.sqlite")
@@ -3413,6 +5207,83 @@ class TestDb(UsesTestexistsFixture, unittest.TestCase):
                 ("photo.jpg", "batch", 4, 128, 74, 1, 1, 12.5, 1000.0),
             )
 
+    def test_caption_token_budget_recommends_and_applies_a_percentile_cap(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dbpath = os.path.join(tmpdir, "metrics.sqlite")
+            db = Sqlite3Client(dbpath)
+            db.setup_tables()
+            # Four batches of two at 10ms a decode step; one row hit the cap.
+            batches = [(40, 50), (45, None), (60, 70), (30, 90)]
+            db.insert_caption_generation_metrics(
+                {
+                    "path": f"{index}-{row}.jpg",
+                    "pipelineVersion": "caption-v1",
+                    "batchSize": 2,
+                    "maxNewTokens": 128,
+                    "tokenCount": tokens or 128,
+                    "hitTokenLimit": tokens is None,
+                    "generateBatchMs": max(t or 128 for t in batch) * 10.0,
+                }
+                for index, batch in enumerate(batches)
+                for row, tokens in enumerate(batch)
+            )
+            db.con.close()
+            report_path = os.path.join(tmpdir, "budget.json")
+
+            result = CliRunner().invoke(
+                caption_token_budget_report,
+                [
+                    "--dbpath",
+                    dbpath,
+                    "--percentile",
+                    "75",
+                    "--output",
+                    report_path,
+                    "--apply",
+                ],
+            )
+            self.assertEqual(0, result.exit_code, result.output)
+            with open(report_path, encoding="utf-8") as fh:
+                report = json.load(fh)
+
+            self.assertEqual(report["recommendedCap"], 72)
+            self.assertEqual(report["currentRetryRate"], 0.125)
+            # The 90-token row would now retry, beside the one already capped.
+            self.assertEqual(report["expectedRetryRate"], 0.25)
+            self.assertEqual(report["expectedSavedDecodeMs"], 740.0)
+            self.assertEqual(report["expectedRetryDecodeMs"], 900.0)
+            self.assertIsNone(report["percentiles"]["p99"])
+            self.assertEqual(
+                resolve_batch_max_new_tokens(
+                    dbpath, None, True, CLASSIFIER_BACKEND_GEMMA4
+                ),
+                72,
+            )
+            self.assertEqual(
+                resolve_batch_max_new_tokens(
+                    dbpath, 96, False, CLASSIFIER_BACKEND_GEMMA4
+                ),
+                96,
+            )
+            with self.assertRaises(click.ClickException):
+                resolve_batch_max_new_tokens(
+                    dbpath, 96, True, CLASSIFIER_BACKEND_GEMMA4
+                )
+            # llama-server never decodes at a batch cap, so it cannot learn one.
+            with self.assertRaisesRegex(click.ClickException, "requires"):
+                resolve_batch_max_new_tokens(
+                    dbpath, None, True, CLASSIFIER_BACKEND_GEMMA4_GGUF
+                )
+
+            # A percentile beyond the cap has nothing to learn from.
+            cautious = CliRunner().invoke(
+                caption_token_budget_report,
+                ["--dbpath", dbpath, "--output", report_path],
+            )
+            self.assertEqual(0, cautious.exit_code, cautious.output)
+            with open(report_path, encoding="utf-8") as fh:
+                self.assertEqual(json.load(fh)["recommendedCap"], 128)
+
     def test_incomplete_core_write_remains_retryable(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             db = Sqlite3Client(os.path.join(tmpdir, "core.sqlite"))
@@ -3489,6 +5360,199 @@ class TestDb(UsesTestexistsFixture, unittest.TestCase):
             self.assertEqual(actual[readable], file_content_sha256(readable))
             self.assertIsNone(actual[missing])
 
+    def test_digest_cache_rehashes_only_files_whose_stat_moved(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_path = os.path.join(tmpdir, DIGEST_CACHE_FILENAME)
+            paths = []
+            for i in range(3):
+                path = os.path.join(tmpdir, f"photo-{i}.jpg")
+                with open(path, "wb") as fh:
+                    fh.write(f"photo-{i}".encode())
+                paths.append(path)
+
+            first_counters = {}
+            first = cached_content_digests_many(
+                paths, cache_path, counters=first_counters
+            )
+            self.assertEqual(
+                {path: pair[0] for path, pair in first.items()},
+                {path: file_content_sha256(path) for path in paths},
+            )
+            self.assertEqual(first_counters["hashed"], 3)
+
+            # Same size, same mtime: only the ctime betrays the rewrite.
+            timestamp = os.stat(paths[0]).st_mtime_ns
+            with open(paths[0], "wb") as fh:
+                fh.write(b"photo-9")
+            os.utime(paths[0], ns=(timestamp, timestamp))
+
+            counters = {}
+            with mock.patch(
+                "index.file_content_digests_many", wraps=file_content_digests_many
+            ) as hashed:
+                second = cached_content_digests_many(
+                    paths, cache_path, counters=counters
+                )
+
+            self.assertEqual(hashed.call_args.args[0], [paths[0]])
+            self.assertEqual(counters["cacheHits"], 2)
+            self.assertEqual(second[paths[0]][0], file_content_sha256(paths[0]))
+            self.assertEqual(second[paths[1]], first[paths[1]])
+
+    def test_verify_digests_rehashes_everything_and_reports_stale_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_path = os.path.join(tmpdir, DIGEST_CACHE_FILENAME)
+            path = os.path.join(tmpdir, "photo.jpg")
+            with open(path, "wb") as fh:
+                fh.write(b"photo")
+            cached_content_digests_many([path], cache_path)
+            con = sqlite3.connect(cache_path)
+            con.execute("UPDATE content_digests SET source_sha256 = 'wrong'")
+            con.commit()
+            con.close()
+
+            trusted = cached_content_digests_many([path], cache_path)
+            counters = {}
+            verified = cached_content_digests_many(
+                [path], cache_path, verify=True, counters=counters
+            )
+            healed = cached_content_digests_many([path], cache_path)
+
+        self.assertEqual(trusted[path][0], "wrong")
+        self.assertEqual(verified[path][0], hashlib.sha256(b"photo").hexdigest())
+        self.assertEqual(counters["staleCacheEntries"], 1)
+        self.assertEqual(healed[path], verified[path])
+
+    def test_source_byte_cache_is_bounded_and_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for name in ["a", "b", "c", "huge"]:
+                path = os.path.join(tmpdir, name)
+                with open(path, "wb") as fh:
+                    fh.write(name.encode() * (40 if name == "huge" else 4))
+                paths.append(path)
+            a, b, c, huge = paths
+
+            cache = SourceByteCache(max_bytes=10)
+            cache.read(a)
+            cache.read(b)
+            cache.read(a)  # b is now the least recently used
+            cache.read(c)
+            self.assertEqual(list(cache.entries), [a, c])
+            self.assertLessEqual(cache.stats()["heldBytes"], 10)
+
+            # Larger than the whole budget: served, never held.
+            self.assertEqual(cache.read(huge), b"huge" * 40)
+            self.assertNotIn(huge, cache.entries)
+
+            cache.retain([c])
+            cache.read(b)
+            self.assertEqual(list(cache.entries), [c])
+            self.assertEqual(
+                cache.stats(),
+                {
+                    "maxBytes": 10,
+                    "heldBytes": 4,
+                    "hits": 1,
+                    "misses": 5,
+                    "evictions": 1,
+                },
+            )
+
+    def test_pixel_digest_ignores_metadata_but_not_orientation(self):
+        with open("../src/test/fixtures/monkey.jpg", "rb") as fh:
+            original = fh.read()
+
+        def with_segment(data, marker, payload):
+            segment = bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2)
+            return data[:2] + segment + payload + data[2:]
+
+        def exif_payload(orientation):
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            return exif.tobytes()
+
+        baseline = jpeg_pixel_sha256(original)
+        self.assertIsNotNone(baseline)
+        self.assertEqual(
+            jpeg_pixel_sha256(with_segment(original, 0xFE, b"edited")), baseline
+        )
+        self.assertEqual(
+            jpeg_pixel_sha256(with_segment(original, 0xE1, exif_payload(1))),
+            baseline,
+        )
+        self.assertEqual(
+            jpeg_pixel_sha256(original + b"trailing camera preview"), baseline
+        )
+        self.assertNotEqual(
+            jpeg_pixel_sha256(with_segment(original, 0xE1, exif_payload(6))),
+            baseline,
+        )
+        self.assertIsNone(jpeg_pixel_sha256(b"\x89PNG\r\n\x1a\n"))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "not-a-jpeg.png")
+            with open(path, "wb") as fh:
+                fh.write(b"\x89PNG\r\n\x1a\n")
+            file_digest, pixel_digest = file_content_digests(path)
+        self.assertEqual(pixel_digest, file_digest)
+
+    def test_derivative_cache_is_bounded_and_remembers_wanted_specs(self):
+        clock = iter(range(1, 100))
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            mock.patch("index.time.time", side_effect=lambda: next(clock)),
+        ):
+            path = os.path.join(tmpdir, "derivatives.sqlite")
+            cache = DerivativeCache(path, max_bytes=10)
+            cache.want("thumb")
+            cache.put("a", {"thumb": b"aaaa"})
+            cache.put("b", {"thumb": b"bbbb"})
+            self.assertEqual(cache.get("a", "thumb"), b"aaaa")  # b is now oldest
+            cache.put("c", {"thumb": b"cccc"})
+            self.assertIsNone(cache.get("b", "thumb"))
+            self.assertEqual(cache.get("c", "thumb"), b"cccc")
+            self.assertEqual(
+                cache.stats(),
+                {
+                    "maxBytes": 10,
+                    "heldBytes": 8,
+                    "hits": 2,
+                    "misses": 1,
+                    "evictions": 1,
+                },
+            )
+            cache.close()
+
+            reopened = DerivativeCache(path, max_bytes=10)
+            self.assertEqual(reopened.wanted, {"thumb"})
+            self.assertEqual(reopened.stats()["heldBytes"], 8)
+            reopened.close()
+
+    def test_load_derivative_decodes_once_for_every_wanted_spec(self):
+        source = "../src/test/fixtures/monkey.jpg"
+        thumb_spec = f"rgb-32x24-r{int(Image.Resampling.BICUBIC)}"
+        self.assertIsNone(load_derivative(source, thumb_spec))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with derivative_cache_at(os.path.join(tmpdir, "d.sqlite")) as cache:
+                cache.want(CAPTION_DERIVATIVE_SPEC)
+                with mock.patch("index.Image.open", wraps=Image.open) as opened:
+                    thumb = load_derivative(source, thumb_spec)
+                    caption = load_derivative(source, CAPTION_DERIVATIVE_SPEC)
+                    self.assertEqual(load_derivative(source, thumb_spec), thumb)
+                self.assertEqual(opened.call_count, 1)
+                self.assertEqual(cache.stats()["hits"], 2)
+            self.assertIsNone(load_derivative(source, thumb_spec))
+
+        with Image.open(source) as raw:
+            self.assertEqual(caption, encode_caption_jpeg(raw))
+            self.assertEqual(
+                thumb,
+                raw.convert("RGB")
+                .resize((32, 24), resample=Image.Resampling.BICUBIC)
+                .tobytes(),
+            )
+
     def test_validate_proves_exact_core_and_caption_coverage(self):
         path = "../src/test/fixtures/monkey.jpg"
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -4326,6 +6390,8 @@ class TestDb(UsesTestexistsFixture, unittest.TestCase):
                         output_json,
                         "--output-md",
                         output_md,
+                        "--result-cache",
+                        os.path.join(tmpdir, "results.sqlite"),
                     ],
                     standalone_mode=False,
                 )